@@ -49,27 +49,47 @@ if "bpy" in locals():
     reload_package(sys.modules[__name__])
 
 import bpy
+from bpy.app.handlers import persistent
 
+# Graphviz is only run, and the modules that run it are only imported, once something is arranged.
 from . import arrange, autodetect, preferences
+from .arrange import arrange_tree
 
 def menu_func(self, _context):
     self.layout.separator()
     self.layout.operator(arrange.GraphvizArrange.bl_idname)
+    self.layout.operator(arrange.GraphvizArrangeModal.bl_idname)
+    self.layout.operator(arrange.GraphvizArrange.bl_idname,
+                         text="Arrange Nodes (Built-in Layout)").layout_engine = 'BUILTIN'
 
 
 classes = (
     arrange.GraphvizArrange,
+    arrange.GraphvizArrangeModal,
     autodetect.GraphvizAutodetect,
     preferences.GraphvizAddonPreferences,
 )
 
+
+@persistent
+def clear_caches_on_load(_dummy):
+    arrange.clear_caches()
+
+
 def register():
     for cls in classes:
         bpy.utils.register_class(cls)
     bpy.types.NODE_MT_node.append(menu_func)
+    bpy.app.handlers.load_post.append(clear_caches_on_load)
 
 
 def unregister():
+    from . import backend, cache
+
+    bpy.app.handlers.load_post.remove(clear_caches_on_load)
+    arrange.clear_caches()
+    backend.shutdown_backends()
+    cache.LAYOUT_CACHE.clear()
     bpy.types.NODE_MT_node.remove(menu_func)
 
     for cls in classes:
@@ -16,303 +16,973 @@
 
 import json
 import os
-import re
-import subprocess
-import tempfile
 from pathlib import Path
 
 import bpy
 
 from .autodetect import GraphvizAutodetect
-from .util import logger, write_line
+from .components import pack_layouts, split_components
+from .frames import FrameHierarchy, absolute_locations, node_parents, relative_locations
+from .instrument import ArrangeStats
+from .parse import EdgeRoute, GraphLayout, parse_layout
+from .preferences import LAYOUT_ENGINES, ArrangeOptions
+from .reroutes import RemovedReroutes, ReroutePool
+from .sizing import NODE_DY, NODE_DYS, NODE_SOCKDY, clear_caches as clear_size_caches, \
+    estimate_node_size, frame_margins, group_node_height, socket_offsets
+from .tuning import choose_layout_settings
+from .util import LRUCache, logger, write_line
 
 DPI = 72.0
 FONT_SIZE = 11
 
-# Units copied from node_update_bases() in node_draw.cc.
-WIDGET_UNIT = 20.0
-NODE_DY = WIDGET_UNIT
-NODE_SOCKDY = 0.1 * WIDGET_UNIT
-NODE_DYS = 0.5 * WIDGET_UNIT
+# Pre-rendered node tables, keyed by everything but the node title. Cleared when a file is loaded.
+ROW_TEMPLATE_CACHE = LRUCache(max_size=1024)
+TITLE_PLACEHOLDER = "\0title\0"
 
-# Regexes.
-EDGE_FROM = re.compile(r"node_(\d+):o(\d+)")
-EDGE_TO = re.compile(r"node_(\d+):i(\d+)")
+# Nodes closer than this many units to where a layout puts them aren't moved.
+MOVE_EPSILON = 0.01
 
+# The dimensions and visible sockets that each group node last had, keyed by node pointer, to tell
+# when its dimensions are older than its sockets. Cleared when a file is loaded.
+GROUP_NODE_SOCKETS = LRUCache(max_size=4096)
 
-def index_of_socket(sockets, query_socket):
-    for index, socket in enumerate(sockets):
-        if socket == query_socket:
-            return index
-    return 0
 
+def clear_caches():
+    ROW_TEMPLATE_CACHE.clear()
+    GROUP_NODE_SOCKETS.clear()
+    clear_size_caches()
 
-class GraphvizArrange(bpy.types.Operator):
-    """Arranges nodes via Graphviz."""
-    bl_idname = "node.graphviz_arrange"
-    bl_label = "Arrange Nodes via Graphviz"
-    bl_options = {'REGISTER', 'UNDO'}
 
-    def invoke(self, context, event):
-        node_editors = [
-            area for area in bpy.context.screen.areas if area.type == 'NODE_EDITOR']
-        if len(node_editors) == 0:
-            self.report({'ERROR'}, "No node editor is open")
-            return {'CANCELLED'}
-        if len(node_editors) > 1:
-            self.report({'ERROR'}, "More than one node editor is open")
-            return {'CANCELLED'}
+def nested_node_trees(node_tree):
+    """node_tree and every node group it uses, directly or not, each once, children first.
 
-        node_editor = node_editors[0]
-        node_space = node_editor.spaces[0]
-        node_tree = node_space.node_tree
-        if node_tree.nodes.active:
-            while node_tree.nodes.active != context.active_node:
-                node_tree = node_tree.nodes.active.node_tree
+    Node groups linked from other files can't be edited, so they are left out.
+    """
+    order, visited = [], {node_tree.as_pointer()}
+    # Depth-first without recursion, as group nesting can be deeper than Python's stack.
+    stack = [(node_tree, iter(node_tree.nodes))]
+    while stack:
+        tree, nodes = stack[-1]
+        for node in nodes:
+            node_group = getattr(node, "node_tree", None)
+            if node_group is None or node_group.library is not None or \
+                    node_group.as_pointer() in visited:
+                continue
+            visited.add(node_group.as_pointer())
+            stack.append((node_group, iter(node_group.nodes)))
+            break
+        else:
+            stack.pop()
+            order.append(tree)
+    return order
 
-        logger().info(node_editor.spaces[0].path.to_string)
 
-        self.remove_passthrough_reroute_nodes(node_tree)
-        try:
-            dot_file = self.write_dot(node_tree)
-        except Exception as e:
-            self.report({'ERROR'}, str(e))
-            return {'CANCELLED'}
+class LinkIndex:
+    """Hash index of a node tree's links.
 
-        try:
-            dot_path = GraphvizAutodetect.require_graphviz(context)
-            if dot_path is not None:
-                self.run_graphviz_and_arrange(node_tree, dot_path, dot_file)
-                if event.shift:
-                    self.show_rendered_graph(dot_path, dot_file)
-        except Exception as e:
-            self.report({'ERROR'}, str(e))
-            return {'CANCELLED'}
-        finally:
-            os.unlink(dot_file.name)
+    Links are keyed by (from node name, from socket index, to node name, to socket index), which is
+    also how edges are named in the DOT file, so both writing the graph and applying Graphviz's
+    edges back onto the tree are O(1) per link.
 
-        return {'FINISHED'}
+    Given a ReroutePool, links through pooled reroutes are indexed as the one link that they
+    carry, with no link object but a RerouteChain in chains, and every key is sorted so that the
+    graph is written the same way whichever links have reroutes.
+    """
 
-    def remove_passthrough_reroute_nodes(self, node_tree):
-        nodes_to_remove = set()
+    def __init__(self, node_tree, pool=None):
+        self.node_tree = node_tree
+        self.socket_indices = {}
+        self.links = {}
+        self.chains = {}
 
-        reroute_nodes = {}
+        for node in node_tree.nodes:
+            self.add_node(node)
+        if pool is None:
+            for link in node_tree.links:
+                self.links[self.key_of(link)] = link
+            return
+
+        for link in node_tree.links:
+            if link.from_node.name not in pool.names and link.to_node.name not in pool.names:
+                self.links[self.key_of(link)] = link
+        for chain in pool.chains:
+            key = (chain.links[0].from_node.name, self.socket_index(chain.from_socket),
+                   chain.links[-1].to_node.name, self.socket_index(chain.to_socket))
+            self.chains[key] = chain
+            self.links[key] = None
+        self.links = dict(sorted(self.links.items(), key=lambda item: item[0]))
+
+    def add_node(self, node):
+        for index, socket in enumerate(node.outputs):
+            self.socket_indices[socket.as_pointer()] = index
+        for index, socket in enumerate(node.inputs):
+            self.socket_indices[socket.as_pointer()] = index
+
+    def socket_index(self, socket):
+        return self.socket_indices.get(socket.as_pointer(), 0)
+
+    def key_of(self, link):
+        return (link.from_node.name, self.socket_index(link.from_socket),
+                link.to_node.name, self.socket_index(link.to_socket))
+
+    def new(self, from_socket, to_socket):
+        link = self.node_tree.links.new(from_socket, to_socket)
+        self.links[self.key_of(link)] = link
+        return link
+
+    def remove(self, key):
+        link = self.links.pop(key, None)
+        if link is not None:
+            self.node_tree.links.remove(link)
+        return link
+
+
+class ArrangePlan:
+    """Everything one arrange run needs to carry from writing the graph to applying its layout.
+
+    jobs lists the parts of the graph laid out separately, as (node indices, link keys) pairs, and
+    dot_texts holds the DOT for each of them. settings says how they are laid out. preview is
+    the GraphPreview to render along with the layout, if any. pool holds the reroutes to reuse,
+    if reuse_reroutes is on. native_routing says that dot only places the nodes, and that the
+    reroutes are placed by routing.route_edges. frames is the FrameHierarchy whose current level
+    the jobs are, if frames are laid out separately. metrics scores the whole tree once the
+    layout is applied, if measure_layout is on. removed_reroutes records the reroutes cleaned up
+    before the layout, to put them back if it is never applied.
+    """
+
+    def __init__(self, node_tree, link_index, pool=None):
+        self.node_tree = node_tree
+        self.link_index = link_index
+        self.all_nodes = list(node_tree.nodes)
+        self.link_keys = list(link_index.links)
+        self.node_name_to_index = {node.name: node_index
+                                   for node_index, node in enumerate(self.all_nodes)}
+        self.pool = pool
+        # Pooled reroutes stay in the tree, but aren't laid out.
+        self.pooled = set() if pool is None else {self.node_name_to_index[name]
+                                                  for name in pool.names}
+        self.relayout = None
+        self.jobs = []
+        self.dot_texts = []
+        self.settings = None
+        self.preview = None
+        self.native_routing = False
+        self.graph_options = None
+        self.frames = None
+        self.metrics = None
+        self.removed_reroutes = None
+
+    def node_index(self, node_name):
+        return self.node_name_to_index[node_name]
+
+
+class Arranger:
+    """Lays out a node tree with Graphviz. This is everything the operators do apart from finding
+    the tree to arrange, so it can run without a node editor, for example from scripts."""
+
+    def __init__(self, options):
+        self.options = options
+        # 'AUTO', 'GRAPHVIZ' or 'BUILTIN'; the operators switch to the built-in engine if dot is
+        # missing.
+        self.layout_engine = options.layout_engine
+        self.stats = ArrangeStats(options.collect_stats, options.profile_path)
+        # The GraphvizInfo of the dot laid out with, set by whoever found it.
+        self.graphviz = None
+        # A GraphPreview of the tree being arranged, if one was asked for.
+        self.preview = None
+
+    def arrange(self, node_tree, layout_backend):
+        """Lays out node_tree, and first every node group in it if include_node_groups is set.
+        Returns the plan for node_tree itself. layout_backend isn't used by the built-in engine."""
+        self.stats.start_profile()
+        try:
+            for nested_tree in self.node_trees_to_arrange(node_tree):
+                plan = self.prepare_graph(nested_tree, with_preview=nested_tree is node_tree)
+                layouts = self.lay_out(plan, layout_backend)
+                # Frames laid out separately take a stage per level of nesting.
+                while self.next_stage(plan, layouts):
+                    layouts = self.lay_out(plan, layout_backend)
+                self.finish_arrange(plan, layouts)
+        finally:
+            self.stats.stop_profile()
+        return plan
+
+    def node_trees_to_arrange(self, node_tree):
+        if not self.options.include_node_groups:
+            return [node_tree]
+        return nested_node_trees(node_tree)
+
+    def prepare_graph(self, node_tree, with_preview=False):
+        """Cleans up reroutes and writes the graphs to lay out, returning an ArrangePlan.
+        with_preview renders self.preview, if set, along with this tree's layout."""
+        removed_reroutes = RemovedReroutes()
+        with self.stats.phase("reroute_cleanup"):
+            pool = self.remove_passthrough_reroute_nodes(node_tree, removed_reroutes)
+        preview = self.preview if with_preview else None
+        with self.stats.phase("plan"):
+            # The preview is of the whole tree, so it is laid out in one piece.
+            plan = self.plan_jobs(node_tree, pool, split=preview is None)
+        plan.preview = preview
+        plan.removed_reroutes = removed_reroutes
+        self.stats.count("trees")
+        self.stats.count("nodes", len(plan.all_nodes) - len(plan.pooled))
+        self.stats.count("links", len(plan.link_keys))
+        self.plan_layout(plan)
+
+        if self.options.copy_to_clipboard and plan.dot_texts:
+            bpy.context.window_manager.clipboard = "\n".join(plan.dot_texts)
+
+        return plan
+
+    def plan_layout(self, plan):
+        """Chooses the layout settings for the jobs of a plan, and writes their DOT."""
+        if plan.frames is not None:
+            node_count = sum(len(members) for members in plan.frames.members.values())
+            link_count = sum(len(links) for links in plan.frames.links.values())
+            self.stats.count("frames", len(plan.frames.members) - 1)
+        else:
+            node_count = sum(len(node_indices) for node_indices, _ in plan.jobs)
+            link_count = sum(len(link_keys) for _, link_keys in plan.jobs)
+        plan.settings = choose_layout_settings(node_count,
+                                               link_count,
+                                               self.layout_engine,
+                                               self.options.quality_preset,
+                                               self.options.time_budget,
+                                               self.graphviz.layouts if self.graphviz else None)
+        logger().info("Layout settings: " + plan.settings.describe())
+
+        # The built-in engine reads the tree directly, so there is no DOT to write.
+        if plan.settings.program != "builtin":
+            plan.graph_options = plan.settings.graph_options
+            # Modes that turn splines off already want straight links, and previews want dot's.
+            plan.native_routing = self.options.native_routing and plan.preview is None and \
+                "splines" not in plan.graph_options
+            if plan.native_routing:
+                plan.graph_options = dict(plan.graph_options, splines="false")
+            self.write_dot_texts(plan)
+
+    def write_dot_texts(self, plan):
+        """Writes the DOT of every job of a plan."""
+        frame_sizes = plan.frames.sizes if plan.frames is not None else None
+        with self.stats.phase("write_dot"):
+            # Previews are rendered from the same DOT, so only they need it styled.
+            plan.dot_texts = [self.write_dot(plan.all_nodes, link_keys, node_indices,
+                                             plan.graph_options,
+                                             styled=plan.preview is not None,
+                                             frame_sizes=frame_sizes)
+                              for node_indices, link_keys in plan.jobs]
+        if self.stats.enabled:
+            self.stats.count("dot_bytes", sum(len(dot_text.encode())
+                                              for dot_text in plan.dot_texts))
+
+    def next_stage(self, plan, layouts):
+        """Moves a plan that lays out frames separately on to its next level, given the layouts
+        of the current one. An incremental plan whose changed nodes would land on top of the
+        others goes on to lay out the whole tree instead. Returns False once there is nothing left
+        to lay out."""
+        if plan.relayout is not None:
+            if not self.relayout_overlaps(plan, self.merged_layout(plan, layouts)):
+                return False
+            logger().info("The changed nodes would overlap the others, laying out everything")
+            self.stats.count("incremental_fallbacks")
+            plan.relayout = None
+            self.split_jobs(plan, split=plan.preview is None)
+            self.plan_layout(plan)
+            return True
+
+        frames = plan.frames
+        if frames is None or frames.done:
+            return False
+        margins = {}
+        for frame_index in frames.levels[frames.stage]:
+            side, top = frame_margins(plan.all_nodes[frame_index])
+            margins[frame_index] = (side / DPI, top / DPI)
+        frames.store(layouts, margins)
+        frames.stage += 1
+        plan.jobs = frames.jobs()
+        if plan.settings.program != "builtin":
+            self.write_dot_texts(plan)
+        return True
+
+    def plan_jobs(self, node_tree, pool=None, split=True):
+        """Indexes the tree and splits it into the parts to lay out, unless split is False."""
+        from .incremental import IncrementalLayout, load_state
+
+        plan = ArrangePlan(node_tree, LinkIndex(node_tree, pool), pool)
+
+        if self.options.incremental:
+            plan.relayout = IncrementalLayout.plan(node_tree,
+                                                   plan.all_nodes,
+                                                   self.node_signatures(plan.all_nodes),
+                                                   plan.link_keys,
+                                                   load_state(node_tree),
+                                                   DPI,
+                                                   skipped=plan.pooled)
+
+        if plan.relayout is not None:
+            # The changed region is laid out in one piece, as it is anchored to its neighbors as
+            # a whole.
+            if plan.relayout.subset:
+                subset = plan.relayout.subset
+                plan.jobs = [(sorted(subset), [link_key for link_key in plan.link_keys
+                                               if plan.node_index(link_key[0]) in subset and
+                                               plan.node_index(link_key[2]) in subset])]
+        else:
+            self.split_jobs(plan, split)
+        return plan
+
+    def split_jobs(self, plan, split=True):
+        """Splits the whole tree of a plan into the parts to lay out, unless split is False."""
+        if self.options.arrange_frames and split and \
+                any(node.bl_idname == "NodeFrame" for node in plan.all_nodes):
+            plan.frames = FrameHierarchy(plan.all_nodes, plan.link_keys, skipped=plan.pooled)
+            plan.jobs = plan.frames.jobs()
+        elif self.options.split_components and split:
+            plan.jobs = split_components(plan.all_nodes, plan.link_keys, skipped=plan.pooled)
+        elif plan.pooled:
+            plan.jobs = [([node_index for node_index in range(len(plan.all_nodes))
+                           if node_index not in plan.pooled], plan.link_keys)]
+        else:
+            plan.jobs = [(range(len(plan.all_nodes)), plan.link_keys)]
+
+    def node_signatures(self, all_nodes):
+        from .incremental import node_signature
+
+        return [node_signature(node, self.visible_sockets(node)) for node in all_nodes]
+
+    def remove_passthrough_reroute_nodes(self, node_tree, removed=None):
+        """Removes reroutes that just pass one link along, which is what earlier arranges leave
+        behind, and links whatever the chains connected directly. With collapse_fanout_reroutes,
+        reroutes that split a link into several go too. What was changed is recorded in removed,
+        a RemovedReroutes, if given.
+
+        With reuse_reroutes, unbranched chains are kept instead, and returned as a ReroutePool for
+        the layout to reuse. Otherwise returns None.
+
+        Every link is looked at once, and each chain is followed once however many links it feeds.
+        """
+        reroutes, in_links, out_links = {}, {}, {}
         for node in node_tree.nodes:
             if node.bl_idname == "NodeReroute":
-                reroute_nodes[node.name] = {
-                    "node": node,
-                    "from": [],
-                    "to": [],
-                }
+                reroutes[node.name] = node
+                in_links[node.name] = []
+                out_links[node.name] = []
+        # Even with nothing to reuse, links are indexed as for a pool, so that the next arrange
+        # writes the same graph.
+        pool = ReroutePool() if self.options.reuse_reroutes else None
+        if not in_links:
+            return pool
 
-        # Build doubly-linked list.
         for link in node_tree.links:
-            logger().info(link.from_node.name + " -> " + link.to_node.name)
-            if link.to_node.name in reroute_nodes:
-                reroute_nodes[link.to_node.name]["from"].append(
-                    {"link": link, "socket": link.from_socket, "node": link.from_node})
-            if link.from_node.name in reroute_nodes:
-                reroute_nodes[link.from_node.name]["to"].append(
-                    {"link": link, "socket": link.to_socket, "node": link.to_node})
-
-        logger().info(repr(reroute_nodes))
-
-        for info in reroute_nodes.values():
-            from_count, to_count = len(info["from"]), len(info["to"])
-            if from_count > 1 or to_count > 1 or (from_count == 0 and to_count == 0):
+            if link.to_node.name in in_links:
+                in_links[link.to_node.name].append(link)
+            if link.from_node.name in out_links:
+                out_links[link.from_node.name].append(link)
+
+        max_outputs = float("inf") if self.options.collapse_fanout_reroutes else 1
+        # Kept in node order, so that links are recreated in the same order every time.
+        removable = {name: None for name in in_links
+                     if len(in_links[name]) <= 1 and len(out_links[name]) <= max_outputs and
+                     (in_links[name] or out_links[name])}
+        if pool is not None:
+            pool = ReroutePool.collect(removable, in_links, out_links)
+            for name in pool.names:
+                del removable[name]
+        if not removable:
+            return pool
+
+        # The socket that feeds each removable reroute, found by walking its chain upstream once.
+        # None if the chain starts from nothing.
+        sources = {}
+
+        def source_of(reroute_name):
+            chain = []
+            while reroute_name in removable and reroute_name not in sources:
+                chain.append(reroute_name)
+                # Marks the chain as being walked, which also stops at invalid reroute loops.
+                sources[reroute_name] = None
+                links = in_links[reroute_name]
+                if not links:
+                    break
+                if links[0].from_node.name not in removable:
+                    sources[reroute_name] = links[0].from_socket
+                    break
+                reroute_name = links[0].from_node.name
+            source = sources.get(reroute_name)
+            for name in chain:
+                sources[name] = source
+            return source
+
+        new_links = []
+        for name in removable:
+            for link in out_links[name]:
+                if link.to_node.name in removable:
+                    continue
+                source = source_of(name)
+                if source is not None:
+                    new_links.append((source, link.to_socket))
+
+        if removed is not None:
+            removed_links = {}
+            for name in removable:
+                for link in in_links[name] + out_links[name]:
+                    removed_links[link.as_pointer()] = link
+            removed.record([reroutes[name] for name in removable], removed_links.values())
+
+        # Removing a node removes its links along with it.
+        for name in removable:
+            node_tree.nodes.remove(reroutes[name])
+        for from_socket, to_socket in new_links:
+            link = node_tree.links.new(from_socket, to_socket)
+            if removed is not None:
+                removed.new_links.append(link)
+
+        self.stats.count("reroutes_removed", len(removable))
+        logger().debug("Removed %d reroute nodes" % len(removable))
+        return pool
+
+    def lay_out(self, plan, layout_backend):
+        """Lays out every job of the current stage of a plan."""
+        if plan.settings.program == "builtin":
+            return self.builtin_layouts(plan)
+        return self.graphviz_layouts(plan, layout_backend)
+
+    def graphviz_layouts(self, plan, layout_backend):
+        from .backend import render_all
+
+        keys, layouts = self.cached_layouts(plan)
+        missing = [job_index for job_index, layout in enumerate(layouts) if layout is None]
+        with self.stats.phase("layout"):
+            outputs = render_all(layout_backend,
+                                 [plan.dot_texts[job_index] for job_index in missing],
+                                 self.options.layout_format,
+                                 plan.preview.outputs() if plan.preview is not None else (),
+                                 self.options.timeout or None)
+        if plan.preview is not None and outputs:
+            plan.preview.rendered = True
+        for job_index, graphviz_output in zip(missing, outputs):
+            layouts[job_index] = self.parse_graphviz_output(plan, graphviz_output.decode(),
+                                                            keys[job_index])
+        return layouts
+
+    def builtin_layouts(self, plan):
+        """Lays out every job of a plan with the built-in engine, from the same node sizes and
+        socket positions that would be written to DOT."""
+        from .layered import layered_layout
+
+        node_scale = self.node_scale(plan.all_nodes)
+        frame_sizes = plan.frames.sizes if plan.frames is not None else {}
+        layouts = []
+        for node_indices, link_keys in plan.jobs:
+            sizes, offsets = [], {}
+            for node_index in node_indices:
+                node = plan.all_nodes[node_index]
+                if node_index in frame_sizes:
+                    # Links to a laid-out frame are drawn to its middle.
+                    sizes.append(frame_sizes[node_index])
+                    offsets[node_index] = (frame_sizes[node_index][1] * DPI, {}, {})
+                    continue
+                width, height = self.node_size(node, node_scale)
+                sizes.append((width / DPI, height / DPI))
+                offsets[node_index] = (height,) + socket_offsets(*self.visible_sockets(node),
+                                                                 height)
+
+            edges, ports = [], []
+            for from_node_name, from_socket_index, to_node_name, to_socket_index in link_keys:
+                from_index, to_index = plan.node_index(from_node_name), plan.node_index(to_node_name)
+                if from_index not in offsets or to_index not in offsets:
+                    continue
+                from_height, output_offsets, _ = offsets[from_index]
+                to_height, _, input_offsets = offsets[to_index]
+                edges.append((from_index, from_socket_index, to_index, to_socket_index))
+                # Links to hidden sockets are drawn to the middle of the node.
+                ports.append((output_offsets.get(from_socket_index, from_height * 0.5) / DPI,
+                              input_offsets.get(to_socket_index, to_height * 0.5) / DPI))
+
+            with self.stats.phase("layout"):
+                layouts.append(layered_layout(list(node_indices), sizes, edges, ports,
+                                              self.options.node_sep / DPI,
+                                              self.options.rank_sep / DPI))
+        return layouts
+
+    def finish_arrange(self, plan, layouts):
+        if plan.frames is not None:
+            plan.frames.store(layouts, {})
+            layout = plan.frames.compose()
+        else:
+            layout = self.merged_layout(plan, layouts)
+        leftover_reroutes = []
+        with self.stats.phase("apply"):
+            if plan.pool is not None:
+                leftover_reroutes = self.apply_layout_reusing_reroutes(plan, layout)
+            else:
+                self.apply_layout(plan.node_tree, plan.link_index, layout)
+
+        if self.options.incremental:
+            from .incremental import save_state
+
+            with self.stats.phase("save_state"):
+                save_state(plan.node_tree, plan.all_nodes, self.node_signatures(plan.all_nodes),
+                           plan.link_keys, layout, DPI)
+
+        # Only removed now, as that shifts the node indices that the state is saved by.
+        with self.stats.phase("apply"):
+            for reroute_node in leftover_reroutes:
+                plan.node_tree.nodes.remove(reroute_node)
+        self.stats.count("reroutes_removed", len(leftover_reroutes))
+
+        if self.options.measure_layout:
+            with self.stats.phase("metrics"):
+                self.measure(plan)
+
+    def merged_layout(self, plan, layouts):
+        """Combines the layouts of a plan's jobs into one, of the whole tree if it's incremental."""
+        layout = pack_layouts(layouts, self.options.rank_sep / DPI) if layouts else GraphLayout()
+        if plan.relayout is not None:
+            layout = plan.relayout.merge(layout, DPI, self.options.rank_sep)
+        return layout
+
+    def relayout_overlaps(self, plan, layout):
+        """Whether the nodes that an incremental layout moves would overlap the others."""
+        node_scale = self.node_scale(plan.all_nodes)
+        sizes = {node_index: self.node_size(plan.all_nodes[node_index], node_scale)
+                 for node_index in plan.relayout.still_nodes()}
+        return plan.relayout.overlaps(layout, sizes, DPI)
+
+    def measure(self, plan):
+        """Scores the tree of a plan as the arrange left it, in node units, and logs the scores.
+        The whole tree is measured, so that nodes an incremental arrange left alone and links
+        between frames count too."""
+        from .metrics import measure_layout
+
+        all_nodes, layout = self.tree_layout(plan.node_tree)
+        plan.metrics = measure_layout(layout, *self.edge_ports(all_nodes, layout), scale=DPI)
+        logger("metrics").info(plan.metrics.describe(),
+                               extra={"layout_metrics": plan.metrics.as_dict()})
+
+    def tree_layout(self, node_tree):
+        """Reads a GraphLayout back from where the nodes of a tree are, with every link that runs
+        through reroutes as one edge with a waypoint per reroute. Returns the tree's nodes, which
+        the layout's node indices refer to, and the layout."""
+        all_nodes = list(node_tree.nodes)
+        locations = [0.0] * (len(all_nodes) * 2)
+        node_tree.nodes.foreach_get("location", locations)
+        parents = node_parents(all_nodes)
+        if parents is not None:
+            locations = absolute_locations(all_nodes, locations, parents)
+        node_indices = {node.name: node_index for node_index, node in enumerate(all_nodes)}
+        out_links = {}
+        for link in node_tree.links:
+            out_links.setdefault(link.from_node.name, []).append(link)
+
+        layout = GraphLayout()
+        # Only the sockets of the nodes that edges run between need indexing, not the reroutes'.
+        socket_indices = {}
+        node_scale = self.node_scale(all_nodes)
+        for node_index, node in enumerate(all_nodes):
+            if node.bl_idname in ("NodeReroute", "NodeFrame"):
                 continue
-
-            from_socket, to_socket = None, None
-            from_node, to_node = None, None
-
-            for edge in info["from"]:
-                from_socket = edge["socket"]
-                from_node = edge["node"]
-                node_tree.links.remove(edge["link"])
-                if edge["node"].name in reroute_nodes:
-                    reroute_nodes[edge["node"].name]["to"] = [
-                        e for e in reroute_nodes[edge["node"].name]["to"] if
-                        e["node"] != info["node"]]
-
-            for edge in info["to"]:
-                to_socket = edge["socket"]
-                to_node = edge["node"]
-                node_tree.links.remove(edge["link"])
-                if edge["node"].name in reroute_nodes:
-                    reroute_nodes[edge["node"].name]["from"] = [
-                        e for e in reroute_nodes[edge["node"].name]["from"] if
-                        e["node"] != info["node"]]
-
-            if from_socket is not None and to_socket is not None:
-                new_link = node_tree.links.new(from_socket, to_socket)
-                for edge in info["from"]:
-                    if edge["node"].name in reroute_nodes:
-                        reroute_nodes[edge["node"].name]["to"].append(
-                            {"link": new_link, "socket": to_socket, "node": to_node})
-                for edge in info["to"]:
-                    if edge["node"].name in reroute_nodes:
-                        reroute_nodes[edge["node"].name]["from"].append(
-                            {"link": new_link, "socket": from_socket, "node": from_node})
-
-            nodes_to_remove.add(info["node"].name)
-
-        for node in list(node_tree.nodes):
-            if node.name in nodes_to_remove:
-                node_tree.nodes.remove(node)
-
-    def run_graphviz_and_arrange(self, node_tree, dot_path, dot_file):
-        result = subprocess.run(
-            [dot_path, "-Tplain-ext", dot_file.name], capture_output=True, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(result.stderr)
-
-        graphviz_output = result.stdout
+            for sockets in (node.outputs, node.inputs):
+                for socket_index, socket in enumerate(sockets):
+                    socket_indices[socket.as_pointer()] = socket_index
+            width, height = self.node_size(node, node_scale)
+            layout.nodes[node_index] = ((locations[node_index * 2] + width * 0.5) / DPI,
+                                        (locations[node_index * 2 + 1] - height * 0.5) / DPI,
+                                        width / DPI, height / DPI)
+
+        for from_index in layout.nodes:
+            # Follow each link through its reroutes, and their branches, to the nodes it feeds.
+            pending = [(link, []) for link in out_links.get(all_nodes[from_index].name, ())]
+            while pending:
+                link, waypoints = pending.pop()
+                to_index = node_indices[link.to_node.name]
+                if to_index in layout.nodes:
+                    layout.edges.append(EdgeRoute(from_index,
+                                                  socket_indices.get(link.from_socket.as_pointer(), 0),
+                                                  to_index,
+                                                  socket_indices[link.to_socket.as_pointer()],
+                                                  waypoints))
+                elif link.to_node.bl_idname == "NodeReroute" and len(waypoints) < len(all_nodes):
+                    waypoint = (locations[to_index * 2] / DPI, locations[to_index * 2 + 1] / DPI)
+                    pending += [(next_link, waypoints + [waypoint])
+                                for next_link in out_links.get(link.to_node.name, ())]
+        return all_nodes, layout
+
+    def cached_layouts(self, plan):
+        """The cache keys and cached layouts of a plan's graphs. With a preview nothing is looked
+        up, as it needs dot to run anyway."""
+        keys, layouts = [], []
+        with self.stats.phase("cache_lookup"):
+            for dot_text in plan.dot_texts:
+                if plan.preview is None:
+                    key, layout = self.cached_layout(dot_text)
+                else:
+                    key, layout = self.layout_key(dot_text), None
+                keys.append(key)
+                layouts.append(layout)
+        self.stats.count("cached_layouts", sum(1 for layout in layouts if layout is not None))
+        return keys, layouts
+
+    def cached_layout(self, dot_text):
+        """Returns the cache key for the graph and its layout, if an identical graph has already
+        been laid out. The key is None if caching is turned off."""
+        key = self.layout_key(dot_text)
+        if key is None:
+            return None, None
+        from .cache import LAYOUT_CACHE
+
+        return key, LAYOUT_CACHE.get(key)
+
+    def layout_key(self, dot_text):
+        if not self.options.use_layout_cache:
+            return None
+        from .cache import LAYOUT_CACHE, cache_directory, layout_key
+
+        LAYOUT_CACHE.set_directory(
+            cache_directory() if self.options.persist_layout_cache else None)
+        # Other Graphviz versions may lay the same graph out differently.
+        return layout_key(dot_text, self.graphviz.version if self.graphviz is not None else "")
+
+    def parse_graphviz_output(self, plan, graphviz_output, key):
         logger("gv_output").debug(graphviz_output)
-
-        all_nodes = list(node_tree.nodes)
-
-        for line in graphviz_output.splitlines():
-            # FIXME: support quoted strings
-            fields = line.split()
-            match fields[0]:
-                case "node":
-                    graphviz_node_id = fields[1]
-                    node_index = int(
-                        graphviz_node_id[(graphviz_node_id.find('_') + 1):])
+        with self.stats.phase("parse"):
+            layout = parse_layout(graphviz_output, self.options.layout_format)
+        if plan.native_routing:
+            with self.stats.phase("route"):
+                self.route_edges(plan, layout)
+        if key is not None:
+            from .cache import LAYOUT_CACHE
+
+            LAYOUT_CACHE.put(key, layout)
+        return layout
+
+    def route_edges(self, plan, layout):
+        """Places the reroutes of a layout that dot ran without splines, from the same socket
+        positions that were written to DOT."""
+        from .routing import route_edges
+
+        tail_ports, head_ports = self.edge_ports(plan.all_nodes, layout)
+        route_edges(layout, tail_ports, head_ports, self.options.node_sep / DPI * 0.5)
+        self.stats.count("routed_reroutes", sum(len(edge.waypoints) for edge in layout.edges))
+
+    def edge_ports(self, all_nodes, layout):
+        """Where each edge of a layout of all_nodes leaves its first node and enters its second,
+        in inches down from the top of the node."""
+        offsets = {}
+        tail_ports, head_ports = [], []
+        for edge in layout.edges:
+            for node_index in (edge.from_node, edge.to_node):
+                if node_index not in offsets and node_index in layout.nodes:
+                    height = layout.nodes[node_index][3] * DPI
                     node = all_nodes[node_index]
-                    node.location.x = (
-                        float(fields[2]) - float(fields[4]) * 0.5) * DPI
-                    node.location.y = (
-                        float(fields[3]) + float(fields[5]) * 0.5) * DPI
-
-                case "edge":
-                    (from_node_index, from_socket) = EDGE_FROM.match(
-                        fields[1]).groups()
-                    (to_node_index, to_socket) = EDGE_TO.match(
-                        fields[2]).groups()
-
-                    from_node = all_nodes[int(from_node_index)]
-                    to_node = all_nodes[int(to_node_index)]
-                    from_socket = int(from_socket)
-                    to_socket = int(to_socket)
-
-                    control_point_count = int(fields[3])
-                    if control_point_count == 4:
-                        continue
-
-                    # FIXME: O(n)
-                    for link in node_tree.links:
-                        if link.from_node == from_node and \
-                            link.from_socket == from_node.outputs[from_socket] and \
-                                link.to_node == to_node and \
-                                link.to_socket == to_node.inputs[to_socket]:
-                            node_tree.links.remove(link)
-                            break
-
-                    last_node, last_socket = from_node, from_socket
-                    control_point_index = 2
-
-                    while control_point_index < control_point_count - 2:
-                        x_pos = float(fields[4 + control_point_index * 2 + 0])
-                        y_pos = float(fields[4 + control_point_index * 2 + 1])
-
-                        reroute_node = node_tree.nodes.new("NodeReroute")
-                        reroute_node.location = (x_pos * DPI, y_pos * DPI)
-
-                        node_tree.links.new(
-                            last_node.outputs[last_socket], reroute_node.inputs[0])
-
-                        last_node = reroute_node
-                        last_socket = 0
-                        control_point_index += 3
-
-                    # Connect last.
-                    node_tree.links.new(
-                        last_node.outputs[last_socket], to_node.inputs[to_socket])
-
-    def show_rendered_graph(self, dot_path, dot_file):
-        pdf_file = tempfile.NamedTemporaryFile(
-            mode="w+", delete=False, suffix=".pdf")
-
-        result = subprocess.run(
-            [dot_path, "-Tpdf", dot_file.name], stdout=pdf_file)
-        if result.returncode != 0:
-            raise RuntimeError(result.stderr)
-
-        pdf_file.flush()
-        pdf_file.close()
-
-        # TODO: Non-Windows
-        os.startfile(pdf_file.name)
-
-    def write_dot(self, node_tree):
-        theme = bpy.context.preferences.themes[0]
-
-        dot_file = tempfile.NamedTemporaryFile(
-            mode="w+", delete=False, suffix=".dot")
-
-        try:
-            write_line("digraph G {", dot_file)
-            self.write_dot_options(dot_file)
-
-            node_scale = float(node_tree.nodes[0].width) / \
-                float(node_tree.nodes[0].dimensions[0])
-            print("node_scale=" + str(node_scale))
-
-            node_name_to_index = dict()
-            for node_index, node in enumerate(node_tree.nodes):
-                node_name_to_index[node.name] = node_index
-                graphviz_node_width = float(node.dimensions[0] * node_scale)
-                graphviz_node_height = float(node.dimensions[1] * node_scale)
-                header_scale = (float(NODE_DY) + float(NODE_DYS) /
-                                2.0) / graphviz_node_height
-                formatted_options = self.format_graphviz_options({
-                    "width": graphviz_node_width / DPI,
-                    "height": graphviz_node_height / DPI,
-                    "fillcolor": "%s;%f:%s" % (
-                        self.blender_rgb_to_dot(
-                            theme.node_editor.input_node),
-                        header_scale,
-                        self.blender_rgba_to_dot(
-                            theme.node_editor.node_backdrop)
-                    )
-                })
-                write_line("node_%d [%s, label=" %
-                           (node_index, formatted_options), dot_file)
-                write_line(
-                    "<<table border=\"0\" cellborder=\"0\" cellpadding=\"0\" cellspacing=\"0\">",
-                    dot_file)
-                self.write_dot_rows(node, graphviz_node_width, graphviz_node_height,
-                                    dot_file)
-                write_line("</table>>]", dot_file)
-
-            for link in node_tree.links:
-                # Find which index each socket is.
-                from_socket_index = index_of_socket(
-                    link.from_node.outputs, link.from_socket)
-                to_socket_index = index_of_socket(
-                    link.to_node.inputs, link.to_socket)
-
-                write_line("node_%d:o%d -> node_%d:i%d [%s];" % (
-                    node_name_to_index[link.from_node.name],
-                    from_socket_index,
-                    node_name_to_index[link.to_node.name],
-                    to_socket_index,
-                    self.format_graphviz_options({})), dot_file)
-
-            write_line("}", dot_file)
-            dot_file.flush()
-        except:
-            dot_file.close()
-            os.unlink(dot_file.name)
-            raise
+                    offsets[node_index] = (height,) + socket_offsets(*self.visible_sockets(node),
+                                                                     height)
+            from_height, output_offsets, _ = offsets.get(edge.from_node, (0.0, {}, {}))
+            to_height, _, input_offsets = offsets.get(edge.to_node, (0.0, {}, {}))
+            # Links to hidden sockets are drawn to the middle of the node.
+            tail_ports.append(output_offsets.get(edge.from_socket, from_height * 0.5) / DPI)
+            head_ports.append(input_offsets.get(edge.to_socket, to_height * 0.5) / DPI)
+        return tail_ports, head_ports
+
+    def apply_layout(self, node_tree, link_index, layout):
+        nodes = node_tree.nodes
+        all_nodes = list(nodes)
+
+        # Work out every location first, so that they can all be written with one RNA call.
+        locations = [0.0] * (len(all_nodes) * 2)
+        nodes.foreach_get("location", locations)
+        # Layouts are of the whole editor, but nodes in frames are placed relative to their frame.
+        parents = node_parents(all_nodes)
+        if parents is not None:
+            locations = absolute_locations(all_nodes, locations, parents)
+        for node_index, (x, y, width, height) in layout.nodes.items():
+            locations[node_index * 2 + 0] = (x - width * 0.5) * DPI
+            locations[node_index * 2 + 1] = (y + height * 0.5) * DPI
+        if parents is not None:
+            locations = relative_locations(all_nodes, locations, parents)
+
+        routed_edges = [edge for edge in layout.edges if edge.waypoints]
+        reroute_count = 0
+        for edge in routed_edges:
+            reroute_count += len(edge.waypoints)
+            for x_pos, y_pos in edge.waypoints:
+                locations += (x_pos * DPI, y_pos * DPI)
+
+        # New nodes are appended to the collection, so they line up with the locations above.
+        reroute_nodes = [nodes.new("NodeReroute") for _ in range(reroute_count)]
+        self.stats.count("reroutes_created", reroute_count)
+        nodes.foreach_set("location", locations)
+
+        # Wire up the reroutes in the same order that their locations were listed.
+        reroute_nodes = iter(reroute_nodes)
+        for edge in routed_edges:
+            from_node = all_nodes[edge.from_node]
+            to_node = all_nodes[edge.to_node]
+
+            link_index.remove(
+                (from_node.name, edge.from_socket, to_node.name, edge.to_socket))
+
+            last_node, last_socket = from_node, edge.from_socket
+            for _ in edge.waypoints:
+                reroute_node = next(reroute_nodes)
+                link_index.add_node(reroute_node)
+
+                link_index.new(
+                    last_node.outputs[last_socket], reroute_node.inputs[0])
+
+                last_node = reroute_node
+                last_socket = 0
+
+            # Connect last.
+            link_index.new(
+                last_node.outputs[last_socket], to_node.inputs[edge.to_socket])
+
+    def apply_layout_reusing_reroutes(self, plan, layout):
+        """Applies a layout by changing only what differs from the tree. Nodes are only moved if
+        they aren't where the layout puts them already, and a link is only rewired if it now runs
+        through a different number of reroutes. Reroutes come from plan.pool first, and are only
+        created once it runs out. Returns the pooled reroutes left over, for the caller to
+        remove."""
+        nodes, links = plan.node_tree.nodes, plan.node_tree.links
+        all_nodes = plan.all_nodes
+
+        locations = [0.0] * (len(all_nodes) * 2)
+        nodes.foreach_get("location", locations)
+        parents = node_parents(all_nodes)
+        targets = list(locations) if parents is None else \
+            absolute_locations(all_nodes, locations, parents)
+        for node_index, (x, y, width, height) in layout.nodes.items():
+            targets[node_index * 2 + 0] = (x - width * 0.5) * DPI
+            targets[node_index * 2 + 1] = (y + height * 0.5) * DPI
+
+        routes = {}
+        for edge in layout.edges:
+            if edge.waypoints:
+                routes[(all_nodes[edge.from_node].name, edge.from_socket,
+                        all_nodes[edge.to_node].name, edge.to_socket)] = edge.waypoints
+
+        # Chains that need a different number of reroutes give theirs up before any are reused.
+        for link in plan.pool.spare_links:
+            links.remove(link)
+        spare = [plan.node_index(name) for name in plan.pool.spare]
+        rewired = []
+        for key, chain in plan.link_index.chains.items():
+            reroute_indices = [plan.node_index(name) for name in chain.reroutes]
+            waypoints = routes.pop(key, ())
+            if len(waypoints) == len(reroute_indices):
+                for node_index, (x, y) in zip(reroute_indices, waypoints):
+                    targets[node_index * 2:node_index * 2 + 2] = (x * DPI, y * DPI)
+                continue
+            for link in chain.links:
+                links.remove(link)
+            spare += reroute_indices
+            rewired.append((chain.from_socket, chain.to_socket, waypoints))
+        # What's left are direct links that now need reroutes.
+        for key, waypoints in routes.items():
+            link = plan.link_index.links.get(key)
+            if link is None:
+                continue
+            rewired.append((link.from_socket, link.to_socket, waypoints))
+            links.remove(link)
+
+        needed = sum(len(waypoints) for _, _, waypoints in rewired)
+        reused = spare[:needed]
+        new_nodes = [nodes.new("NodeReroute") for _ in range(needed - len(reused))]
+        # New nodes are appended to the collection, after all_nodes.
+        reroutes = iter([(all_nodes[node_index], node_index) for node_index in reused] +
+                        [(node, len(all_nodes) + new_index)
+                         for new_index, node in enumerate(new_nodes)])
+        targets += [0.0, 0.0] * len(new_nodes)
+        for from_socket, to_socket, waypoints in rewired:
+            last_socket = from_socket
+            for x, y in waypoints:
+                reroute_node, node_index = next(reroutes)
+                targets[node_index * 2:node_index * 2 + 2] = (x * DPI, y * DPI)
+                links.new(last_socket, reroute_node.inputs[0])
+                last_socket = reroute_node.outputs[0]
+            links.new(last_socket, to_socket)
+        if parents is not None:
+            targets = relative_locations(all_nodes, targets, parents)
+
+        moved = [node_index for node_index in range(len(all_nodes))
+                 if abs(targets[node_index * 2] - locations[node_index * 2]) > MOVE_EPSILON or
+                 abs(targets[node_index * 2 + 1] - locations[node_index * 2 + 1]) > MOVE_EPSILON]
+        if new_nodes or len(moved) * 4 > len(all_nodes):
+            nodes.foreach_set("location", targets)
+        else:
+            # Setting a few nodes one at a time is cheaper than rewriting all of them.
+            for node_index in moved:
+                all_nodes[node_index].location = targets[node_index * 2:node_index * 2 + 2]
+
+        self.stats.count("nodes_moved", len(moved))
+        self.stats.count("links_rewired", len(rewired))
+        self.stats.count("reroutes_reused", len(reused))
+        self.stats.count("reroutes_created", len(new_nodes))
+        logger().debug("Moved %d nodes, rewired %d links" % (len(moved), len(rewired)))
+        return [all_nodes[node_index] for node_index in spare[needed:]]
+
+    def write_dot(self, all_nodes, link_keys, node_indices=None, graph_options=None, styled=False,
+                  frame_sizes=None):
+        """Writes a graph as DOT.
+
+        all_nodes is every node in the tree; each is named after its index in it. If node_indices
+        is given, only those nodes are written. Links whose ends weren't written are skipped.
+        graph_options are added to, or replace, the graph attributes.
+
+        Unless styled, each node is a bare box with ports where its sockets are, which is all
+        that the layout depends on. styled adds the theme's colors and fonts and the node and
+        socket names, for rendering previews.
+
+        frame_sizes gives the (width, height), in inches, of frames whose contents were laid out
+        separately. Those are written as empty boxes, and links to them as links between nodes
+        rather than ports; see frames.FRAME_SOCKET.
+        """
+        dot_lines = []
+
+        write_line("digraph G {", dot_lines)
+        self.write_dot_options(dot_lines, graph_options, styled)
+
+        node_scale = self.node_scale(all_nodes)
+
+        if node_indices is None:
+            node_indices = range(len(all_nodes))
+
+        node_name_to_index = dict()
+        for node_index in node_indices:
+            node = all_nodes[node_index]
+            node_name_to_index[node.name] = node_index
+            if frame_sizes and node_index in frame_sizes:
+                write_line("node_%d [width=\"%g\",height=\"%g\",label=\"\"]" % (
+                    (node_index,) + frame_sizes[node_index]), dot_lines)
+                continue
+            graphviz_node_width, graphviz_node_height = self.node_size(node, node_scale)
+            if styled:
+                self.write_styled_dot_node(node_index, node, graphviz_node_width,
+                                           graphviz_node_height, dot_lines)
+            else:
+                write_line("node_%d [width=\"%g\",height=\"%g\",label=%s]" % (
+                    node_index, graphviz_node_width / DPI, graphviz_node_height / DPI,
+                    self.lean_dot_label(node, graphviz_node_width, graphviz_node_height)),
+                    dot_lines)
+
+        edge_options = " [%s]" % self.format_graphviz_options({}) if styled else ""
+        for from_node_name, from_socket_index, to_node_name, to_socket_index in link_keys:
+            if from_node_name not in node_name_to_index or to_node_name not in node_name_to_index:
+                continue
+            if from_socket_index < 0 or to_socket_index < 0:
+                write_line("node_%d%s -> node_%d%s%s;" % (
+                    node_name_to_index[from_node_name],
+                    ":o%d" % from_socket_index if from_socket_index >= 0 else "",
+                    node_name_to_index[to_node_name],
+                    ":i%d" % to_socket_index if to_socket_index >= 0 else "",
+                    edge_options), dot_lines)
+                continue
+            write_line("node_%d:o%d -> node_%d:i%d%s;" % (
+                node_name_to_index[from_node_name],
+                from_socket_index,
+                node_name_to_index[to_node_name],
+                to_socket_index,
+                edge_options), dot_lines)
 
-        dot_file.close()
+        write_line("}", dot_lines)
 
-        with open(dot_file.name, "r") as f:
-            bpy.context.window_manager.clipboard = f.read()
+        dot_text = "\n".join(dot_lines) + "\n"
+        logger("gv_input").debug(dot_text)
+        return dot_text
 
-        return dot_file
+    def write_styled_dot_node(self, node_index, node, graphviz_node_width, graphviz_node_height,
+                              dot_lines):
+        theme = bpy.context.preferences.themes[0]
+        header_scale = (float(NODE_DY) + float(NODE_DYS) /
+                        2.0) / graphviz_node_height
+        formatted_options = self.format_graphviz_options({
+            "width": graphviz_node_width / DPI,
+            "height": graphviz_node_height / DPI,
+            "fillcolor": "%s;%f:%s" % (
+                self.blender_rgb_to_dot(
+                    theme.node_editor.input_node),
+                header_scale,
+                self.blender_rgba_to_dot(
+                    theme.node_editor.node_backdrop)
+            )
+        })
+        write_line("node_%d [%s, label=" %
+                   (node_index, formatted_options), dot_lines)
+        write_line(
+            "<<table border=\"0\" cellborder=\"0\" cellpadding=\"0\" cellspacing=\"0\">",
+            dot_lines)
+        self.write_dot_label(node, graphviz_node_width, graphviz_node_height,
+                             dot_lines)
+        write_line("</table>>]", dot_lines)
+
+    def lean_dot_label(self, node, graphviz_node_width, graphviz_node_height):
+        """A table of empty cells the size of the node, with a port cell wherever write_dot_rows
+        puts a socket and nothing else."""
+        visible_outputs, visible_inputs = self.visible_sockets(node)
+        key = ("lean", visible_outputs, visible_inputs, graphviz_node_width, graphviz_node_height)
+        label = ROW_TEMPLATE_CACHE.get(key)
+        if label is not None:
+            return label
+
+        output_offsets, input_offsets = socket_offsets(visible_outputs, visible_inputs,
+                                                       graphviz_node_height)
+        ports = [("o%d" % output_index, offset) for output_index, offset in output_offsets.items()]
+        ports += [("i%d" % input_index, offset) for input_index, offset in input_offsets.items()]
+
+        # Cells are as wide as the widest one, so only the first needs a width.
+        cells, top = [" width=\"%g\"" % graphviz_node_width], 0.0
+        for port, offset in ports:
+            port_top = offset - NODE_DY * 0.5
+            if port_top > top:
+                cells.append(" height=\"%g\"" % (port_top - top))
+            cells.append(" height=\"%g\" port=\"%s\"" % (NODE_DY, port))
+            top = port_top + NODE_DY
+        if graphviz_node_height > top:
+            cells.append(" height=\"%g\"" % (graphviz_node_height - top))
+        if len(cells) > 1:
+            cells[1] = cells[0] + cells[1]
+            del cells[0]
+
+        label = "<<table border=\"0\" cellborder=\"0\" cellpadding=\"0\" cellspacing=\"0\">" + \
+            "".join("<tr><td%s></td></tr>" % cell for cell in cells) + "</table>>"
+        ROW_TEMPLATE_CACHE.put(key, label)
+        return label
+
+    def node_scale(self, all_nodes):
+        """The ratio of node units to the pixels of dimensions, which depends on the UI scale.
+        None if no node has been drawn yet, so that none has dimensions."""
+        for node in all_nodes:
+            if node.dimensions[0] > 0.0 and node.bl_idname not in ("NodeReroute", "NodeFrame"):
+                node_scale = float(node.width) / float(node.dimensions[0])
+                logger().debug("node_scale=" + str(node_scale))
+                return node_scale
+        logger().debug("No node has dimensions, so node sizes are estimated")
+        return None
+
+    def node_size(self, node, node_scale):
+        if node_scale is None or node.dimensions[0] <= 0.0:
+            return estimate_node_size(node, *self.visible_sockets(node))
+        width = float(node.dimensions[0] * node_scale)
+        height = float(node.dimensions[1] * node_scale)
+
+        if getattr(node, "node_tree", None) is not None:
+            height += self.group_node_growth(node)
+        return width, height
+
+    def group_node_growth(self, node):
+        """How much taller a group node is than its dimensions say. Blender only updates dimensions
+        when it draws a node, so a group node whose interface changed while it was off screen
+        still has its old size. This shows as the same dimensions as last time with other sockets,
+        and only the change in sockets is estimated, as the drawn height also has panels."""
+        dimensions = tuple(node.dimensions)
+        sockets = self.visible_sockets(node)
+        seen = GROUP_NODE_SOCKETS.get(node.as_pointer())
+        if seen is None or seen[0] != dimensions:
+            GROUP_NODE_SOCKETS.put(node.as_pointer(), (dimensions, sockets))
+            return 0.0
+        # Kept as they were drawn until the node is drawn again.
+        drawn_sockets = seen[1]
+        return group_node_height(*sockets) - group_node_height(*drawn_sockets)
 
     def blender_rgb_to_dot(self, blender_color):
         return "#%02x%02x%02x" % tuple([round(x * 255.0) for x in blender_color])
@@ -320,14 +990,29 @@ class GraphvizArrange(bpy.types.Operator):
     def blender_rgba_to_dot(self, blender_color):
         return "#%02x%02x%02x%02x" % tuple([round(x * 255.0) for x in blender_color])
 
-    def write_dot_options(self, dot_file):
+    def write_dot_options(self, dot_lines, graph_options=None, styled=False):
+        node_sep = self.options.node_sep
+        rank_sep = self.options.rank_sep
+
+        graph_options = dict({
+            "margin": 0,
+            "nodesep": node_sep / DPI,
+            "rankdir": "LR",
+            "ranksep": rank_sep / DPI,
+            "splines": "polyline",
+        }, **(graph_options or {}))
+        if not styled:
+            for (section, options) in [
+                ("node", {"fixedsize": "shape", "margin": "0.0", "shape": "rect"}),
+                ("graph", graph_options),
+                ("edge", {"arrowhead": "none"}),
+            ]:
+                write_line("%s[%s]" % (section, self.format_graphviz_options(options)), dot_lines)
+            return
+
         preferences = bpy.context.preferences
         theme = preferences.themes[0]
 
-        addon_prefs = preferences.addons[__package__].preferences
-        node_sep = addon_prefs.node_sep
-        rank_sep = addon_prefs.rank_sep
-
         node_options = {
             "fontcolor": self.blender_rgb_to_dot(theme.user_interface.wcol_regular.text),
             "fontsize": FONT_SIZE,
@@ -341,15 +1026,10 @@ class GraphvizArrange(bpy.types.Operator):
 
         all_options = [
             ("node", node_options),
-            ("graph", {
+            ("graph", dict({
                 "bgcolor": self.blender_rgba_to_dot(theme.user_interface.wcol_regular.item),
                 "fontcolor": self.blender_rgb_to_dot(theme.user_interface.wcol_regular.text),
-                "margin": 0,
-                "nodesep": node_sep / DPI,
-                "rankdir": "LR",
-                "ranksep": rank_sep / DPI,
-                "splines": "polyline",
-            }),
+            }, **graph_options)),
             ("edge", {
                 "arrowhead": "none",
                 "color": self.blender_rgba_to_dot(theme.node_editor.wire),
@@ -363,7 +1043,7 @@ class GraphvizArrange(bpy.types.Operator):
 
         for (section, options) in all_options:
             formatted_options = self.format_graphviz_options(options)
-            write_line("%s[%s]" % (section, formatted_options), dot_file)
+            write_line("%s[%s]" % (section, formatted_options), dot_lines)
 
     def format_graphviz_options(self, options):
         string = ""
@@ -458,50 +1138,78 @@ class GraphvizArrange(bpy.types.Operator):
         finally:
             user32.ReleaseDC(hdc)
 
+    def write_dot_label(self,
+                        node,
+                        graphviz_node_width,
+                        graphviz_node_height,
+                        dot_lines):
+        # TODO: downward-pointing chevron as image?
+        title = node.bl_label if node.label == "" else node.label
+        visible_outputs, visible_inputs = self.visible_sockets(node)
+
+        # Everything in the table apart from the title is determined by this key, so identical node
+        # shapes share one pre-rendered table.
+        key = (node.bl_idname, visible_outputs, visible_inputs,
+               graphviz_node_width, graphviz_node_height)
+        template = ROW_TEMPLATE_CACHE.get(key)
+        if template is None:
+            rows = []
+            self.write_dot_rows(TITLE_PLACEHOLDER,
+                                visible_outputs,
+                                visible_inputs,
+                                graphviz_node_width,
+                                graphviz_node_height,
+                                rows)
+            template = tuple("\n".join(rows).split(TITLE_PLACEHOLDER, 1))
+            ROW_TEMPLATE_CACHE.put(key, template)
+
+        write_line(template[0] + title + template[1], dot_lines)
+
+    def visible_sockets(self, node):
+        visible_outputs, visible_inputs = [], []
+        for output_index, output in enumerate(node.outputs):
+            if output.enabled:
+                visible_outputs.append((output_index, output.name))
+        for input_index, input in enumerate(node.inputs):
+            if not input.enabled:
+                continue
+            height = NODE_DY
+            if input.type == 'VECTOR' and not input.is_linked and not input.hide_value:
+                height += NODE_DY * 3.0
+            visible_inputs.append((input_index, input.name, height))
+        return tuple(visible_outputs), tuple(visible_inputs)
+
     def write_dot_rows(self,
-                       node,
+                       title,
+                       visible_outputs,
+                       visible_inputs,
                        graphviz_node_width,
                        graphviz_node_height,
-                       dot_file):
+                       dot_lines):
         table_width = graphviz_node_width
         table_height = graphviz_node_height
 
         current_y = 0
 
         # Write node title.
-        # TODO: downward-pointing chevron as image?
-        title = node.bl_label if node.label == "" else node.label
-        current_y += self.write_dot_row(dot_file=dot_file,
+        current_y += self.write_dot_row(dot_lines=dot_lines,
                                         label="    " + title,
                                         cell_width=table_width,
                                         cell_height=NODE_DY)
-        current_y += self.write_dot_row(dot_file=dot_file,
+        current_y += self.write_dot_row(dot_lines=dot_lines,
                                         label=" ",
                                         cell_width=table_width,
                                         cell_height=NODE_DYS / 2.0)
 
-        visible_outputs, visible_inputs = [], []
-        for output_index, output in enumerate(node.outputs):
-            if output.enabled:
-                visible_outputs.append((output_index, output))
-        for input_index, input in enumerate(node.inputs):
-            if not input.enabled:
-                continue
-            height = NODE_DY
-            if input.type == 'VECTOR' and not input.is_linked and not input.hide_value:
-                height += NODE_DY * 3.0
-            visible_inputs.append(
-                {"input": input, "index": input_index, "height": height})
-
-        for visible_output_index, (output_index, output) in enumerate(visible_outputs):
-            current_y += self.write_dot_row(dot_file=dot_file,
-                                            label=output.name + "    ",
+        for visible_output_index, (output_index, output_name) in enumerate(visible_outputs):
+            current_y += self.write_dot_row(dot_lines=dot_lines,
+                                            label=output_name + "    ",
                                             cell_width=table_width,
                                             cell_height=NODE_DY,
                                             align="right",
                                             port="o%d" % output_index)
             if visible_output_index < len(visible_outputs) - 1:
-                current_y += self.write_dot_row(dot_file=dot_file,
+                current_y += self.write_dot_row(dot_lines=dot_lines,
                                                 label=" ",
                                                 cell_width=table_width,
                                                 cell_height=NODE_SOCKDY)
@@ -509,37 +1217,37 @@ class GraphvizArrange(bpy.types.Operator):
         # Skip to end.
         spacer_height = table_height - current_y
         if len(visible_inputs) > 0:
-            spacer_height -= sum([input["height"] for input in visible_inputs])
+            spacer_height -= sum([height for _, _, height in visible_inputs])
             spacer_height -= (len(visible_inputs) - 1) * NODE_SOCKDY
             spacer_height -= NODE_DYS / 2   # End space.
-        self.write_dot_row(dot_file=dot_file,
+        self.write_dot_row(dot_lines=dot_lines,
                            label="",
                            cell_width=table_width,
                            cell_height=spacer_height)
 
-        for visible_input_index, visible_input in enumerate(visible_inputs):
-            self.write_dot_row(dot_file=dot_file,
-                               label="    " + visible_input["input"].name,
-                               port="i%d" % visible_input["index"],
+        for visible_input_index, (input_index, input_name, height) in enumerate(visible_inputs):
+            self.write_dot_row(dot_lines=dot_lines,
+                               label="    " + input_name,
+                               port="i%d" % input_index,
                                cell_width=table_width,
                                cell_height=NODE_DY)
-            if visible_input["height"] > NODE_DY:
-                self.write_dot_row(dot_file=dot_file,
+            if height > NODE_DY:
+                self.write_dot_row(dot_lines=dot_lines,
                                    label="",
                                    cell_width=table_width,
-                                   cell_height=visible_input["height"] - NODE_DY)
+                                   cell_height=height - NODE_DY)
             if visible_input_index < len(visible_inputs) - 1:
-                self.write_dot_row(dot_file=dot_file,
+                self.write_dot_row(dot_lines=dot_lines,
                                    label=" ",
                                    cell_width=table_width,
                                    cell_height=NODE_SOCKDY)
 
         if len(visible_inputs) > 0:
-            self.write_dot_row(dot_file=dot_file, label="", cell_width=table_width,
+            self.write_dot_row(dot_lines=dot_lines, label="", cell_width=table_width,
                                cell_height=NODE_DYS / 2.0)
 
     def write_dot_row(self,
-                      dot_file,
+                      dot_lines,
                       label,
                       cell_width,
                       cell_height,
@@ -561,6 +1269,328 @@ class GraphvizArrange(bpy.types.Operator):
         for key, value in options.items():
             string += " " + key + "=" + json.dumps(str(value))
         string += ">%s</td></tr>" % label
-        write_line(string, dot_file)
+        write_line(string, dot_lines)
+
+        return cell_height
+
+
+class GraphvizArrange(bpy.types.Operator):
+    """Arranges nodes via Graphviz."""
+    bl_idname = "node.graphviz_arrange"
+    bl_label = "Arrange Nodes via Graphviz"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    layout_engine: bpy.props.EnumProperty(
+        name="Layout Engine",
+        items=[('PREFERENCES', "From Preferences", "Use the layout engine set in the preferences")] +
+        LAYOUT_ENGINES,
+        default='PREFERENCES',
+    )
+
+    def invoke(self, context, event):
+        node_tree = self.find_node_tree(context)
+        if node_tree is None:
+            return {'CANCELLED'}
+
+        arranger = Arranger(self.arrange_options(context))
+        try:
+            dot_path = self.find_graphviz(context, arranger)
+            layout_backend = None
+            if dot_path is not None:
+                from .backend import get_backend
+
+                layout_backend = get_backend(dot_path, arranger.options.layout_backend)
+            if event.shift:
+                self.request_preview(arranger)
+            plan = arranger.arrange(node_tree, layout_backend)
+            self.report({'INFO'}, "Arranged " + plan.settings.describe())
+            self.report_metrics(plan)
+            self.report_stats(arranger)
+            self.show_preview(arranger)
+        except Exception as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        return {'FINISHED'}
+
+    def request_preview(self, arranger):
+        """Has the arranger render a preview along with the layout. Only Graphviz makes them."""
+        from .preview import GraphPreview
+
+        if arranger.graphviz is not None:
+            arranger.preview = GraphPreview(arranger.options.preview_mode,
+                                            arranger.graphviz.formats)
+
+    def show_preview(self, arranger):
+        preview = arranger.preview
+        if preview is None:
+            return
+        if not preview.rendered:
+            self.report({'WARNING'}, "Graphviz didn't lay anything out, so there is no preview")
+            return
+        image = preview.show()
+        if image is not None:
+            self.report({'INFO'}, "Loaded the preview as the image \"%s\"" % image.name)
+
+    def report_metrics(self, plan):
+        if plan.metrics is not None:
+            self.report({'INFO'}, "Layout: " + plan.metrics.describe())
+
+    def report_stats(self, arranger):
+        summary = arranger.stats.finish()
+        if summary is not None:
+            self.report({'INFO'}, summary)
+
+    def arrange_options(self, context):
+        if self.layout_engine == 'PREFERENCES':
+            return ArrangeOptions.from_context(context)
+        return ArrangeOptions.from_context(context, layout_engine=self.layout_engine)
+
+    def find_graphviz(self, context, arranger):
+        """The dot to lay out with, or None if the arranger uses the built-in engine, which it is
+        switched to if Graphviz can't be found."""
+        if arranger.layout_engine == 'BUILTIN':
+            return None
+        arranger.graphviz = GraphvizAutodetect.graphviz_info(context)
+        if arranger.graphviz is None:
+            self.report({'WARNING'}, "Graphviz wasn't found, so the built-in layout engine was used")
+            arranger.layout_engine = 'BUILTIN'
+            return None
+        return arranger.graphviz.path
+
+    def find_node_tree(self, context):
+        node_editors = [
+            area for area in bpy.context.screen.areas if area.type == 'NODE_EDITOR']
+        if len(node_editors) == 0:
+            self.report({'ERROR'}, "No node editor is open")
+            return None
+        if len(node_editors) > 1:
+            self.report({'ERROR'}, "More than one node editor is open")
+            return None
 
-        return cell_height
\ No newline at end of file
+        node_editor = node_editors[0]
+        node_space = node_editor.spaces[0]
+        node_tree = node_space.node_tree
+        if node_tree.nodes.active:
+            while node_tree.nodes.active != context.active_node:
+                node_tree = node_tree.nodes.active.node_tree
+
+        logger().info(node_editor.spaces[0].path.to_string)
+        return node_tree
+
+
+class GraphvizArrangeModal(GraphvizArrange):
+    """Arranges nodes via Graphviz without blocking the interface. Press Esc to cancel."""
+    bl_idname = "node.graphviz_arrange_modal"
+    bl_label = "Arrange Nodes via Graphviz (Background)"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    # Events that only move the view around, which are safe while the layout is running.
+    NAVIGATION_EVENTS = {'MIDDLEMOUSE', 'WHEELUPMOUSE', 'WHEELDOWNMOUSE', 'TRACKPADPAN',
+                         'TRACKPADZOOM'}
+
+    def invoke(self, context, event):
+        node_tree = self.find_node_tree(context)
+        if node_tree is None:
+            return {'CANCELLED'}
+
+        # Blender data can only be touched from the main thread, so the graph is written here and
+        # only Graphviz runs in the background.
+        options = self.arrange_options(context)
+        self.arranger = Arranger(options)
+        self.dot_path = self.find_graphviz(context, self.arranger)
+        self.timeout = options.timeout or None
+        if event.shift:
+            self.request_preview(self.arranger)
+        self.pending_trees = self.arranger.node_trees_to_arrange(node_tree)
+        self.tree_count = len(self.pending_trees)
+        self.plan = None
+        # Whether self.plan has been applied to its tree, and how many trees have been.
+        self.applied = False
+        self.applied_trees = 0
+        self.renders = {}
+        self.timer = None
+        self.arranger.stats.start_profile()
+        return self.start_next_tree(context)
+
+    def start_next_tree(self, context):
+        """Starts laying out the next node tree, finishing right away the ones whose layouts are
+        all cached. Node groups come before the trees that use them."""
+        while self.pending_trees:
+            try:
+                node_tree = self.pending_trees.pop(0)
+                # The tree itself comes last, after its node groups.
+                self.plan = self.arranger.prepare_graph(node_tree,
+                                                        with_preview=not self.pending_trees)
+                self.applied = False
+            except Exception as e:
+                return self.fail(context, e)
+
+            try:
+                if self.run_stages(context):
+                    return {'RUNNING_MODAL'}
+            except Exception as e:
+                return self.fail(context, e)
+
+        if self.timer is not None:
+            self.finish(context)
+        self.report({'INFO'}, "Arranged " + self.plan.settings.describe())
+        self.report_metrics(self.plan)
+        self.report_stats(self.arranger)
+        try:
+            self.show_preview(self.arranger)
+        except Exception as e:
+            return self.fail(context, e)
+        return {'FINISHED'}
+
+    def run_stages(self, context, laid_out=False):
+        """Lays out self.plan one stage at a time, and applies it after the last. Frames laid out
+        separately take a stage per level of nesting; otherwise there is only one. With laid_out,
+        self.layouts already holds the current stage. Returns True if dot was started in the
+        background, for modal to carry on with once it's done."""
+        while True:
+            if not laid_out:
+                if self.plan.settings.program == "builtin":
+                    # The built-in engine is quick enough to run right here.
+                    self.layouts = self.arranger.builtin_layouts(self.plan)
+                elif self.start_renders(context):
+                    return True
+            laid_out = False
+            if not self.arranger.next_stage(self.plan, self.layouts):
+                break
+        self.applied = True
+        self.applied_trees += 1
+        self.arranger.finish_arrange(self.plan, self.layouts)
+        return False
+
+    def start_renders(self, context):
+        """Starts dot in the background on the graphs of self.plan that aren't cached. Returns
+        False if there were none."""
+        from .backend import BackgroundRender
+
+        self.layout_keys, self.layouts = self.arranger.cached_layouts(self.plan)
+        self.renders = {}
+        preview_outputs = self.plan.preview.outputs() if self.plan.preview is not None else ()
+        for job_index, layout in enumerate(self.layouts):
+            if layout is None:
+                self.renders[job_index] = BackgroundRender(self.dot_path,
+                                                           self.plan.dot_texts[job_index],
+                                                           self.arranger.options.layout_format,
+                                                           timeout=self.timeout,
+                                                           extra_outputs=preview_outputs)
+                preview_outputs = ()
+        if not self.renders:
+            return False
+        for render in self.renders.values():
+            render.start()
+        if self.timer is None:
+            window_manager = context.window_manager
+            self.timer = window_manager.event_timer_add(0.1, window=context.window)
+            window_manager.progress_begin(0, 100)
+            window_manager.modal_handler_add(self)
+        return True
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'WARNING'}, "Arrange cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'} if event.type in self.NAVIGATION_EVENTS else {'RUNNING_MODAL'}
+
+        if not all(render.done() for render in self.renders.values()):
+            self.update_progress(context)
+            return {'RUNNING_MODAL'}
+
+        self.arranger.stats.add_time("layout", max(render.elapsed()
+                                                   for render in self.renders.values()))
+        try:
+            for job_index, render in self.renders.items():
+                self.layouts[job_index] = self.arranger.parse_graphviz_output(
+                    self.plan, render.result().decode(), self.layout_keys[job_index])
+            if self.plan.preview is not None:
+                self.plan.preview.rendered = True
+            if self.run_stages(context, laid_out=True):
+                return {'RUNNING_MODAL'}
+        except Exception as e:
+            return self.fail(context, e)
+        return self.start_next_tree(context)
+
+    def fail(self, context, error):
+        if self.timer is not None:
+            self.finish(context)
+        self.arranger.stats.stop_profile()
+        self.restore_trees()
+        self.report({'ERROR'}, str(error))
+        return {'CANCELLED'}
+
+    def cancel(self, context):
+        for render in self.renders.values():
+            render.cancel()
+        if self.timer is not None:
+            self.finish(context)
+        self.arranger.stats.stop_profile()
+        self.restore_trees()
+
+    def restore_trees(self):
+        """Puts back the reroutes cleaned up in a tree whose layout was never applied, so that
+        stopping partway leaves it as it was. Blender doesn't keep an undo step for a cancelled
+        operator, so one is pushed if any tree was already arranged."""
+        if self.plan is not None and not self.applied:
+            self.plan.removed_reroutes.restore(self.plan.node_tree)
+            self.applied = True
+        if self.applied_trees:
+            bpy.ops.ed.undo_push(message=self.bl_label)
+
+    def update_progress(self, context):
+        renders = self.renders.values()
+        elapsed = max(render.elapsed() for render in renders)
+        timeout = next(iter(renders)).timeout
+        if timeout is None:
+            # There's no way to know how far along dot is, so count finished parts and keep the
+            # indicator moving in between.
+            finished = sum(1 for render in renders if render.done())
+            progress = 100.0 * (finished + (elapsed % 1.0)) / len(renders)
+        else:
+            progress = min(100.0, 100.0 * elapsed / timeout)
+        context.window_manager.progress_update(progress)
+        if context.area is not None:
+            tree_progress = ""
+            if self.tree_count > 1:
+                tree_progress = ", tree %d of %d" % (self.tree_count - len(self.pending_trees),
+                                                     self.tree_count)
+            context.area.header_text_set(
+                "Arranging via Graphviz: %.1fs%s (Esc to cancel)" % (elapsed, tree_progress))
+
+    def finish(self, context):
+        window_manager = context.window_manager
+        window_manager.event_timer_remove(self.timer)
+        window_manager.progress_end()
+        self.timer = None
+        if context.area is not None:
+            context.area.header_text_set(None)
+
+
+def arrange_tree(node_tree, dot_path=None, **options):
+    """Arranges a node tree without a node editor, operator or event, e.g. from `blender -b`.
+
+    options override the add-on preferences (or their defaults, if the add-on isn't enabled); see
+    ArrangeOptions. Returns the ArrangePlan that was carried out. Raises on failure.
+    """
+    from .backend import get_backend
+
+    dot_path = dot_path or options.get("dot_path")
+    options = ArrangeOptions.from_context(bpy.context, **options)
+    arranger = Arranger(options)
+    layout_backend = None
+    if arranger.layout_engine != 'BUILTIN':
+        arranger.graphviz = GraphvizAutodetect.graphviz_info(bpy.context, dot_path)
+        if arranger.graphviz is not None:
+            layout_backend = get_backend(arranger.graphviz.path, options.layout_backend)
+        else:
+            logger().warning("Graphviz wasn't found, so the built-in layout engine was used")
+            arranger.layout_engine = 'BUILTIN'
+    plan = arranger.arrange(node_tree, layout_backend)
+    arranger.stats.finish()
+    return plan
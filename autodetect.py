@@ -14,6 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
 import os
 import shutil
 import sys
@@ -21,6 +22,14 @@ from pathlib import Path
 
 import bpy
 
+from .util import logger
+
+# dot is slow to start compared to an arrange of a small tree, so each executable is only probed
+# again when its mtime changes. Keyed by path.
+PROBED_GRAPHVIZ = {}
+# The path|mtime keys of files that were probed and turned out not to be a dot that runs.
+FAILED_PROBES = set()
+
 
 def report_error(msg):
     bpy.context.window_manager.popup_menu(
@@ -35,11 +44,14 @@ class GraphvizAutodetect(bpy.types.Operator):
     bl_label = "Auto-detect Graphviz"
 
     def execute(self, context):
+        # Searching by hand is the one time that a failed search or probe is tried again.
+        detect_graphviz.cache_clear()
+        FAILED_PROBES.clear()
         result = self.find_graphviz()
         if result is None:
             self.report_that_autodetection_failed()
         else:
-            context.preferences.addons[__name__].preferences.dot_path = result
+            context.preferences.addons[__package__].preferences.dot_path = result
         return {'FINISHED'}
 
     @classmethod
@@ -84,20 +96,34 @@ class GraphvizAutodetect(bpy.types.Operator):
         return find_in_path()
 
     @classmethod
-    def find_graphviz_or_empty_string(cls):
-        dot_path = GraphvizAutodetect.find_graphviz()
-        return "" if dot_path is None else dot_path
-
-    @classmethod
-    def require_graphviz(cls, context):
-        dot_path = None
-        if __name__ in context.preferences.addons:
-            dot_path = context.preferences.addons[__name__].preferences.dot_path
-        if dot_path is None:
-            dot_path = GraphvizAutodetect.find_graphviz()
-        if dot_path is None:
-            GraphvizAutodetect.report_that_autodetection_failed()
-        return dot_path
+    def graphviz_info(cls, context, dot_path=None):
+        """Probes the dot to lay out with, returning its GraphvizInfo, or None if there is none
+        that runs.
+
+        That is dot_path if given, else the one set in the preferences, else one found on the
+        system. The system is only searched once per session, on the first arrange rather than at
+        startup, and what is found is saved in the preferences along with the probe. If nothing is
+        found, that is remembered too, until the Auto-detect button is pressed.
+        """
+        if dot_path:
+            return probe_graphviz(str(dot_path))
+
+        addon = context.preferences.addons.get(__package__)
+        preferences = None if addon is None else addon.preferences
+        if preferences is not None and preferences.dot_path:
+            info = probe_graphviz(preferences.dot_path, preferences)
+            if info is not None:
+                return info
+
+        # Nothing set, or what was set has gone, e.g. after Graphviz was uninstalled.
+        detected = detect_graphviz()
+        info = None if detected is None else probe_graphviz(str(detected), preferences)
+        if info is None:
+            return None
+        if preferences is not None:
+            preferences.dot_path = info.path
+            info.save_to_preferences(preferences)
+        return info
 
     @classmethod
     def report_that_autodetection_failed(cls):
@@ -111,3 +137,87 @@ class GraphvizAutodetect(bpy.types.Operator):
                          "in the \"Node: Arrange Nodes via Graphviz\" addon preferences.")
 
         report_error(msg)
+
+
+@functools.lru_cache(maxsize=1)
+def detect_graphviz():
+    return GraphvizAutodetect.find_graphviz()
+
+
+class GraphvizInfo:
+    """What a dot executable is and can do: its version, the output formats it can render and
+    the layout engines it has. key identifies the file as probed, by path and mtime."""
+
+    def __init__(self, path, key, version, formats, layouts):
+        self.path = path
+        self.key = key
+        self.version = version
+        self.formats = formats
+        self.layouts = layouts
+
+    @classmethod
+    def probe(cls, path, key):
+        """Runs dot to find out what it is. Returns None if it doesn't run."""
+        import subprocess
+
+        def run(argument):
+            # dot prints all of these to stderr, and exits with an error after listing choices.
+            result = subprocess.run([path, argument], capture_output=True, text=True,
+                                    errors="replace", timeout=10.0)
+            return result.stderr
+
+        def choices(output):
+            # e.g. 'Format: "?" not recognized. Use one of: bmp canon cmap ...'
+            _, _, names = output.partition("Use one of:")
+            return sorted(set(names.split()))
+
+        try:
+            version = run("-V").strip()
+            formats = choices(run("-T?"))
+            layouts = choices(run("-K?"))
+        except (OSError, subprocess.SubprocessError) as e:
+            logger().warning("Couldn't run Graphviz at %s: %s" % (path, e))
+            return None
+        if "graphviz" not in version.lower():
+            logger().warning("%s doesn't look like Graphviz's dot: %s" % (path, version))
+            return None
+        logger().info("Found %s at %s" % (version, path))
+        return cls(path, key, version, formats, layouts)
+
+    @classmethod
+    def from_preferences(cls, preferences):
+        return cls(preferences.dot_path, preferences.dot_probe_key, preferences.dot_version,
+                   preferences.dot_formats.split(), preferences.dot_layouts.split())
+
+    def save_to_preferences(self, preferences):
+        preferences.dot_probe_key = self.key
+        preferences.dot_version = self.version
+        preferences.dot_formats = " ".join(self.formats)
+        preferences.dot_layouts = " ".join(self.layouts)
+
+
+def probe_graphviz(path, preferences=None):
+    """The GraphvizInfo of the dot at path, probing it only if it changed since it was last
+    probed in this session or, given the add-on preferences, since it was saved there. Files
+    that fail the probe aren't probed again until they change."""
+    try:
+        key = "%s|%r" % (path, os.stat(path).st_mtime)
+    except OSError:
+        return None
+    if key in FAILED_PROBES:
+        return None
+
+    info = PROBED_GRAPHVIZ.get(path)
+    if info is not None and info.key == key:
+        return info
+    if preferences is not None and preferences.dot_probe_key == key:
+        info = GraphvizInfo.from_preferences(preferences)
+    else:
+        info = GraphvizInfo.probe(path, key)
+        if info is None:
+            FAILED_PROBES.add(key)
+            return None
+        if preferences is not None and preferences.dot_path == path:
+            info.save_to_preferences(preferences)
+    PROBED_GRAPHVIZ[path] = info
+    return info
@@ -0,0 +1,461 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .util import logger
+
+# The line that ends each graph rendered in these formats, which is how the worker knows that it
+# has read all of the output for one graph. json output is indented, apart from its outermost
+# braces.
+END_LINES = {"plain": "stop", "plain-ext": "stop", "json": "}", "json0": "}"}
+
+TIMEOUT_MESSAGE = "Graphviz took longer than %g seconds"
+
+
+def dot_command(dot_path, output_format, extra_outputs=()):
+    """The command that renders a graph read from stdin to stdout in output_format, and also to
+    each (format, path) of extra_outputs, from one layout."""
+    command = [dot_path]
+    # Each -o applies to the -T before it; the last -T has none, so it goes to stdout.
+    for extra_format, path in extra_outputs:
+        command += ["-T" + extra_format, "-o" + str(path)]
+    return command + ["-T" + output_format]
+
+
+class DotSubprocess:
+    """Runs a fresh dot process for every graph.
+
+    Every backend's render takes a timeout in seconds, or None for no limit, after which it gives
+    up on the graph and raises.
+    """
+
+    def __init__(self, dot_path):
+        self.dot_path = dot_path
+
+    def render(self, dot_text, output_format, extra_outputs=(), timeout=None):
+        try:
+            result = subprocess.run(
+                dot_command(self.dot_path, output_format, extra_outputs),
+                input=dot_text.encode(), capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(TIMEOUT_MESSAGE % timeout)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors="replace"))
+        return result.stdout
+
+    def close(self):
+        pass
+
+
+class BackgroundRender:
+    """Renders one graph on a separate thread in its own dot process, which can be killed.
+    extra_outputs are rendered too, as in dot_command."""
+
+    def __init__(self, dot_path, dot_text, output_format, timeout=None, extra_outputs=()):
+        self.dot_path = dot_path
+        self.dot_text = dot_text
+        self.output_format = output_format
+        self.timeout = timeout
+        self.extra_outputs = extra_outputs
+        self.process = None
+        self.output = None
+        self.error = None
+        self.cancelled = False
+        self.start_time = None
+        self.end_time = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.process = subprocess.Popen(
+                dot_command(self.dot_path, self.output_format, self.extra_outputs),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE)
+            if self.cancelled:
+                self.process.kill()
+            try:
+                stdout, stderr = self.process.communicate(
+                    self.dot_text.encode(), timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.communicate()
+                self.error = TIMEOUT_MESSAGE % self.timeout
+                return
+
+            if self.cancelled:
+                self.error = "Cancelled"
+            elif self.process.returncode != 0:
+                self.error = stderr.decode(errors="replace")
+            else:
+                self.output = stdout
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.end_time = time.monotonic()
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def elapsed(self):
+        end_time = self.end_time if self.end_time is not None else time.monotonic()
+        return end_time - self.start_time
+
+    def cancel(self):
+        self.cancelled = True
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def result(self):
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return self.output
+
+
+class DotWorker:
+    """Keeps one dot process alive and feeds it graphs one after another over its stdin.
+
+    dot lays out every graph it reads from a stream in turn, so plugin loading and process startup
+    are only paid once. Only the formats of END_LINES can be read back this way, as the end of
+    each graph has to be found; other formats, and graphs with extra outputs, are rendered by a
+    one-shot process. The process is restarted if the format changes.
+    """
+
+    def __init__(self, dot_path):
+        self.dot_path = dot_path
+        self.one_shot = DotSubprocess(dot_path)
+        self.lock = threading.Lock()
+        self.process = None
+        self.output_format = None
+        self.lines = None
+        self.errors = None
+
+    def start(self, output_format):
+        self.output_format = output_format
+        self.process = subprocess.Popen(
+            [self.dot_path, "-T" + output_format],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1)
+        self.lines = queue.Queue()
+        self.errors = []
+
+        # Output is read on threads, so that render can stop waiting for it after a timeout, and so
+        # that a full stderr pipe can't stall dot. Each pump ends with None when dot exits.
+        def pump(stream, sink):
+            for line in stream:
+                sink(line)
+            sink(None)
+
+        threading.Thread(target=pump, args=(self.process.stdout, self.lines.put),
+                         daemon=True).start()
+        threading.Thread(target=pump, args=(self.process.stderr, self.errors.append),
+                         daemon=True).start()
+
+    def render(self, dot_text, output_format, extra_outputs=(), timeout=None):
+        if output_format not in END_LINES or extra_outputs:
+            return self.one_shot.render(dot_text, output_format, extra_outputs, timeout)
+
+        with self.lock:
+            if self.process is not None and self.output_format != output_format:
+                self.close()
+            if self.process is None or self.process.poll() is not None:
+                self.start(output_format)
+            # Only this graph's errors are reported if it fails.
+            self.errors.clear()
+            deadline = None if timeout is None else time.monotonic() + timeout
+
+            try:
+                self.process.stdin.write(dot_text)
+                self.process.stdin.flush()
+            except OSError:
+                self.close()
+                raise RuntimeError("The Graphviz worker process exited unexpectedly")
+
+            output = []
+            while True:
+                try:
+                    line = self.lines.get(
+                        timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    # A stuck dot would never get to the next graph, so a new one is started for it.
+                    self.kill()
+                    raise RuntimeError(TIMEOUT_MESSAGE % timeout)
+                if line is None:
+                    # dot exits when it fails to parse a graph; it is restarted for the next one.
+                    message = "".join(error for error in self.errors if error is not None)
+                    self.close()
+                    raise RuntimeError(message or "The Graphviz worker process exited unexpectedly")
+                output.append(line)
+                if line.rstrip("\r\n") == END_LINES[output_format]:
+                    break
+            return "".join(output).encode()
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.process = None
+
+    def kill(self):
+        if self.process is None:
+            return
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+
+class DotWorkerPool:
+    """A set of DotWorkers, so that several graphs can be laid out at once.
+
+    Workers are only started when first needed, so there are never more dot processes than graphs
+    being laid out concurrently.
+    """
+
+    def __init__(self, dot_path, size):
+        self.workers = [DotWorker(dot_path) for _ in range(size)]
+        self.idle = queue.LifoQueue()
+        for worker in reversed(self.workers):
+            self.idle.put(worker)
+
+    def render(self, dot_text, output_format, extra_outputs=(), timeout=None):
+        worker = self.idle.get()
+        try:
+            return worker.render(dot_text, output_format, extra_outputs, timeout)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+class GraphvizLibrary:
+    """Calls libgvc and libcgraph in-process through ctypes.
+
+    Graphviz isn't thread-safe, so only one graph is laid out at a time. parallel is another
+    backend that render_all uses instead when there are several graphs to lay out at once, or a
+    timeout, if set.
+    """
+
+    def __init__(self, gvc, cgraph):
+        import ctypes
+
+        self.lock = threading.Lock()
+        self.gvc, self.cgraph = gvc, cgraph
+        self.parallel = None
+
+        gvc.gvContext.restype = ctypes.c_void_p
+        gvc.gvLayout.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p]
+        gvc.gvRenderData.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p,
+                                     ctypes.POINTER(ctypes.c_void_p),
+                                     ctypes.POINTER(ctypes.c_size_t)]
+        gvc.gvRenderFilename.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_char_p,
+                                         ctypes.c_char_p]
+        gvc.gvFreeRenderData.argtypes = [ctypes.c_void_p]
+        gvc.gvFreeLayout.argtypes = [ctypes.c_void_p, ctypes.c_void_p]
+        gvc.gvFreeContext.argtypes = [ctypes.c_void_p]
+        cgraph.agmemread.restype = ctypes.c_void_p
+        cgraph.agmemread.argtypes = [ctypes.c_char_p]
+        cgraph.agclose.argtypes = [ctypes.c_void_p]
+        cgraph.agget.restype = ctypes.c_char_p
+        cgraph.agget.argtypes = [ctypes.c_void_p, ctypes.c_char_p]
+        if hasattr(cgraph, "aglasterr"):
+            cgraph.aglasterr.restype = ctypes.c_char_p
+
+        self.context = gvc.gvContext()
+        if not self.context:
+            raise RuntimeError("Couldn't create a Graphviz context")
+
+    @classmethod
+    def load(cls, dot_path):
+        import ctypes
+
+        gvc_path = find_library(dot_path, "gvc")
+        cgraph_path = find_library(dot_path, "cgraph")
+        if gvc_path is None or cgraph_path is None:
+            return None
+        try:
+            # cgraph must be loaded first so that gvc can resolve its symbols against it.
+            cgraph = ctypes.CDLL(str(cgraph_path))
+            gvc = ctypes.CDLL(str(gvc_path))
+            return cls(gvc, cgraph)
+        except (OSError, AttributeError, RuntimeError) as e:
+            logger().info("Couldn't load the Graphviz library: %s" % e)
+            return None
+
+    def render(self, dot_text, output_format, extra_outputs=(), timeout=None):
+        """Renders a graph. A layout running in-process can't be interrupted, so timeout is
+        ignored."""
+        import ctypes
+
+        with self.lock:
+            graph = self.cgraph.agmemread(dot_text.encode())
+            if not graph:
+                raise RuntimeError(self.last_error() or "Graphviz couldn't parse the graph")
+            try:
+                # Like the dot command, use the engine named by the graph's layout attribute.
+                engine = self.cgraph.agget(graph, b"layout") or b"dot"
+                if self.gvc.gvLayout(self.context, graph, engine) != 0:
+                    raise RuntimeError(self.last_error() or "Graphviz layout failed")
+                try:
+                    for extra_format, path in extra_outputs:
+                        if self.gvc.gvRenderFilename(self.context, graph, extra_format.encode(),
+                                                     os.fsencode(path)) != 0:
+                            raise RuntimeError(self.last_error() or "Graphviz rendering failed")
+                    data = ctypes.c_void_p()
+                    # Older Graphviz versions take an unsigned int here. A zeroed size_t gets the
+                    # right value either way on little-endian machines and is never overrun.
+                    length = ctypes.c_size_t(0)
+                    if self.gvc.gvRenderData(self.context, graph, output_format.encode(),
+                                             ctypes.byref(data), ctypes.byref(length)) != 0:
+                        raise RuntimeError(self.last_error() or "Graphviz rendering failed")
+                    try:
+                        return ctypes.string_at(data, length.value)
+                    finally:
+                        self.gvc.gvFreeRenderData(data)
+                finally:
+                    self.gvc.gvFreeLayout(self.context, graph)
+            finally:
+                self.cgraph.agclose(graph)
+
+    def last_error(self):
+        if not hasattr(self.cgraph, "aglasterr"):
+            return None
+        error = self.cgraph.aglasterr()
+        return None if error is None else error.decode(errors="replace")
+
+    def close(self):
+        if self.parallel is not None:
+            self.parallel.close()
+        with self.lock:
+            if self.context:
+                self.gvc.gvFreeContext(self.context)
+                self.context = None
+
+
+def find_library(dot_path, name):
+    """Finds the shared library that belongs to the given dot executable, or a system-wide one."""
+    import ctypes.util
+
+    if dot_path:
+        bin_dir = Path(dot_path).resolve().parent
+        if os.name == "nt":
+            patterns = [(bin_dir, name + ".dll"), (bin_dir, "lib" + name + "*.dll")]
+        elif sys.platform == "darwin":
+            patterns = [(bin_dir.parent / "lib", "lib" + name + ".*dylib")]
+        else:
+            patterns = [(bin_dir.parent / "lib", "lib" + name + ".so*"),
+                        (bin_dir.parent / "lib64", "lib" + name + ".so*"),
+                        (bin_dir.parent / "lib", "*-linux-gnu/lib" + name + ".so*")]
+        for directory, pattern in patterns:
+            for candidate in sorted(directory.glob(pattern)):
+                return candidate
+
+    return ctypes.util.find_library(name)
+
+
+BACKENDS = {}
+
+# The most dot processes that a backend runs at once, or None for one per CPU. batch.py lowers it,
+# as it runs several Blender processes at once.
+WORKER_LIMIT = None
+
+
+def worker_count():
+    count = os.cpu_count() or 1
+    if WORKER_LIMIT is not None:
+        count = max(1, min(count, WORKER_LIMIT))
+    return count
+
+
+def get_backend(dot_path, kind):
+    """Returns a shared backend that renders with the given dot executable.
+
+    kind is one of the layout_backend preference values. 'AUTO' tries the in-process library, then
+    a persistent worker. As the library lays out one graph at a time and can't be stopped, 'AUTO'
+    still lays out several graphs at once, and graphs with a timeout, with a pool of workers.
+    """
+    key = (dot_path, kind)
+    backend = BACKENDS.get(key)
+    if backend is not None:
+        return backend
+
+    if kind in ('AUTO', 'LIBRARY'):
+        backend = GraphvizLibrary.load(dot_path)
+        if backend is None and kind == 'LIBRARY':
+            logger().info("Graphviz library not found, falling back to a worker process")
+        elif backend is not None and kind == 'AUTO':
+            backend.parallel = DotWorkerPool(dot_path, worker_count())
+    if backend is None and kind in ('AUTO', 'LIBRARY', 'WORKER'):
+        backend = DotWorkerPool(dot_path, worker_count())
+    if backend is None:
+        backend = DotSubprocess(dot_path)
+
+    BACKENDS[key] = backend
+    return backend
+
+
+def shutdown_backends():
+    for backend in BACKENDS.values():
+        backend.close()
+    BACKENDS.clear()
+
+
+def render_all(backend, dot_texts, output_format, extra_outputs=(), timeout=None):
+    """Renders several graphs, in parallel if the backend can. extra_outputs are rendered from
+    the first graph, by the same layout run. timeout applies to each graph."""
+    if not dot_texts:
+        return []
+    # The library can't stop a layout, so its parallel backend also takes the graphs that have
+    # a time limit.
+    parallel = getattr(backend, "parallel", None)
+    if parallel is not None and (len(dot_texts) > 1 or timeout is not None):
+        backend = parallel
+    if len(dot_texts) == 1:
+        return [backend.render(dot_texts[0], output_format, extra_outputs, timeout)]
+    if extra_outputs:
+        return [backend.render(dot_texts[0], output_format, extra_outputs, timeout)] + \
+            render_all(backend, dot_texts[1:], output_format, timeout=timeout)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(len(dot_texts), os.cpu_count() or 1)) as executor:
+        return list(executor.map(lambda dot_text: backend.render(dot_text, output_format,
+                                                                 timeout=timeout),
+                                 dot_texts))
@@ -0,0 +1,241 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Arranges every node tree in many .blend files from the command line.
+
+    python batch.py --blender /path/to/blender --jobs 8 --save --report report.json assets/*.blend
+
+Each file is opened in its own background Blender process, several at a time. Every material,
+world, compositor and node group in it is arranged with arrange_tree, and the time taken and any
+failures are reported per file. The CPUs are shared out between the Blender processes, each
+laying out its graphs with at most its share of dot processes.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PACKAGE_NAME = "nodes_graphviz_arrange"
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Arrange all node trees in .blend files with Graphviz.")
+    parser.add_argument("files", nargs="*", type=Path, help=".blend files to arrange")
+    parser.add_argument("--blender", default="blender", help="Blender executable")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of Blender processes to run at once")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="give up on a file after this many seconds")
+    parser.add_argument("--save", action="store_true", help="save the arranged files in place")
+    parser.add_argument("--report", type=Path, help="write per-file results to this JSON file")
+    parser.add_argument("--dot", dest="dot_path", help="path to the dot executable")
+    parser.add_argument("--node-sep", type=float, help="separation between nodes at the same level")
+    parser.add_argument("--rank-sep", type=float, help="separation between levels")
+    parser.add_argument("--backend", dest="layout_backend",
+                        choices=["AUTO", "LIBRARY", "WORKER", "SUBPROCESS"], help="how Graphviz is run")
+    parser.add_argument("--dot-workers", type=int,
+                        help="dot processes per Blender process; by default the CPUs are shared "
+                        "out between the jobs")
+    # Used internally to run inside Blender on one file.
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", type=Path, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def arrange_options(args):
+    options = {}
+    for name in ("dot_path", "node_sep", "rank_sep", "layout_backend"):
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+    return options
+
+
+def option_args(args):
+    """The command-line arguments that pass args' arrange options on to a worker."""
+    argv = []
+    for flag, name in (("--dot", "dot_path"), ("--node-sep", "node_sep"), ("--rank-sep", "rank_sep"),
+                       ("--backend", "layout_backend")):
+        value = getattr(args, name)
+        if value is not None:
+            argv += [flag, str(value)]
+    # Each Blender process would otherwise start a dot process per CPU.
+    argv += ["--dot-workers", str(dot_workers(args))]
+    if args.save:
+        argv.append("--save")
+    return argv
+
+
+def dot_workers(args):
+    if args.dot_workers is not None:
+        return max(1, args.dot_workers)
+    return max(1, (os.cpu_count() or 1) // max(1, args.jobs))
+
+
+# Worker: runs inside Blender, with the .blend file already open.
+
+def load_package():
+    """Imports the add-on from this directory, whether or not it's installed or enabled."""
+    import importlib.util
+
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    directory = Path(__file__).resolve().parent
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, directory / "__init__.py",
+                                                  submodule_search_locations=[str(directory)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+def node_trees(data):
+    """Every editable node tree in the open file, each once, with a name for reports."""
+    seen = set()
+
+    def owned(kind, owner, node_tree):
+        if node_tree is None or owner.library is not None or node_tree.as_pointer() in seen:
+            return None
+        seen.add(node_tree.as_pointer())
+        return "%s:%s" % (kind, owner.name), node_tree
+
+    candidates = []
+    for material in data.materials:
+        candidates.append(owned("material", material, material.node_tree))
+    for world in data.worlds:
+        candidates.append(owned("world", world, world.node_tree))
+    for scene in data.scenes:
+        # Blender 5 keeps the compositor in a node group; earlier versions embed it in the scene.
+        compositor = getattr(scene, "compositing_node_group", None) or getattr(scene, "node_tree", None)
+        candidates.append(owned("compositor", scene, compositor))
+    for node_group in data.node_groups:
+        candidates.append(owned("node_group", node_group, node_group))
+    return [candidate for candidate in candidates if candidate is not None]
+
+
+def run_worker(args):
+    import bpy
+
+    import importlib
+
+    arrange_tree = load_package().arrange.arrange_tree
+    options = arrange_options(args)
+    if args.dot_workers is not None:
+        importlib.import_module(PACKAGE_NAME + ".backend").WORKER_LIMIT = args.dot_workers
+
+    start = time.perf_counter()
+    trees = node_trees(bpy.data)
+    failures = []
+    for name, node_tree in trees:
+        try:
+            arrange_tree(node_tree, **options)
+        except Exception as e:
+            failures.append({"tree": name, "error": "%s: %s" % (type(e).__name__, e)})
+
+    if args.save and len(failures) < len(trees):
+        bpy.ops.wm.save_mainfile()
+
+    result = {
+        "trees": len(trees),
+        "arranged": len(trees) - len(failures),
+        "failures": failures,
+        "arrange_seconds": time.perf_counter() - start,
+    }
+    args.result.write_text(json.dumps(result))
+
+
+# Driver: runs in plain Python and starts a Blender process per file.
+
+def run_file(args, blend_path):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        result_path = Path(temp_dir) / "result.json"
+        command = [args.blender, "--background", "--factory-startup", str(blend_path),
+                   "--python", str(Path(__file__).resolve()), "--",
+                   "--worker", "--result", str(result_path)] + option_args(args)
+
+        start = time.perf_counter()
+        try:
+            process = subprocess.run(command, capture_output=True, text=True, errors="replace",
+                                     timeout=args.timeout)
+            output = process.stdout + process.stderr
+        except subprocess.TimeoutExpired:
+            process, output = None, "Timed out after %g seconds" % args.timeout
+        except OSError as e:
+            process, output = None, str(e)
+        seconds = time.perf_counter() - start
+
+        result = {"file": str(blend_path), "seconds": seconds}
+        if result_path.exists():
+            result.update(json.loads(result_path.read_text()))
+        else:
+            # Blender didn't get as far as writing a result, so the end of its output says why.
+            result["error"] = output.strip().splitlines()[-1] if output.strip() else \
+                "Blender exited with code %s" % (process.returncode if process else "?")
+        return result
+
+
+def run_driver(args):
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not args.files:
+        print("No .blend files given", file=sys.stderr)
+        return 2
+
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        for result in executor.map(lambda blend_path: run_file(args, blend_path), args.files):
+            results.append(result)
+            status = result.get("error") or "%d/%d trees arranged" % (result["arranged"],
+                                                                      result["trees"])
+            print("%8.2fs  %s  %s" % (result["seconds"], result["file"], status))
+            for failure in result.get("failures", []):
+                print("           %s: %s" % (failure["tree"], failure["error"]))
+
+    failed_files = [result for result in results if "error" in result]
+    failed_trees = sum(len(result.get("failures", [])) for result in results)
+    summary = {
+        "files": len(results),
+        "failed_files": len(failed_files),
+        "trees": sum(result.get("trees", 0) for result in results),
+        "failed_trees": failed_trees,
+        "seconds": time.perf_counter() - start,
+    }
+    print("%(files)d files, %(failed_files)d failed; %(trees)d trees, %(failed_trees)d failed; "
+          "%(seconds).2fs" % summary)
+
+    if args.report is not None:
+        args.report.write_text(json.dumps({"summary": summary, "files": results}, indent=2))
+    return 1 if failed_files or failed_trees else 0
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+        return 0
+    return run_driver(args)
+
+
+if __name__ == "__main__":
+    # Inside Blender, the script's own arguments come after "--".
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
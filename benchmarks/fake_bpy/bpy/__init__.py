@@ -0,0 +1,51 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A small stand-in for Blender's bpy module, so that the add-on can be benchmarked with plain
+Python. It only covers what the add-on uses, and node trees behave like Blender's in the ways that
+matter for performance: links are indexed per socket, and nodes and links are removed in O(1).
+"""
+
+from types import SimpleNamespace
+
+from . import app, props, types, utils
+
+
+class _Addons(dict):
+    pass
+
+
+def _theme():
+    color = (0.2, 0.2, 0.2)
+    return SimpleNamespace(
+        node_editor=SimpleNamespace(input_node=color, node_backdrop=color + (1.0,),
+                                    wire=(0.0, 0.0, 0.0, 1.0)),
+        user_interface=SimpleNamespace(wcol_regular=SimpleNamespace(text=(0.9, 0.9, 0.9),
+                                                                    item=color + (1.0,))),
+    )
+
+
+context = SimpleNamespace(
+    preferences=SimpleNamespace(themes=[_theme()], addons=_Addons(),
+                                view=SimpleNamespace(font_path_ui="")),
+    window_manager=SimpleNamespace(clipboard=""),
+    screen=SimpleNamespace(areas=[]),
+    active_node=None,
+)
+
+data = SimpleNamespace(materials=[], worlds=[], scenes=[], node_groups=[])
+
+ops = SimpleNamespace(wm=SimpleNamespace(save_mainfile=lambda: {'FINISHED'}))
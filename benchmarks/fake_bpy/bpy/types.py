@@ -0,0 +1,218 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class Operator:
+    def report(self, level, message):
+        pass
+
+
+class AddonPreferences:
+    pass
+
+
+class _Menu:
+    @classmethod
+    def append(cls, function):
+        pass
+
+    @classmethod
+    def remove(cls, function):
+        pass
+
+
+NODE_MT_node = _Menu
+
+
+class Vector(list):
+    """Enough of mathutils.Vector for node locations and dimensions."""
+
+    @property
+    def x(self):
+        return self[0]
+
+    @x.setter
+    def x(self, value):
+        self[0] = value
+
+    @property
+    def y(self):
+        return self[1]
+
+    @y.setter
+    def y(self, value):
+        self[1] = value
+
+
+class NodeSocket:
+    def __init__(self, node, name, socket_type, is_output):
+        self.node = node
+        self.name = name
+        self.identifier = name
+        self.type = socket_type
+        self.is_output = is_output
+        self.enabled = True
+        self.hide = False
+        self.hide_value = False
+        self.links = []
+
+    @property
+    def is_linked(self):
+        return bool(self.links)
+
+    def as_pointer(self):
+        return id(self)
+
+
+class Node:
+    def __init__(self, node_tree, bl_idname, name):
+        self.id_data = node_tree
+        self.bl_idname = bl_idname
+        self.bl_label = bl_idname
+        self.type = 'REROUTE' if bl_idname == "NodeReroute" else 'CUSTOM'
+        self.name = name
+        self.label = ""
+        self.width = 140.0
+        self.location = Vector((0.0, 0.0))
+        self.dimensions = Vector((140.0, 100.0))
+        self.inputs = []
+        self.outputs = []
+        self.parent = None
+        self.hide = False
+        self.select = False
+        self.node_tree = None
+        if bl_idname == "NodeReroute":
+            self.width = 16.0
+            self.dimensions = Vector((16.0, 16.0))
+            self.inputs.append(NodeSocket(self, "Input", 'RGBA', False))
+            self.outputs.append(NodeSocket(self, "Output", 'RGBA', True))
+
+    def as_pointer(self):
+        return id(self)
+
+
+class Nodes:
+    def __init__(self, node_tree):
+        self.node_tree = node_tree
+        # Insertion-ordered, so removal is O(1) and iteration keeps creation order, as in Blender.
+        self.by_name = {}
+        self.active = None
+        self.name_counts = {}
+
+    def __iter__(self):
+        return iter(list(self.by_name.values()))
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.by_name[key]
+        return list(self.by_name.values())[key]
+
+    def get(self, name, default=None):
+        return self.by_name.get(name, default)
+
+    def new(self, bl_idname):
+        base = "Reroute" if bl_idname == "NodeReroute" else bl_idname
+        count = self.name_counts.get(base, 0)
+        self.name_counts[base] = count + 1
+        name = base if count == 0 else "%s.%03d" % (base, count)
+        node = Node(self.node_tree, bl_idname, name)
+        self.by_name[name] = node
+        return node
+
+    def remove(self, node):
+        for socket in node.inputs + node.outputs:
+            for link in list(socket.links):
+                self.node_tree.links.remove(link)
+        del self.by_name[node.name]
+
+    def foreach_get(self, attribute, sequence):
+        index = 0
+        for node in self.by_name.values():
+            for value in getattr(node, attribute):
+                sequence[index] = value
+                index += 1
+
+    def foreach_set(self, attribute, sequence):
+        index = 0
+        for node in self.by_name.values():
+            vector = getattr(node, attribute)
+            for component in range(len(vector)):
+                vector[component] = sequence[index]
+                index += 1
+
+
+class NodeLink:
+    def __init__(self, from_socket, to_socket):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+        self.from_node = from_socket.node
+        self.to_node = to_socket.node
+        self.is_valid = True
+        self.is_muted = False
+
+    def as_pointer(self):
+        return id(self)
+
+
+class NodeLinks:
+    def __init__(self, node_tree):
+        self.node_tree = node_tree
+        self.links = {}
+
+    def __iter__(self):
+        return iter(list(self.links))
+
+    def __len__(self):
+        return len(self.links)
+
+    def new(self, from_socket, to_socket):
+        # Like Blender, linking into an input that is already linked replaces the old link.
+        for link in list(to_socket.links):
+            self.remove(link)
+        link = NodeLink(from_socket, to_socket)
+        self.links[link] = None
+        from_socket.links.append(link)
+        to_socket.links.append(link)
+        return link
+
+    def remove(self, link):
+        del self.links[link]
+        link.from_socket.links.remove(link)
+        link.to_socket.links.remove(link)
+
+
+class NodeTree(dict):
+    """Also a dict, for custom properties."""
+
+    def __init__(self, name="NodeTree", bl_idname="ShaderNodeTree"):
+        super().__init__()
+        self.name = name
+        self.bl_idname = bl_idname
+        self.library = None
+        self.nodes = Nodes(self)
+        self.links = NodeLinks(self)
+
+    def __hash__(self):
+        return id(self)
+
+    def __eq__(self, other):
+        return self is other
+
+    def as_pointer(self):
+        return id(self)
@@ -0,0 +1,259 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times each phase of an arrange on synthetic trees of increasing size, without Blender.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --sizes 100 1000 --engines builtin --repeat 5
+    python benchmarks/run.py --engines graphviz --backend AUTO --parallel 8
+
+The add-on is loaded on top of the bpy stand-in in fake_bpy. Each phase is timed on its own:
+reroute cleanup, preparing the plan and writing DOT, layout (Graphviz or the built-in engine),
+parsing Graphviz's output, applying the layout to the tree, and scoring the result. Results,
+with the best time of each phase over the repeats, are printed and written as JSON for comparing
+releases. The whole arrange is also timed on its own, through Arranger.arrange as the operators
+run it, on another copy of the same tree.
+
+With --parallel, Graphviz also lays out that many graphs with render_all, as it does with the
+parts of a split tree or the frames at one level, and this is timed against laying them out one
+after another. A speedup near 1 means that the backend doesn't really run them at the same time.
+"""
+
+import argparse
+import importlib.util
+import json
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+PACKAGE_DIR = BENCHMARK_DIR.parent
+PACKAGE_NAME = "nodes_graphviz_arrange"
+
+sys.path.insert(0, str(BENCHMARK_DIR / "fake_bpy"))
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+import synthetic  # noqa: E402
+
+PHASES = ["reroute_cleanup", "prepare", "layout", "parse", "apply", "metrics"]
+
+
+def load_package():
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, PACKAGE_DIR / "__init__.py",
+                                                  submodule_search_locations=[str(PACKAGE_DIR)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    # The add-on only imports the backend, and NumPy, once it arranges something. Both are
+    # imported here so that the first run's phases don't time the imports.
+    importlib.import_module(PACKAGE_NAME + ".backend")
+    importlib.import_module("numpy")
+    return package
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark arranging synthetic node trees.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000, 20000],
+                        help="numbers of nodes to benchmark")
+    parser.add_argument("--engines", nargs="+", choices=["graphviz", "builtin"],
+                        default=["graphviz", "builtin"])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dot", help="dot executable; found on PATH by default")
+    parser.add_argument("--backend", default='SUBPROCESS',
+                        choices=['AUTO', 'LIBRARY', 'WORKER', 'SUBPROCESS'])
+    parser.add_argument("--format", default='plain-ext', choices=['plain-ext', 'json0'],
+                        help="format that Graphviz writes layouts in")
+    parser.add_argument("--max-graphviz-nodes", type=int, default=5000,
+                        help="skip Graphviz on larger trees, which can take minutes")
+    parser.add_argument("--parallel", type=int, default=0, metavar="GRAPHS",
+                        help="also time laying out this many graphs at once against one at a time")
+    parser.add_argument("--parallel-size", type=int, default=1000,
+                        help="nodes in each of the graphs laid out at once")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def timed(timings, phase, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+    return result
+
+
+def run_once(package, args, size, engine, layout_backend):
+    arrange = package.arrange
+    node_tree = synthetic.make_tree(size, seed=args.seed)
+    node_count, link_count = len(node_tree.nodes), len(node_tree.links)
+
+    # The same layout every time, whatever the size, so that releases can be compared.
+    options = package.preferences.ArrangeOptions(
+        layout_engine='BUILTIN' if engine == "builtin" else 'GRAPHVIZ',
+        quality_preset='BALANCED', time_budget=0.0, split_components=False,
+        use_layout_cache=False, layout_backend=args.backend,
+        layout_format=args.format)
+    arranger = arrange.Arranger(options)
+
+    timings = {}
+    timed(timings, "reroute_cleanup", arranger.remove_passthrough_reroute_nodes, node_tree)
+    # The reroutes are gone by now, so the cleanup that prepare_graph starts with is only a scan.
+    plan = timed(timings, "prepare", arranger.prepare_graph, node_tree)
+    if engine == "builtin":
+        layouts = timed(timings, "layout", arranger.builtin_layouts, plan)
+        timings["parse"] = 0.0
+    else:
+        outputs = timed(timings, "layout", package.backend.render_all, layout_backend,
+                        plan.dot_texts, args.format)
+        layouts = timed(timings, "parse", lambda: [
+            package.parse.parse_layout(output.decode(), args.format)
+            for output in outputs])
+    nodes_before = len(node_tree.nodes)
+    timed(timings, "apply", arranger.finish_arrange, plan, layouts)
+    # Scoring is off in the options, so that apply times the same work as an arrange in Blender.
+    timed(timings, "metrics", arranger.measure, plan)
+
+    # The phases one after another, as an arrange runs them, reroute cleanup included.
+    node_tree_copy = synthetic.make_tree(size, seed=args.seed)
+    start = time.perf_counter()
+    arrange.Arranger(options).arrange(node_tree_copy, layout_backend)
+    arrange_time = time.perf_counter() - start
+
+    # Counts are of the tree as generated, reroutes included.
+    return {
+        "nodes": node_count,
+        "links": link_count,
+        "dot_bytes": sum(len(dot_text) for dot_text in plan.dot_texts),
+        "reroutes_created": len(node_tree.nodes) - nodes_before,
+        "metrics": plan.metrics.as_dict(),
+        "timings": timings,
+        "arrange": arrange_time,
+    }
+
+
+def run_parallel(package, args, layout_backend):
+    """Times render_all on args.parallel different graphs against rendering them one by one."""
+    arrange = package.arrange
+    options = package.preferences.ArrangeOptions(
+        layout_engine='GRAPHVIZ', quality_preset='BALANCED', time_budget=0.0,
+        split_components=False, use_layout_cache=False, layout_backend=args.backend,
+        layout_format=args.format)
+    arranger = arrange.Arranger(options)
+    dot_texts = []
+    for index in range(args.parallel):
+        node_tree = synthetic.make_tree(args.parallel_size, seed=args.seed + index)
+        dot_texts += arranger.prepare_graph(node_tree).dot_texts
+
+    serial, parallel = [], []
+    for _ in range(max(1, args.repeat)):
+        start = time.perf_counter()
+        for dot_text in dot_texts:
+            layout_backend.render(dot_text, args.format)
+        serial.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        package.backend.render_all(layout_backend, dot_texts, args.format)
+        parallel.append(time.perf_counter() - start)
+    return {
+        "graphs": len(dot_texts),
+        "size": args.parallel_size,
+        "one_at_a_time": min(serial),
+        "at_once": min(parallel),
+        "speedup": min(serial) / min(parallel),
+    }
+
+
+def graphviz_version(dot_path):
+    try:
+        result = subprocess.run([dot_path, "-V"], capture_output=True, text=True, timeout=10)
+        return (result.stderr or result.stdout).strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PACKAGE_DIR,
+                                capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv):
+    args = parse_args(argv)
+    package = load_package()
+
+    dot_path = args.dot or shutil.which("dot")
+    engines = list(args.engines)
+    if "graphviz" in engines and dot_path is None:
+        print("dot wasn't found, so Graphviz is skipped", file=sys.stderr)
+        engines.remove("graphviz")
+    layout_backend = None
+    if "graphviz" in engines:
+        layout_backend = package.backend.get_backend(dot_path, args.backend)
+
+    results = []
+    print("%-9s %7s %7s %7s  " % ("engine", "size", "nodes", "links") +
+          " ".join("%15s" % phase for phase in PHASES + ["total", "arrange"]))
+    try:
+        for engine in engines:
+            for size in args.sizes:
+                if engine == "graphviz" and size > args.max_graphviz_nodes:
+                    continue
+                runs = [run_once(package, args, size, engine, layout_backend)
+                        for _ in range(max(1, args.repeat))]
+                result = dict(engine=engine, size=size, repeat=len(runs), **runs[0])
+                result["timings"] = {phase: min(run["timings"][phase] for run in runs)
+                                     for phase in PHASES}
+                result["timings"]["total"] = min(sum(run["timings"].values()) for run in runs)
+                result["arrange"] = min(run["arrange"] for run in runs)
+                results.append(result)
+                print("%-9s %7d %7d %7d  " % (engine, size, result["nodes"], result["links"]) +
+                      " ".join("%14.4fs" % result["timings"][phase] for phase in PHASES + ["total"]) +
+                      " %14.4fs" % result["arrange"])
+        if args.parallel > 0 and layout_backend is not None:
+            parallel = run_parallel(package, args, layout_backend)
+            print("%d graphs of %d nodes: %.4fs one at a time, %.4fs at once (%.2fx)" % (
+                parallel["graphs"], parallel["size"], parallel["one_at_a_time"],
+                parallel["at_once"], parallel["speedup"]))
+        else:
+            parallel = None
+    finally:
+        package.backend.shutdown_backends()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "graphviz": graphviz_version(dot_path) if "graphviz" in engines else None,
+            "backend": args.backend,
+            "format": args.format,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+        "parallel": parallel,
+    }
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,99 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic node trees that look like real ones, for benchmarking.
+
+Nodes have a few inputs and outputs of mixed types, and mostly take their inputs from nodes made
+shortly before them, so trees come out long and fairly narrow, like real shader and geometry trees.
+Some outputs feed several nodes, and some links run through chains of reroutes, like the ones
+earlier arranges leave behind.
+"""
+
+import random
+
+import bpy
+
+# Pixel sizes, as node.dimensions reports them at a UI scale of 1.
+SOCKET_HEIGHT = 22.0
+HEADER_HEIGHT = 30.0
+VECTOR_FIELD_HEIGHT = 66.0
+
+SOCKET_TYPES = ['VALUE', 'VALUE', 'VALUE', 'RGBA', 'VECTOR', 'SHADER', 'GEOMETRY']
+
+
+def make_tree(node_count, seed=0, reroute_fraction=0.1, fan_out_fraction=0.2, locality=12):
+    """Builds a tree with node_count nodes, not counting reroutes.
+
+    About reroute_fraction of links run through a chain of one to four reroutes, and about
+    fan_out_fraction of outputs feed more than one node. Inputs are linked from within the last
+    locality nodes.
+    """
+    rng = random.Random(seed)
+    node_tree = bpy.types.NodeTree(name="Synthetic%d" % node_count)
+    nodes = []
+    for node_index in range(node_count):
+        node = node_tree.nodes.new("ShaderNodeSynthetic%d" % rng.randrange(24))
+        for input_index in range(rng.choice([1, 2, 2, 3, 3, 4, 5, 8])):
+            socket = bpy.types.NodeSocket(node, "Input %d" % input_index, rng.choice(SOCKET_TYPES),
+                                          False)
+            socket.enabled = rng.random() > 0.05
+            node.inputs.append(socket)
+        for output_index in range(rng.choice([1, 1, 1, 2, 2, 3, 4])):
+            node.outputs.append(bpy.types.NodeSocket(node, "Output %d" % output_index,
+                                                     rng.choice(SOCKET_TYPES), True))
+        node.width = rng.choice([140.0, 140.0, 150.0, 240.0])
+        nodes.append(node)
+
+    for node_index, node in enumerate(nodes[1:], start=1):
+        for socket in node.inputs:
+            if not socket.enabled or rng.random() < 0.3:
+                continue
+            source = nodes[rng.randrange(max(0, node_index - locality), node_index)]
+            output = rng.choice(source.outputs)
+            link_through_reroutes(node_tree, rng, output, socket, reroute_fraction)
+            if rng.random() < fan_out_fraction:
+                # Send the same output on to a few later nodes too.
+                for target in rng.sample(nodes[node_index:node_index + locality],
+                                         min(rng.randint(1, 3), len(nodes) - node_index)):
+                    free_inputs = [other for other in target.inputs
+                                   if other.enabled and not other.is_linked]
+                    if free_inputs and target is not source:
+                        link_through_reroutes(node_tree, rng, output, rng.choice(free_inputs),
+                                              reroute_fraction)
+
+    for node in nodes:
+        update_dimensions(node)
+    return node_tree
+
+
+def link_through_reroutes(node_tree, rng, from_socket, to_socket, reroute_fraction):
+    if rng.random() < reroute_fraction:
+        for _ in range(rng.randint(1, 4)):
+            reroute = node_tree.nodes.new("NodeReroute")
+            node_tree.links.new(from_socket, reroute.inputs[0])
+            from_socket = reroute.outputs[0]
+    node_tree.links.new(from_socket, to_socket)
+
+
+def update_dimensions(node):
+    """Sets dimensions the way Blender would draw the node."""
+    height = HEADER_HEIGHT + SOCKET_HEIGHT * sum(1 for socket in node.outputs if socket.enabled)
+    for socket in node.inputs:
+        if socket.enabled:
+            height += SOCKET_HEIGHT
+            if socket.type == 'VECTOR' and not socket.is_linked:
+                height += VECTOR_FIELD_HEIGHT
+    node.dimensions = bpy.types.Vector((node.width, height))
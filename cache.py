@@ -0,0 +1,103 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+from pathlib import Path
+
+import bpy
+
+from .parse import EdgeRoute, GraphLayout
+from .util import LRUCache, logger
+
+
+def layout_key(dot_text, graphviz_version=""):
+    """Hashes a graph. The DOT text already describes everything that affects the layout: node
+    sizes, visible sockets, links and the spacing preferences. Only the Graphviz version is
+    added."""
+    return hashlib.sha256((graphviz_version + "\n" + dot_text).encode()).hexdigest()
+
+
+def layout_to_json(layout):
+    return json.dumps({
+        "nodes": [[node_id] + list(box) for node_id, box in layout.nodes.items()],
+        "edges": [[edge.from_node, edge.from_socket, edge.to_node, edge.to_socket,
+                   edge.waypoints] for edge in layout.edges],
+    })
+
+
+def layout_from_json(text):
+    data = json.loads(text)
+    layout = GraphLayout()
+    for node_id, *box in data["nodes"]:
+        layout.nodes[node_id] = tuple(box)
+    for from_node, from_socket, to_node, to_socket, waypoints in data["edges"]:
+        layout.edges.append(EdgeRoute(from_node, from_socket, to_node, to_socket,
+                                      [tuple(waypoint) for waypoint in waypoints]))
+    return layout
+
+
+class LayoutCache:
+    """Finished layouts, looked up by layout_key.
+
+    Layouts are kept in memory, and also written to directory if one is given, so that they survive
+    restarts.
+    """
+
+    def __init__(self, max_size=256):
+        self.memory = LRUCache(max_size=max_size)
+        self.directory = None
+
+    def get(self, key):
+        layout = self.memory.get(key)
+        if layout is not None or self.directory is None:
+            return layout
+
+        path = self.directory / (key + ".json")
+        try:
+            layout = layout_from_json(path.read_text())
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self.memory.put(key, layout)
+        return layout
+
+    def put(self, key, layout):
+        self.memory.put(key, layout)
+        if self.directory is None:
+            return
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / (key + ".json")).write_text(layout_to_json(layout))
+        except OSError as e:
+            logger().warning("Couldn't write to the layout cache: %s" % e)
+
+    def set_directory(self, directory):
+        self.directory = None if directory is None else Path(directory)
+
+    def clear(self):
+        self.memory.clear()
+
+
+LAYOUT_CACHE = LayoutCache()
+
+
+def cache_directory():
+    """Where persisted layouts go: the extension's user directory, if it's running as one."""
+    try:
+        return bpy.utils.extension_path_user(__package__, path="layout_cache", create=True)
+    except (AttributeError, ValueError, OSError):
+        return None
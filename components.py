@@ -0,0 +1,124 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+from .parse import EdgeRoute, GraphLayout
+
+# Components smaller than this are bundled together into one Graphviz job, as starting a job costs
+# more than laying out a handful of nodes.
+MIN_JOB_SIZE = 32
+
+
+def split_components(all_nodes, link_keys, skipped=()):
+    """Splits a graph into Graphviz jobs along its weakly connected components.
+
+    Returns a list of (node indices, link keys) pairs. Large components get a job each; small ones
+    are bundled together. Nodes whose indices are in skipped are left out.
+    """
+    name_to_index = {node.name: node_index for node_index, node in enumerate(all_nodes)}
+
+    # Union-find with path halving.
+    parents = list(range(len(all_nodes)))
+
+    def find(node_index):
+        while parents[node_index] != node_index:
+            parents[node_index] = parents[parents[node_index]]
+            node_index = parents[node_index]
+        return node_index
+
+    for from_name, _, to_name, _ in link_keys:
+        from_root, to_root = find(name_to_index[from_name]), find(name_to_index[to_name])
+        if from_root != to_root:
+            parents[from_root] = to_root
+
+    components = {}
+    for node_index in range(len(all_nodes)):
+        if node_index in skipped:
+            continue
+        components.setdefault(find(node_index), ([], []))[0].append(node_index)
+    for link_key in link_keys:
+        components[find(name_to_index[link_key[0]])][1].append(link_key)
+
+    jobs, bundle = [], ([], [])
+    for node_indices, component_links in sorted(components.values(),
+                                                key=lambda component: -len(component[0])):
+        if len(node_indices) >= MIN_JOB_SIZE:
+            jobs.append((node_indices, component_links))
+            continue
+        bundle[0].extend(node_indices)
+        bundle[1].extend(component_links)
+        if len(bundle[0]) >= MIN_JOB_SIZE:
+            jobs.append(bundle)
+            bundle = ([], [])
+    if bundle[0]:
+        jobs.append(bundle)
+    return jobs
+
+
+def layout_bounds(layout):
+    """Returns (left, bottom, right, top) of everything in a layout."""
+    xs, ys = [], []
+    for x, y, width, height in layout.nodes.values():
+        xs += (x - width * 0.5, x + width * 0.5)
+        ys += (y - height * 0.5, y + height * 0.5)
+    for edge in layout.edges:
+        for x, y in edge.waypoints:
+            xs.append(x)
+            ys.append(y)
+    if not xs:
+        return 0.0, 0.0, 0.0, 0.0
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def pack_layouts(layouts, spacing):
+    """Combines separately laid-out parts of a graph into one layout.
+
+    Parts are packed into shelves, tallest first, aiming for a roughly square result. A single
+    layout is returned untouched.
+    """
+    if len(layouts) == 1:
+        return layouts[0]
+
+    parts = [(layout, layout_bounds(layout)) for layout in layouts]
+    parts.sort(key=lambda part: -(part[1][3] - part[1][1]))
+
+    total_area = sum((right - left + spacing) * (top - bottom + spacing)
+                     for _, (left, bottom, right, top) in parts)
+    widest = max(right - left for _, (left, _, right, _) in parts)
+    shelf_width = max(widest, math.sqrt(total_area))
+
+    packed = GraphLayout()
+    shelf_x, shelf_top, shelf_height = 0.0, 0.0, 0.0
+    for layout, (left, bottom, right, top) in parts:
+        width, height = right - left, top - bottom
+        if shelf_x > 0.0 and shelf_x + width > shelf_width:
+            shelf_x = 0.0
+            shelf_top -= shelf_height + spacing
+            shelf_height = 0.0
+
+        dx, dy = shelf_x - left, shelf_top - top
+        for node_index, (x, y, node_width, node_height) in layout.nodes.items():
+            packed.nodes[node_index] = (x + dx, y + dy, node_width, node_height)
+        for edge in layout.edges:
+            packed.edges.append(EdgeRoute(edge.from_node, edge.from_socket, edge.to_node,
+                                          edge.to_socket,
+                                          [(x + dx, y + dy) for x, y in edge.waypoints]))
+
+        shelf_x += width + spacing
+        shelf_height = max(shelf_height, height)
+
+    return packed
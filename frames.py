@@ -0,0 +1,178 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lays out the contents of every frame on its own, then the frames as single nodes.
+
+Every frame with nodes in it is a cluster. The nodes directly in a cluster are laid out together,
+with the frames inside it standing in for their contents as plain boxes. Clusters are laid out
+innermost first, a level at a time, as a frame's box is only known once its contents are. Each
+cluster is a graph of its own, so clusters of a level run in parallel and unchanged ones come
+from the layout cache.
+"""
+
+from .components import layout_bounds
+from .parse import EdgeRoute, GraphLayout
+
+# Socket index of links that are written to a cluster's graph between frames rather than sockets.
+FRAME_SOCKET = -1
+
+
+class FrameHierarchy:
+    """The clusters of a tree and their layouts.
+
+    Clusters are keyed by the index of their frame, or None for the nodes that aren't in any frame.
+    levels lists them innermost first, ending with [None]. stage is the index of the level being
+    laid out.
+    """
+
+    def __init__(self, all_nodes, link_keys, skipped=()):
+        name_to_index = {node.name: node_index for node_index, node in enumerate(all_nodes)}
+        parents = [None] * len(all_nodes)
+        for node_index, node in enumerate(all_nodes):
+            if node_index not in skipped and node.parent is not None:
+                parents[node_index] = name_to_index.get(node.parent.name)
+        self.parents = parents
+
+        self.members = {None: []}
+        for node_index in range(len(all_nodes)):
+            if node_index not in skipped:
+                self.members.setdefault(parents[node_index], []).append(node_index)
+        # Frames with nothing in them are laid out as ordinary nodes.
+        self.members = {cluster: members for cluster, members in self.members.items()
+                        if members or cluster is None}
+
+        depths = {cluster: len(self.ancestors(cluster)) + 1 for cluster in self.members
+                  if cluster is not None}
+        deepest = max(depths.values(), default=0)
+        self.levels = [sorted(cluster for cluster in self.members
+                              if cluster is not None and depths[cluster] == depth)
+                       for depth in range(deepest, 0, -1)] + [[None]]
+
+        # A link belongs to the innermost cluster that holds both of its ends. There it joins the
+        # nodes or frames of that cluster that its ends are in, between frames rather than sockets.
+        self.links = {cluster: {} for cluster in self.members}
+        for link_key in link_keys:
+            from_index, to_index = name_to_index[link_key[0]], name_to_index[link_key[2]]
+            from_path = [from_index] + self.ancestors(from_index)
+            to_path = [to_index] + self.ancestors(to_index)
+            to_clusters = set(to_path[1:]) | {None}
+            for from_member in from_path:
+                cluster = parents[from_member]
+                if cluster in to_clusters:
+                    break
+            to_member = to_path[to_path.index(cluster) - 1] if cluster is not None else to_path[-1]
+            key = (all_nodes[from_member].name,
+                   link_key[1] if from_member == from_index else FRAME_SOCKET,
+                   all_nodes[to_member].name,
+                   link_key[3] if to_member == to_index else FRAME_SOCKET)
+            # Links between the same frames are only written once.
+            self.links[cluster][key] = None
+
+        self.stage = 0
+        self.layouts = {}
+        # The box of every laid-out frame, and where its contents sit in it, in inches.
+        self.sizes = {}
+        self.insets = {}
+
+    def ancestors(self, node_index):
+        """The frames that a node is in, innermost first."""
+        chain = []
+        cluster = self.parents[node_index]
+        while cluster is not None:
+            chain.append(cluster)
+            cluster = self.parents[cluster]
+        return chain
+
+    def jobs(self):
+        """The (node indices, link keys) of every cluster in the current level."""
+        return [(self.members[cluster], list(self.links[cluster]))
+                for cluster in self.levels[self.stage]]
+
+    @property
+    def done(self):
+        return self.stage == len(self.levels) - 1
+
+    def store(self, layouts, margins):
+        """Keeps the layouts of the current level, in its order, and works out the box of each of
+        its frames. margins gives the (side, top) space of every frame, in inches."""
+        for cluster, layout in zip(self.levels[self.stage], layouts):
+            self.layouts[cluster] = layout
+            if cluster is None:
+                continue
+            left, bottom, right, top = layout_bounds(layout)
+            side, top_margin = margins[cluster]
+            self.sizes[cluster] = (right - left + side * 2.0, top - bottom + side + top_margin)
+            self.insets[cluster] = (side - left, -top_margin - top)
+
+    def compose(self):
+        """Puts the layouts of all clusters together into one layout of the whole tree, each
+        frame's contents inside the box that its frame was given."""
+        composed = GraphLayout()
+        offsets = {None: (0.0, 0.0)}
+        for level in reversed(self.levels):
+            for cluster in level:
+                dx, dy = offsets[cluster]
+                layout = self.layouts[cluster]
+                for node_index, (x, y, width, height) in layout.nodes.items():
+                    x, y = x + dx, y + dy
+                    composed.nodes[node_index] = (x, y, width, height)
+                    if node_index in self.insets:
+                        inset_x, inset_y = self.insets[node_index]
+                        offsets[node_index] = (x - width * 0.5 + inset_x,
+                                               y + height * 0.5 + inset_y)
+                for edge in layout.edges:
+                    if edge.from_socket == FRAME_SOCKET or edge.to_socket == FRAME_SOCKET:
+                        continue
+                    composed.edges.append(EdgeRoute(edge.from_node, edge.from_socket, edge.to_node,
+                                                    edge.to_socket,
+                                                    [(x + dx, y + dy) for x, y in edge.waypoints]))
+        return composed
+
+
+def absolute_locations(all_nodes, locations, parents):
+    """Turns the parent-relative locations of nodes, as [x0, y0, x1, y1, ...], into locations in
+    the node editor. parents holds the index of each node's frame, or None."""
+    absolute = list(locations)
+    for node_index in range(len(all_nodes)):
+        cluster = parents[node_index]
+        while cluster is not None:
+            absolute[node_index * 2] += locations[cluster * 2]
+            absolute[node_index * 2 + 1] += locations[cluster * 2 + 1]
+            cluster = parents[cluster]
+    return absolute
+
+
+def relative_locations(all_nodes, absolute, parents):
+    """The inverse of absolute_locations."""
+    locations = list(absolute)
+    for node_index in range(len(all_nodes)):
+        cluster = parents[node_index]
+        if cluster is not None:
+            locations[node_index * 2] -= absolute[cluster * 2]
+            locations[node_index * 2 + 1] -= absolute[cluster * 2 + 1]
+    return locations
+
+
+def node_parents(all_nodes):
+    """The index of each node's frame, or None. None altogether if no node is in a frame."""
+    name_to_index = None
+    parents = [None] * len(all_nodes)
+    for node_index, node in enumerate(all_nodes):
+        if node.parent is not None:
+            if name_to_index is None:
+                name_to_index = {other.name: index for index, other in enumerate(all_nodes)}
+            parents[node_index] = name_to_index[node.parent.name]
+    return parents if name_to_index is not None else None
@@ -0,0 +1,248 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+import numpy as np
+
+from .frames import absolute_locations, node_parents
+from .parse import EdgeRoute, GraphLayout
+from .util import logger
+
+# Custom property on the node tree that remembers the last arrangement.
+STATE_PROPERTY = "graphviz_arrange_state"
+
+# If more than this fraction of the nodes changed, a full layout is both faster and nicer.
+MAX_DIRTY_FRACTION = 0.5
+
+# Nodes that moved by less than this many units since the last arrange count as untouched.
+MOVE_TOLERANCE = 0.5
+
+# Boxes that overlap by less than this many units don't count as overlapping.
+OVERLAP_TOLERANCE = 1.0
+
+# Moved nodes are checked for overlaps against the untouched ones this many at a time.
+OVERLAP_BATCH = 256
+
+
+def node_signature(node, visible_sockets):
+    """Everything about a node that affects its layout, as a string that can be stored."""
+    return repr((node.bl_idname, round(node.dimensions[0], 1), round(node.dimensions[1], 1),
+                 visible_sockets))
+
+
+def route_key(link_key):
+    return "%s\x1f%d\x1f%s\x1f%d" % link_key
+
+
+def load_state(node_tree):
+    text = node_tree.get(STATE_PROPERTY)
+    if not isinstance(text, str):
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def save_state(node_tree, all_nodes, signatures, link_keys, layout, dpi):
+    """Remembers where every node ended up, the links between them, and the reroute waypoints of
+    every link, so that the next arrange can tell what changed."""
+    locations = [0.0] * (len(node_tree.nodes) * 2)
+    node_tree.nodes.foreach_get("location", locations)
+
+    nodes = {}
+    for node_index, node in enumerate(all_nodes):
+        nodes[node.name] = [locations[node_index * 2], locations[node_index * 2 + 1],
+                            signatures[node_index]]
+
+    routes = {}
+    for edge in layout.edges:
+        if edge.waypoints:
+            link_key = (all_nodes[edge.from_node].name, edge.from_socket,
+                        all_nodes[edge.to_node].name, edge.to_socket)
+            routes[route_key(link_key)] = [[x * dpi, y * dpi] for x, y in edge.waypoints]
+
+    node_tree[STATE_PROPERTY] = json.dumps({
+        "nodes": nodes,
+        "links": [list(link_key) for link_key in link_keys],
+        "routes": routes,
+    })
+
+
+class IncrementalLayout:
+    """Plans a re-layout of only the part of a tree that changed since it was last arranged.
+
+    Nodes that were added, changed shape, were moved by hand, or were rewired are dirty.
+    They are laid out together with their direct neighbors, which give Graphviz the context to
+    place them sensibly. The result is then translated so that those neighbors stay where they are,
+    and only the dirty nodes move. Reroutes between untouched nodes are restored from the last run.
+
+    Graphviz can't be told to keep the untouched nodes where they are, so the dirty nodes can end
+    up on top of them. The caller checks the merged layout with overlaps, and lays out the whole
+    tree instead if they do.
+
+    locations are where every node is in the editor, not relative to its frame.
+    """
+
+    def __init__(self, all_nodes, dirty, context_nodes, locations, restored_routes, skipped=()):
+        self.all_nodes = all_nodes
+        self.dirty = dirty
+        self.context_nodes = context_nodes
+        self.subset = dirty | context_nodes
+        self.locations = locations
+        self.restored_routes = restored_routes
+        self.skipped = skipped
+
+    @classmethod
+    def plan(cls, node_tree, all_nodes, signatures, link_keys, state, dpi, skipped=()):
+        """Returns a plan, or None if the whole tree should be laid out. Nodes whose indices are
+        in skipped are never laid out, so they don't count as changed."""
+        if state is None or not all_nodes:
+            return None
+
+        locations = [0.0] * (len(node_tree.nodes) * 2)
+        node_tree.nodes.foreach_get("location", locations)
+        name_to_index = {node.name: node_index for node_index, node in enumerate(all_nodes)}
+
+        dirty = set()
+        old_nodes = state.get("nodes", {})
+        for node_index, node in enumerate(all_nodes):
+            if node_index in skipped:
+                continue
+            old = old_nodes.get(node.name)
+            if old is None or old[2] != signatures[node_index] or \
+                    abs(old[0] - locations[node_index * 2]) > MOVE_TOLERANCE or \
+                    abs(old[1] - locations[node_index * 2 + 1]) > MOVE_TOLERANCE:
+                dirty.add(node_index)
+
+        # A link to or from a node that is already being laid out is taken care of along with it.
+        # A link rewired between two untouched nodes moves the node it feeds into.
+        old_links = {tuple(link_key) for link_key in state.get("links", [])}
+        new_links = set(link_keys)
+        for from_name, _, to_name, _ in old_links ^ new_links:
+            from_index, to_index = name_to_index.get(from_name), name_to_index.get(to_name)
+            if to_index is not None and from_index not in dirty and to_index not in dirty:
+                dirty.add(to_index)
+
+        if len(dirty) > MAX_DIRTY_FRACTION * len(all_nodes):
+            logger().info("%d of %d nodes changed, laying out everything" %
+                          (len(dirty), len(all_nodes)))
+            return None
+
+        context_nodes = set()
+        for from_name, _, to_name, _ in link_keys:
+            from_index, to_index = name_to_index[from_name], name_to_index[to_name]
+            if from_index in dirty and to_index not in dirty:
+                context_nodes.add(to_index)
+            elif to_index in dirty and from_index not in dirty:
+                context_nodes.add(from_index)
+
+        old_routes = state.get("routes", {})
+        restored_routes = []
+        for link_key in link_keys:
+            from_index, to_index = name_to_index[link_key[0]], name_to_index[link_key[2]]
+            if from_index in dirty or to_index in dirty:
+                continue
+            waypoints = old_routes.get(route_key(link_key))
+            if waypoints:
+                restored_routes.append(EdgeRoute(from_index, link_key[1], to_index, link_key[3],
+                                                 [(x / dpi, y / dpi) for x, y in waypoints]))
+
+        parents = node_parents(all_nodes)
+        if parents is not None:
+            locations = absolute_locations(all_nodes, locations, parents)
+
+        logger().info("Incremental arrange: %d changed nodes, %d neighbors" %
+                      (len(dirty), len(context_nodes)))
+        return cls(all_nodes, dirty, context_nodes, locations, restored_routes, skipped)
+
+    def merge(self, layout, dpi, rank_sep):
+        """Turns the layout of the subset into a layout of the whole tree."""
+        dx, dy = self.offset(layout, dpi, rank_sep)
+
+        merged = GraphLayout()
+        for node_index in self.dirty:
+            if node_index in layout.nodes:
+                x, y, width, height = layout.nodes[node_index]
+                merged.nodes[node_index] = (x + dx, y + dy, width, height)
+
+        for edge in layout.edges:
+            # Routes to untouched neighbors were computed for where Graphviz put them, not where
+            # they really are, so those links are left straight.
+            if edge.from_node in self.dirty and edge.to_node in self.dirty:
+                merged.edges.append(EdgeRoute(
+                    edge.from_node, edge.from_socket, edge.to_node, edge.to_socket,
+                    [(x + dx, y + dy) for x, y in edge.waypoints]))
+        merged.edges += self.restored_routes
+        return merged
+
+    def still_nodes(self):
+        """The indices of the nodes that a merged layout leaves where they are, apart from frames
+        and reroutes, which other nodes may sit on."""
+        return [node_index for node_index, node in enumerate(self.all_nodes)
+                if node_index not in self.dirty and node_index not in self.skipped and
+                node.bl_idname not in ("NodeFrame", "NodeReroute")]
+
+    def overlaps(self, merged, sizes, dpi):
+        """Whether any node that a merged layout moves would overlap one that stays where it is.
+        sizes maps the index of each node of still_nodes to its (width, height) in units."""
+        still = self.still_nodes()
+        if not still or not merged.nodes:
+            return False
+        lefts = np.array([self.locations[node_index * 2] for node_index in still]) / dpi
+        tops = np.array([self.locations[node_index * 2 + 1] for node_index in still]) / dpi
+        widths, heights = (np.array(dimension) / dpi
+                           for dimension in zip(*(sizes[node_index] for node_index in still)))
+        rights, bottoms = lefts + widths, tops - heights
+
+        moved = np.array(list(merged.nodes.values()))
+        tolerance = OVERLAP_TOLERANCE / dpi
+        moved_lefts = moved[:, 0] - moved[:, 2] * 0.5 + tolerance
+        moved_rights = moved[:, 0] + moved[:, 2] * 0.5 - tolerance
+        moved_bottoms = moved[:, 1] - moved[:, 3] * 0.5 + tolerance
+        moved_tops = moved[:, 1] + moved[:, 3] * 0.5 - tolerance
+        for start in range(0, len(moved), OVERLAP_BATCH):
+            batch = slice(start, start + OVERLAP_BATCH)
+            overlap = (moved_lefts[batch, None] < rights) & (moved_rights[batch, None] > lefts) & \
+                (moved_bottoms[batch, None] < tops) & (moved_tops[batch, None] > bottoms)
+            if overlap.any():
+                return True
+        return False
+
+    def offset(self, layout, dpi, rank_sep):
+        """The translation, in inches, that puts the context nodes back where they really are."""
+        anchors = [node_index for node_index in self.context_nodes if node_index in layout.nodes]
+        if anchors:
+            dx = dy = 0.0
+            for node_index in anchors:
+                x, y, width, height = layout.nodes[node_index]
+                dx += self.locations[node_index * 2] / dpi - (x - width * 0.5)
+                dy += self.locations[node_index * 2 + 1] / dpi - (y + height * 0.5)
+            return dx / len(anchors), dy / len(anchors)
+
+        # Nothing connects the changed nodes to the rest, so put them to the right of it.
+        pinned = [node_index for node_index in range(len(self.all_nodes))
+                  if node_index not in self.dirty]
+        laid_out = list(layout.nodes.values())
+        if not pinned or not laid_out:
+            return 0.0, 0.0
+        right = max(self.locations[node_index * 2] + self.all_nodes[node_index].width
+                    for node_index in pinned)
+        top = max(self.locations[node_index * 2 + 1] for node_index in pinned)
+        left = min(x - width * 0.5 for x, _, width, _ in laid_out)
+        laid_out_top = max(y + height * 0.5 for _, y, _, height in laid_out)
+        return (right + rank_sep) / dpi - left, top / dpi - laid_out_top
@@ -0,0 +1,124 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Phase timings and counters of arrange runs, for finding out where the time goes."""
+
+import time
+from contextlib import nullcontext
+
+from .util import logger
+
+# Handed out for every phase when timing is off, so that a disabled phase costs one call.
+NO_PHASE = nullcontext()
+
+
+class PhaseTimer:
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class ArrangeStats:
+    """Times the phases of one arrange and counts what it handled.
+
+    Phases are timed with `with stats.phase("write_dot"):` and add up if entered again, e.g. once
+    per node tree. When enabled is False nothing is timed or counted. If profile_path is set, the
+    whole run is also profiled with cProfile and the result saved there, for snakeviz or pstats.
+    """
+
+    def __init__(self, enabled=False, profile_path=""):
+        self.enabled = enabled
+        self.profile_path = profile_path
+        self.profiler = None
+        self.phases = {}
+        self.counters = {}
+        self.start_time = time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return NO_PHASE
+        return PhaseTimer(self, name)
+
+    def add_time(self, name, seconds):
+        if self.enabled:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def start_profile(self):
+        if not self.profile_path or self.profiler is not None:
+            return
+        import cProfile
+
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        try:
+            self.profiler.dump_stats(self.profile_path)
+            logger().info("Saved arrange profile to %s" % self.profile_path)
+        except OSError as e:
+            logger().warning("Couldn't save arrange profile to %s: %s" % (self.profile_path, e))
+        self.profiler = None
+
+    def as_dict(self):
+        return {
+            "total_seconds": time.perf_counter() - self.start_time,
+            "phases": dict(self.phases),
+            "counters": dict(self.counters),
+        }
+
+    def summary(self):
+        stats = self.as_dict()
+        phases = ", ".join("%s %s" % (name, format_seconds(seconds))
+                           for name, seconds in stats["phases"].items())
+        counters = ", ".join("%d %s" % (amount, name.replace("_", " "))
+                             for name, amount in stats["counters"].items())
+        return "Took %s: %s; %s" % (format_seconds(stats["total_seconds"]), phases or "no phases",
+                                    counters or "nothing counted")
+
+    def finish(self):
+        """Stops profiling and logs the stats, with the numbers attached to the record as
+        `arrange_stats` for handlers that want them structured. Returns the summary, or None if
+        disabled."""
+        self.stop_profile()
+        if not self.enabled:
+            return None
+        summary = self.summary()
+        logger("stats").info(summary, extra={"arrange_stats": self.as_dict()})
+        return summary
+
+
+def format_seconds(seconds):
+    if seconds < 1.0:
+        return "%.1fms" % (seconds * 1000.0)
+    return "%.2fs" % seconds
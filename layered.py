@@ -0,0 +1,390 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A layered (Sugiyama-style) layout engine that runs in Blender's Python, without Graphviz.
+
+It follows the same steps as dot: break cycles, assign ranks, add a dummy node wherever an edge
+spans several ranks, order each rank to reduce crossings, then assign coordinates. Ranks run from
+left to right, like rankdir=LR. Dummy nodes become the waypoints of edges, as dot's bends do.
+"""
+
+import numpy as np
+
+from .parse import EdgeRoute, GraphLayout
+
+# Crossing reduction sweeps, each going left to right and back.
+ORDER_SWEEPS = 4
+
+# Passes that move nodes up or down to straighten edges, alternating direction.
+STRAIGHTEN_PASSES = 6
+
+# How strongly edges pull on the nodes at their ends when straightening. Edges between dummy nodes
+# pull hardest, so long edges end up straight, as with dot's weights for virtual edges.
+REAL_EDGE_WEIGHT = 1.0
+MIXED_EDGE_WEIGHT = 2.0
+DUMMY_EDGE_WEIGHT = 8.0
+
+# Tie-breaking weight of port positions when ordering, small enough to never override a rank order.
+PORT_ORDER_WEIGHT = 0.01
+
+
+def layered_layout(node_ids, sizes, edges, ports, node_sep, rank_sep):
+    """Lays out a graph, returning a GraphLayout just as if dot had laid it out.
+
+    node_ids names each node, as in the DOT file, and sizes gives each node's (width, height).
+    edges are (from node id, from socket, to node id, to socket), and ports, for each edge, where
+    it leaves its first node and enters its second, measured down from the top of the node. All
+    lengths are in inches.
+    """
+    node_count = len(node_ids)
+    layout = GraphLayout()
+    if node_count == 0:
+        return layout
+
+    position = {node_id: index for index, node_id in enumerate(node_ids)}
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 2)
+    edge_array = np.asarray([(position[from_id], position[to_id]) for from_id, _, to_id, _ in edges],
+                            dtype=np.int64).reshape(-1, 2)
+    port_array = np.asarray(ports, dtype=np.float64).reshape(-1, 2)
+
+    # Self-loops can't be drawn in a layered layout; they are left as plain links.
+    laid_out = np.flatnonzero(edge_array[:, 0] != edge_array[:, 1])
+    tails, heads = edge_array[laid_out, 0], edge_array[laid_out, 1]
+    tail_ports, head_ports = port_array[laid_out, 0], port_array[laid_out, 1]
+
+    ranks, layers = longest_path_ranks(node_count, tails, heads)
+    reversed_edges = np.zeros(len(laid_out), dtype=bool)
+    if sum(len(layer) for layer in layers) < node_count:
+        # Some nodes weren't reached, so there is a cycle. Turning its back edges around breaks it.
+        reversed_edges = back_edges(node_count, tails, heads)
+        tails, heads = (np.where(reversed_edges, heads, tails),
+                        np.where(reversed_edges, tails, heads))
+        tail_ports, head_ports = (np.where(reversed_edges, head_ports, tail_ports),
+                                  np.where(reversed_edges, tail_ports, head_ports))
+        ranks, layers = longest_path_ranks(node_count, tails, heads)
+    ranks = pull_ranks_forward(ranks, layers, tails, heads)
+
+    graph = LayeredGraph(sizes, ranks, tails, heads, tail_ports, head_ports)
+    graph.order(ORDER_SWEEPS)
+    x, y = graph.coordinates(node_sep, rank_sep, STRAIGHTEN_PASSES)
+
+    # Graphviz coordinates have y pointing up.
+    for index, node_id in enumerate(node_ids):
+        width, height = sizes[index]
+        layout.nodes[node_id] = (float(x[index]), float(-y[index]), float(width), float(height))
+
+    waypoints = graph.edge_waypoints(x, y)
+    routes = {}
+    for edge_index, points in enumerate(waypoints):
+        if reversed_edges[edge_index]:
+            points.reverse()
+        routes[int(laid_out[edge_index])] = [(px, -py) for px, py in points]
+    for edge_index, (from_id, from_socket, to_id, to_socket) in enumerate(edges):
+        layout.edges.append(EdgeRoute(from_id, from_socket, to_id, to_socket,
+                                      routes.get(edge_index, [])))
+    return layout
+
+
+def gather(starts, nodes):
+    """Indices of the edges of the given nodes, in a graph sorted by node with the given offsets."""
+    counts = starts[nodes + 1] - starts[nodes]
+    total = int(counts.sum())
+    firsts = np.repeat(starts[nodes] - (np.cumsum(counts) - counts), counts)
+    return firsts + np.arange(total), counts
+
+
+def longest_path_ranks(node_count, tails, heads):
+    """Ranks every node one past its furthest predecessor, a topological layer at a time.
+
+    Returns the ranks and the layers in topological order. Nodes on a cycle are in no layer.
+    """
+    order = np.argsort(tails, kind="stable")
+    sorted_heads = heads[order]
+    starts = np.searchsorted(tails[order], np.arange(node_count + 1))
+
+    ranks = np.zeros(node_count, dtype=np.int64)
+    in_degrees = np.bincount(heads, minlength=node_count)
+    layers = []
+    frontier = np.flatnonzero(in_degrees == 0)
+    while frontier.size:
+        layers.append(frontier)
+        edge_indices, counts = gather(starts, frontier)
+        targets = sorted_heads[edge_indices]
+        np.maximum.at(ranks, targets, np.repeat(ranks[frontier], counts) + 1)
+        np.subtract.at(in_degrees, targets, 1)
+        frontier = np.unique(targets[in_degrees[targets] == 0])
+    return ranks, layers
+
+
+def pull_ranks_forward(ranks, layers, tails, heads):
+    """Moves every node with successors up to the rank just before its nearest one.
+
+    Longest-path ranking leaves inputs at the far left, however far away they are used. Working
+    back from the last layer, each node is instead placed next to what it feeds, which keeps edges
+    short, as dot's network simplex ranking does.
+    """
+    node_count = len(ranks)
+    order = np.argsort(tails, kind="stable")
+    sorted_heads = heads[order]
+    starts = np.searchsorted(tails[order], np.arange(node_count + 1))
+
+    ranks = ranks.copy()
+    for layer in reversed(layers):
+        edge_indices, counts = gather(starts, layer)
+        if not edge_indices.size:
+            continue
+        nearest = np.full(node_count, np.iinfo(np.int64).max)
+        np.minimum.at(nearest, np.repeat(layer, counts), ranks[sorted_heads[edge_indices]] - 1)
+        has_successors = layer[counts > 0]
+        ranks[has_successors] = nearest[has_successors]
+    return ranks - ranks.min()
+
+
+def back_edges(node_count, tails, heads):
+    """Finds edges that close a cycle in a depth-first search. Reversing them leaves no cycles."""
+    order = np.argsort(tails, kind="stable")
+    sorted_heads = heads[order].tolist()
+    edge_order = order.tolist()
+    starts = np.searchsorted(tails[order], np.arange(node_count + 1)).tolist()
+
+    # 0: not visited yet, 1: on the current path, 2: done.
+    states = [0] * node_count
+    reversed_edges = np.zeros(len(tails), dtype=bool)
+    for root in range(node_count):
+        if states[root]:
+            continue
+        states[root] = 1
+        stack = [[root, starts[root]]]
+        while stack:
+            entry = stack[-1]
+            node, edge = entry
+            if edge == starts[node + 1]:
+                states[node] = 2
+                stack.pop()
+                continue
+            entry[1] += 1
+            target = sorted_heads[edge]
+            if states[target] == 1:
+                reversed_edges[edge_order[edge]] = True
+            elif states[target] == 0:
+                states[target] = 1
+                stack.append([target, starts[target]])
+    return reversed_edges
+
+
+def isotonic_fit(targets, weights):
+    """The non-decreasing sequence closest to targets, by weighted least squares (pool adjacent
+    violators)."""
+    if np.all(targets[1:] >= targets[:-1]):
+        return targets
+
+    values, block_weights, block_sizes = [], [], []
+    for target, weight in zip(targets.tolist(), weights.tolist()):
+        value, total, size = target, weight, 1
+        while values and values[-1] > value:
+            previous_weight = block_weights.pop()
+            value = (values.pop() * previous_weight + value * total) / (previous_weight + total)
+            total += previous_weight
+            size += block_sizes.pop()
+        values.append(value)
+        block_weights.append(total)
+        block_sizes.append(size)
+    return np.repeat(values, block_sizes)
+
+
+class LayeredGraph:
+    """A ranked graph in which every edge joins adjacent ranks, with dummy nodes added to break up
+    longer edges.
+
+    Real nodes come first, followed by the dummy nodes. Each original edge is a chain of segments;
+    segment_edges says which edge each segment belongs to. Port offsets are measured from the
+    center of the node, down.
+    """
+
+    def __init__(self, sizes, ranks, tails, heads, tail_ports, head_ports):
+        self.real_count = len(ranks)
+        self.edge_count = len(tails)
+
+        spans = ranks[heads] - ranks[tails]
+        dummy_counts = spans - 1
+        self.first_dummies = self.real_count + np.cumsum(dummy_counts) - dummy_counts
+        dummy_total = int(dummy_counts.sum())
+
+        self.last_segments = np.cumsum(spans) - 1
+        self.first_segments = self.last_segments - spans + 1
+        self.segment_edges = np.repeat(np.arange(self.edge_count), spans)
+        steps = np.arange(len(self.segment_edges)) - self.first_segments[self.segment_edges]
+        first_step, last_step = steps == 0, steps == spans[self.segment_edges] - 1
+        dummies = self.first_dummies[self.segment_edges] + steps
+        self.segment_tails = np.where(first_step, tails[self.segment_edges], dummies - 1)
+        self.segment_heads = np.where(last_step, heads[self.segment_edges], dummies)
+
+        heights = sizes[:, 1]
+        self.widths = np.concatenate([sizes[:, 0], np.zeros(dummy_total)])
+        self.heights = np.concatenate([heights, np.zeros(dummy_total)])
+        self.tail_ports = np.where(first_step, (tail_ports - heights[tails] * 0.5)[self.segment_edges],
+                                   0.0)
+        self.head_ports = np.where(last_step, (head_ports - heights[heads] * 0.5)[self.segment_edges],
+                                   0.0)
+
+        self.is_dummy = np.arange(self.real_count + dummy_total) >= self.real_count
+        dummy_ranks = ranks[tails][self.segment_edges] + steps + 1
+        self.ranks = np.concatenate([ranks, dummy_ranks[~last_step]])
+
+        tail_dummy = self.is_dummy[self.segment_tails]
+        head_dummy = self.is_dummy[self.segment_heads]
+        self.segment_weights = np.where(tail_dummy & head_dummy, DUMMY_EDGE_WEIGHT,
+                                        np.where(tail_dummy | head_dummy, MIXED_EDGE_WEIGHT,
+                                                 REAL_EDGE_WEIGHT))
+
+        # The nodes of every rank, in their current order from top to bottom.
+        rank_count = int(self.ranks.max()) + 1
+        by_rank = np.argsort(self.ranks, kind="stable")
+        bounds = np.searchsorted(self.ranks[by_rank], np.arange(rank_count + 1))
+        self.layers = [by_rank[bounds[rank]:bounds[rank + 1]] for rank in range(rank_count)]
+        self.positions = np.zeros(len(self.ranks))
+        for layer in self.layers:
+            self.positions[layer] = np.arange(len(layer))
+
+        # Segments grouped by the rank of their head, and of their tail.
+        self.segments_into = self.group_segments(self.ranks[self.segment_heads], rank_count)
+        self.segments_out_of = self.group_segments(self.ranks[self.segment_tails], rank_count)
+
+    @staticmethod
+    def group_segments(segment_ranks, rank_count):
+        order = np.argsort(segment_ranks, kind="stable")
+        bounds = np.searchsorted(segment_ranks[order], np.arange(rank_count + 1))
+        return [order[bounds[rank]:bounds[rank + 1]] for rank in range(rank_count)]
+
+    def neighbor_means(self, rank, values, forward, weighted, other_ports, own_ports):
+        """For each node of a rank, the weighted mean over its segments to the previous (forward)
+        or next rank of values at the other end, shifted by the ports. NaN where there are none."""
+        if forward:
+            segments = self.segments_into[rank]
+            others, owners = self.segment_tails[segments], self.segment_heads[segments]
+        else:
+            segments = self.segments_out_of[rank]
+            others, owners = self.segment_heads[segments], self.segment_tails[segments]
+
+        weights = self.segment_weights[segments] if weighted else np.ones(len(segments))
+        samples = values[others] + other_ports[segments] - own_ports[segments]
+        # Each node's position is its index in the rank, so sums come out in the rank's order.
+        slots = self.positions[owners].astype(np.int64)
+        size = len(self.layers[rank])
+        totals = np.bincount(slots, weights=samples * weights, minlength=size)
+        counts = np.bincount(slots, weights=weights, minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals / counts, counts
+
+    def order(self, sweeps):
+        """Reorders every rank by the barycenters of its neighbors, sweeping back and forth."""
+        # Ports only break ties between edges of the same node; a node's own ports don't matter.
+        tail_ports = self.tail_ports * PORT_ORDER_WEIGHT
+        head_ports = self.head_ports * PORT_ORDER_WEIGHT
+        no_ports = np.zeros(len(self.segment_edges))
+        for _ in range(sweeps):
+            for forward in (True, False):
+                ranks = range(1, len(self.layers)) if forward else \
+                    range(len(self.layers) - 2, -1, -1)
+                for rank in ranks:
+                    barycenters, _ = self.neighbor_means(rank, self.positions, forward, False,
+                                                         tail_ports if forward else head_ports,
+                                                         no_ports)
+                    layer = self.layers[rank]
+                    # Nodes with nothing on that side stay where they are.
+                    keys = np.where(np.isnan(barycenters), self.positions[layer], barycenters)
+                    layer = layer[np.argsort(keys, kind="stable")]
+                    self.layers[rank] = layer
+                    self.positions[layer] = np.arange(len(layer))
+
+    def coordinates(self, node_sep, rank_sep, passes):
+        """Places ranks in columns and stacks each rank's nodes, then shifts nodes up and down to
+        straighten edges without changing the order. Returns the center of every node, y down."""
+        rank_count = len(self.layers)
+        rank_widths = np.zeros(rank_count)
+        np.maximum.at(rank_widths, self.ranks, self.widths)
+        rank_lefts = np.concatenate([[0.0], np.cumsum(rank_widths + rank_sep)[:-1]])
+        x = rank_lefts[self.ranks] + rank_widths[self.ranks] * 0.5
+
+        # The least distance between the centers of each node and the one above it.
+        offsets = []
+        for layer in self.layers:
+            heights, dummies = self.heights[layer], self.is_dummy[layer]
+            gaps = (heights[1:] + heights[:-1]) * 0.5 + \
+                np.where(dummies[1:] & dummies[:-1], node_sep * 0.5, node_sep)
+            offsets.append(np.concatenate([[0.0], np.cumsum(gaps)]))
+
+        y = np.zeros(len(self.ranks))
+        for layer, layer_offsets in zip(self.layers, offsets):
+            y[layer] = layer_offsets - layer_offsets[-1] * 0.5
+
+        directions = [True, False] * (passes // 2) + [None]
+        for forward in directions:
+            ranks = range(rank_count) if forward is not False else range(rank_count - 1, -1, -1)
+            for rank in ranks:
+                layer = self.layers[rank]
+                if forward is None:
+                    before, before_weights = self.neighbor_means(rank, y, True, True,
+                                                                 self.tail_ports, self.head_ports)
+                    after, after_weights = self.neighbor_means(rank, y, False, True,
+                                                               self.head_ports, self.tail_ports)
+                    totals = np.nan_to_num(before * before_weights) + \
+                        np.nan_to_num(after * after_weights)
+                    weights = before_weights + after_weights
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        targets = totals / weights
+                elif forward:
+                    targets, weights = self.neighbor_means(rank, y, True, True,
+                                                           self.tail_ports, self.head_ports)
+                else:
+                    targets, weights = self.neighbor_means(rank, y, False, True,
+                                                           self.head_ports, self.tail_ports)
+
+                unconnected = np.isnan(targets)
+                targets = np.where(unconnected, y[layer], targets)
+                weights = np.where(unconnected, 1.0, weights)
+                layer_offsets = offsets[rank]
+                y[layer] = isotonic_fit(targets - layer_offsets, weights) + layer_offsets
+        return x, y
+
+    def edge_waypoints(self, x, y):
+        """The dummy node positions of every edge, leaving out those on a straight line."""
+        waypoints = [[] for _ in range(self.edge_count)]
+        dummy_segments = np.flatnonzero(self.is_dummy[self.segment_tails])
+        for edge, node in zip(self.segment_edges[dummy_segments].tolist(),
+                              self.segment_tails[dummy_segments].tolist()):
+            waypoints[edge].append((float(x[node]), float(y[node])))
+
+        for edge, points in enumerate(waypoints):
+            if not points:
+                continue
+            first, last = self.first_segments[edge], self.last_segments[edge]
+            tail, head = self.segment_tails[first], self.segment_heads[last]
+            start = (float(x[tail] + self.widths[tail] * 0.5), float(y[tail] + self.tail_ports[first]))
+            end = (float(x[head] - self.widths[head] * 0.5), float(y[head] + self.head_ports[last]))
+            waypoints[edge] = simplify([start] + points + [end])[1:-1]
+        return waypoints
+
+
+def simplify(points, tolerance=1e-3):
+    """Drops the points of a polyline that lie on a straight line between their neighbors."""
+    kept = [points[0]]
+    for index in range(1, len(points) - 1):
+        (x0, y0), (x1, y1), (x2, y2) = kept[-1], points[index], points[index + 1]
+        if abs((x1 - x0) * (y2 - y0) - (y1 - y0) * (x2 - x0)) > tolerance:
+            kept.append(points[index])
+    kept.append(points[-1])
+    return kept
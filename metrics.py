@@ -0,0 +1,160 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scores a layout, so that settings can be compared by more than how they look.
+
+Every wire is a polyline from its output socket, through its reroutes, to its input socket. All
+scores are worked out on the segments of those polylines at once with NumPy.
+"""
+
+import numpy as np
+
+from .components import layout_bounds
+
+# Crossings are only looked for between segments that share a cell of a grid with about this many
+# segments per cell, which keeps it close to linear in the number of segments.
+SEGMENTS_PER_CELL = 4.0
+
+# Grids are never finer than this many cells, whatever the segments.
+MAX_CELLS = 1 << 22
+
+
+class LayoutMetrics:
+    """The scores of one layout. Lengths are in the units that measure_layout was given."""
+
+    def __init__(self, crossings, wire_length, max_wire_length, backward_edges, area, reroutes):
+        self.crossings = crossings
+        self.wire_length = wire_length
+        self.max_wire_length = max_wire_length
+        self.backward_edges = backward_edges
+        self.area = area
+        self.reroutes = reroutes
+
+    def as_dict(self):
+        return {
+            "crossings": self.crossings,
+            "wire_length": self.wire_length,
+            "max_wire_length": self.max_wire_length,
+            "backward_edges": self.backward_edges,
+            "area": self.area,
+            "reroutes": self.reroutes,
+        }
+
+    def describe(self):
+        return "%d crossings, wires %.0f long (longest %.0f), %d backward, area %.0f, %d reroutes" % (
+            self.crossings, self.wire_length, self.max_wire_length, self.backward_edges, self.area,
+            self.reroutes)
+
+
+def measure_layout(layout, tail_ports, head_ports, scale=1.0):
+    """Scores a GraphLayout.
+
+    tail_ports and head_ports give, for each edge, where it leaves its first node and enters its
+    second, measured down from the top of the node, as in routing.route_edges. Lengths and the
+    area are multiplied by scale.
+    """
+    left, bottom, right, top = layout_bounds(layout)
+    area = (right - left) * (top - bottom) * scale * scale
+    reroutes = sum(len(edge.waypoints) for edge in layout.edges)
+
+    points, owners = [], []
+    for edge_index, edge in enumerate(layout.edges):
+        # Edges to nodes that aren't in the layout have nowhere to be drawn.
+        if edge.from_node not in layout.nodes or edge.to_node not in layout.nodes:
+            continue
+        x, y, width, height = layout.nodes[edge.from_node]
+        points.append((x + width * 0.5, y + height * 0.5 - tail_ports[edge_index]))
+        points += edge.waypoints
+        x, y, width, height = layout.nodes[edge.to_node]
+        points.append((x - width * 0.5, y + height * 0.5 - head_ports[edge_index]))
+        owners += [edge_index] * (len(edge.waypoints) + 2)
+    if not points:
+        return LayoutMetrics(0, 0.0, 0.0, 0, area, reroutes)
+    points = np.asarray(points, dtype=np.float64) * scale
+    owners = np.asarray(owners, dtype=np.int64)
+
+    # A segment joins each point to the next one of the same wire.
+    same_wire = owners[1:] == owners[:-1]
+    starts, ends = points[:-1][same_wire], points[1:][same_wire]
+    segment_owners = owners[:-1][same_wire]
+    lengths = np.hypot(ends[:, 0] - starts[:, 0], ends[:, 1] - starts[:, 1])
+    wire_lengths = np.bincount(segment_owners, weights=lengths)
+
+    first = np.concatenate([[True], ~same_wire])
+    last = np.concatenate([~same_wire, [True]])
+    backward_edges = int(np.count_nonzero(points[last, 0] < points[first, 0]))
+
+    return LayoutMetrics(count_crossings(starts, ends), float(wire_lengths.sum()),
+                         float(wire_lengths.max()), backward_edges, area, reroutes)
+
+
+def count_crossings(starts, ends):
+    """How many pairs of segments cross, given their start and end points as (n, 2) arrays.
+
+    Segments that only touch, such as two wires from the same socket, don't count. Each segment is
+    put in every cell of a grid that its bounding box covers, and only segments that share a cell
+    are tested against each other.
+    """
+    count = len(starts)
+    if count < 2:
+        return 0
+    lows, highs = np.minimum(starts, ends), np.maximum(starts, ends)
+    origin = lows.min(axis=0)
+    extent = np.maximum(highs.max(axis=0) - origin, 1e-9)
+    # Cells about as big as a typical segment, but no smaller than an even share of the area.
+    sizes = np.maximum(highs - lows, 0.0)
+    cell = max(float(np.median(sizes.max(axis=1))),
+               float(np.sqrt(extent[0] * extent[1] * SEGMENTS_PER_CELL / count)),
+               float(np.sqrt(extent[0] * extent[1] / MAX_CELLS)), 1e-9)
+    columns = int(extent[0] / cell) + 1
+
+    first_cells = ((lows - origin) / cell).astype(np.int64)
+    last_cells = ((highs - origin) / cell).astype(np.int64)
+    spans = last_cells - first_cells + 1
+    cell_counts = spans[:, 0] * spans[:, 1]
+
+    # One entry per segment and cell that it covers.
+    entries = np.repeat(np.arange(count), cell_counts)
+    offsets = np.arange(len(entries)) - np.repeat(np.cumsum(cell_counts) - cell_counts, cell_counts)
+    cell_x = first_cells[entries, 0] + offsets % spans[entries, 0]
+    cell_y = first_cells[entries, 1] + offsets // spans[entries, 0]
+    cells = cell_x + cell_y * columns
+    order = np.argsort(cells, kind="stable")
+    entries, cells = entries[order], cells[order]
+
+    # Every pair of entries in the same cell: each entry with those after it in its cell.
+    cell_ends = np.searchsorted(cells, cells, side="right")
+    partners = cell_ends - np.arange(len(cells)) - 1
+    firsts = np.repeat(np.arange(len(cells)), partners)
+    seconds = firsts + 1 + np.arange(len(firsts)) - \
+        np.repeat(np.cumsum(partners) - partners, partners)
+    a, b = entries[firsts], entries[seconds]
+    # Segments that share several cells are only tested in the first cell of their overlap.
+    overlap_cells = np.maximum(first_cells[a], first_cells[b])
+    first_shared = overlap_cells[:, 0] + overlap_cells[:, 1] * columns == cells[firsts]
+    a, b = a[first_shared], b[first_shared]
+
+    # Segments cross if the ends of each are on opposite sides of the other.
+    directions = ends - starts
+    a_start, a_direction, b_start, b_direction = starts[a], directions[a], starts[b], directions[b]
+    between = b_start - a_start
+    b_side = a_direction[:, 0] * between[:, 1] - a_direction[:, 1] * between[:, 0]
+    b_end_side = b_side + a_direction[:, 0] * b_direction[:, 1] - a_direction[:, 1] * b_direction[:, 0]
+    a_side = b_direction[:, 0] * between[:, 1] - b_direction[:, 1] * between[:, 0]
+    a_end_side = a_side - (b_direction[:, 0] * a_direction[:, 1] -
+                           b_direction[:, 1] * a_direction[:, 0])
+    crossing = (b_side * b_end_side < 0.0) & (a_side * a_end_side < 0.0)
+    return int(np.count_nonzero(crossing))
@@ -0,0 +1,186 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+# Graphviz's own unit conversion, used by the json formats. Not to be confused with arrange.DPI.
+POINTS_PER_INCH = 72.0
+
+# A token in plain output is either a double-quoted string (with backslash escapes) or a run of
+# non-space characters.
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\S+')
+NODE_ID = re.compile(r'"?node_(\d+)"?')
+PORT = re.compile(r'"?node_(\d+)"?:"?[io](\d+)"?')
+# A port on its own, as json output gives it.
+PORT_NAME = re.compile(r'[io](\d+)')
+
+
+class EdgeRoute:
+    """One edge of a laid-out graph: the socket it connects and where its reroute nodes go."""
+    __slots__ = ("from_node", "from_socket", "to_node", "to_socket", "waypoints")
+
+    def __init__(self, from_node, from_socket, to_node, to_socket, waypoints):
+        self.from_node = from_node
+        self.from_socket = from_socket
+        self.to_node = to_node
+        self.to_socket = to_socket
+        self.waypoints = waypoints
+
+
+class GraphLayout:
+    """Node boxes and edge routes read back from Graphviz, in inches.
+
+    nodes maps the index of each node in the DOT file to its (center x, center y, width, height).
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.edges = []
+
+
+def reroute_waypoints(control_points):
+    """Picks the reroute node positions out of an edge's spline control points, given as an
+    (n, 2) array, and returns them as a list of (x, y) tuples.
+
+    Polyline splines repeat each bend three times, so every third point is a corner. A single
+    cubic segment (four points) is a straight wire and needs no reroutes.
+    """
+    count = len(control_points)
+    if count == 4:
+        return []
+    return [tuple(point) for point in control_points[2:count - 2:3].tolist()]
+
+
+def tokenize(line, count):
+    """Splits off the first count tokens of a plain output line, honoring quoted strings."""
+    if '"' not in line:
+        return line.split(None, count)[:count]
+    return TOKEN.findall(line)[:count]
+
+
+def parse_plain(lines):
+    """Parses plain or plain-ext output, given as an iterable of lines.
+
+    Numbers are gathered up as text, and the node boxes and the edge control points are each
+    converted by NumPy in one go at the end.
+    """
+    import numpy as np
+
+    layout = GraphLayout()
+    node_ids, node_numbers = [], []
+    edge_ids, edge_numbers, edge_counts = [], [], []
+
+    for line in lines:
+        if line.startswith("node "):
+            fields = tokenize(line, 6)
+            if len(fields) < 6:
+                continue
+            match = NODE_ID.fullmatch(fields[1])
+            if match is None:
+                continue
+            node_ids.append(int(match.group(1)))
+            node_numbers += fields[2:6]
+
+        elif line.startswith("edge "):
+            fields = tokenize(line, 4)
+            if len(fields) < 4:
+                continue
+            from_match, to_match = PORT.fullmatch(fields[1]), PORT.fullmatch(fields[2])
+            if from_match is None or to_match is None:
+                continue
+            count = int(fields[3])
+            fields = tokenize(line, 4 + count * 2)
+            if len(fields) < 4 + count * 2:
+                continue
+            edge_ids.append((int(from_match.group(1)), int(from_match.group(2)),
+                             int(to_match.group(1)), int(to_match.group(2))))
+            edge_counts.append(count)
+            edge_numbers += fields[4:]
+
+        elif line.startswith("stop"):
+            break
+
+    node_boxes = np.array(node_numbers, dtype=np.float64).reshape(-1, 4).tolist()
+    layout.nodes = dict(zip(node_ids, map(tuple, node_boxes)))
+    add_edges(layout, edge_ids, edge_counts, np.array(edge_numbers, dtype=np.float64))
+    return layout
+
+
+def add_edges(layout, edge_ids, edge_counts, coordinates):
+    """Adds an EdgeRoute to layout for each (from node, from socket, to node, to socket) of
+    edge_ids, with edge_counts control points each, taken in turn from the flat coordinates
+    array."""
+    points = coordinates.reshape(-1, 2)
+    offset = 0
+    for (from_node, from_socket, to_node, to_socket), count in zip(edge_ids, edge_counts):
+        layout.edges.append(EdgeRoute(from_node, from_socket, to_node, to_socket,
+                                      reroute_waypoints(points[offset:offset + count])))
+        offset += count
+
+
+def parse_json(text):
+    """Parses json or json0 output. As in parse_plain, numbers are converted in one go at the
+    end."""
+    import json
+
+    import numpy as np
+
+    graph = json.loads(text)
+    layout = GraphLayout()
+
+    gvid_to_node = {}
+    node_ids, node_numbers = [], []
+    for node in graph.get("objects", []):
+        match = NODE_ID.fullmatch(node.get("name", ""))
+        if match is None or "pos" not in node:
+            continue
+        node_id = int(match.group(1))
+        gvid_to_node[node["_gvid"]] = node_id
+        node_ids.append(node_id)
+        node_numbers += node["pos"].split(",")
+        node_numbers += (node["width"], node["height"])
+    node_boxes = np.array(node_numbers, dtype=np.float64).reshape(-1, 4)
+    # Positions are in points, sizes in inches.
+    node_boxes[:, :2] /= POINTS_PER_INCH
+    layout.nodes = dict(zip(node_ids, map(tuple, node_boxes.tolist())))
+
+    edge_ids, edge_numbers, edge_counts = [], [], []
+    for edge in graph.get("edges", []):
+        if edge.get("tail") not in gvid_to_node or edge.get("head") not in gvid_to_node:
+            continue
+        # As in parse_plain, edges without sockets at both ends, such as those between frames,
+        # aren't links of the tree.
+        tail_port = PORT_NAME.fullmatch(edge.get("tailport", ""))
+        head_port = PORT_NAME.fullmatch(edge.get("headport", ""))
+        if tail_port is None or head_port is None:
+            continue
+        # Arrowhead endpoints ("s,x,y" and "e,x,y") aren't part of the spline.
+        points = [point for point in edge.get("pos", "").split()
+                  if not point.startswith(("s,", "e,"))]
+        edge_ids.append((gvid_to_node[edge["tail"]], int(tail_port.group(1)),
+                         gvid_to_node[edge["head"]], int(head_port.group(1))))
+        edge_counts.append(len(points))
+        for point in points:
+            edge_numbers += point.split(",")
+    add_edges(layout, edge_ids, edge_counts,
+              np.array(edge_numbers, dtype=np.float64) / POINTS_PER_INCH)
+    return layout
+
+
+def parse_layout(output, output_format):
+    if output_format in ("json", "json0"):
+        return parse_json(output)
+    return parse_plain(output.splitlines())
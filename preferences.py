@@ -19,25 +19,225 @@ import bpy
 from .autodetect import GraphvizAutodetect
 
 
+LAYOUT_ENGINES = [
+    ('AUTO', "Automatic", "Pick Graphviz or the built-in engine, and how to run them, from the size of "
+     "the tree, the quality preset and the time budget"),
+    ('GRAPHVIZ', "Graphviz", "Lay out with Graphviz, or the built-in engine if it isn't installed"),
+    ('BUILTIN', "Built-in", "Lay out inside Blender without Graphviz, which is quicker for small and "
+     "medium trees"),
+]
+
+
+class ArrangeOptions:
+    """The settings of one arrange.
+
+    Operators take them from the add-on preferences. Scripts can override any of them, and still
+    get the preference defaults when the add-on isn't enabled, e.g. in `blender -b`.
+    """
+
+    DEFAULTS = {
+        "dot_path": "",
+        "layout_engine": 'AUTO',
+        "quality_preset": 'BALANCED',
+        "time_budget": 10.0,
+        "node_sep": 28.0,
+        "rank_sep": 28.0,
+        "incremental": False,
+        "split_components": True,
+        "arrange_frames": False,
+        "include_node_groups": False,
+        "collapse_fanout_reroutes": False,
+        "reuse_reroutes": False,
+        "native_routing": False,
+        "layout_backend": 'AUTO',
+        "layout_format": 'plain-ext',
+        "timeout": 60.0,
+        "use_layout_cache": True,
+        "persist_layout_cache": False,
+        "copy_to_clipboard": False,
+        "preview_mode": 'VIEWER',
+        "collect_stats": False,
+        "measure_layout": False,
+        "profile_path": "",
+    }
+
+    def __init__(self, **options):
+        unknown = set(options) - set(self.DEFAULTS)
+        if unknown:
+            raise TypeError("Unknown arrange options: " + ", ".join(sorted(unknown)))
+        for name, default in self.DEFAULTS.items():
+            setattr(self, name, options.get(name, default))
+
+    @classmethod
+    def from_context(cls, context, **overrides):
+        options = {}
+        addon = context.preferences.addons.get(__package__)
+        if addon is not None:
+            for name in cls.DEFAULTS:
+                options[name] = getattr(addon.preferences, name)
+        options.update(overrides)
+        return cls(**options)
+
+
 class GraphvizAddonPreferences(bpy.types.AddonPreferences):
     bl_idname = __package__
 
     dot_path: bpy.props.StringProperty(
         name="dot.exe",
         subtype='FILE_PATH',
-        default=GraphvizAutodetect.find_graphviz_or_empty_string(),
-        description="Filepath of \"dot.exe\". Graphviz must be installed on the system to use this addon"
+        default=ArrangeOptions.DEFAULTS["dot_path"],
+        description="Filepath of \"dot.exe\". If empty, Graphviz is looked for on the first arrange"
+    )
+    # What the dot above was found to be, so that it isn't run again to check until it changes.
+    dot_probe_key: bpy.props.StringProperty(options={'HIDDEN'})
+    dot_version: bpy.props.StringProperty(options={'HIDDEN'})
+    dot_formats: bpy.props.StringProperty(options={'HIDDEN'})
+    dot_layouts: bpy.props.StringProperty(options={'HIDDEN'})
+    layout_engine: bpy.props.EnumProperty(
+        name="Layout Engine",
+        items=LAYOUT_ENGINES,
+        default=ArrangeOptions.DEFAULTS["layout_engine"],
+        description="What lays out the nodes"
+    )
+    quality_preset: bpy.props.EnumProperty(
+        name="Preset",
+        items=[
+            ('QUALITY', "Quality", "Spend longer on fewer wire crossings"),
+            ('BALANCED', "Balanced", "Graphviz's usual layout, simplified for large trees"),
+            ('SPEED', "Speed", "Prefer the quickest layouts"),
+        ],
+        default=ArrangeOptions.DEFAULTS["quality_preset"],
+        description="Trade layout quality for speed"
+    )
+    time_budget: bpy.props.FloatProperty(
+        name="Time Budget",
+        default=ArrangeOptions.DEFAULTS["time_budget"],
+        min=0.0,
+        subtype='TIME_ABSOLUTE',
+        unit='TIME_ABSOLUTE',
+        description="Use simpler layouts for trees that would take longer than this to lay out. 0 means no limit"
     )
     node_sep: bpy.props.FloatProperty(
         name="Node Spacing",
-        default=28.0,
+        default=ArrangeOptions.DEFAULTS["node_sep"],
         description="Separation between nodes at the same level"
     )
     rank_sep: bpy.props.FloatProperty(
         name="Rank Spacing",
-        default=28.0,
+        default=ArrangeOptions.DEFAULTS["rank_sep"],
         description="Separation between levels"
     )
+    incremental: bpy.props.BoolProperty(
+        name="Incremental",
+        default=ArrangeOptions.DEFAULTS["incremental"],
+        description="Only lay out nodes that changed since the last arrange, leaving the rest where they are. "
+        "Everything is laid out again if the changed nodes would overlap the others"
+    )
+    split_components: bpy.props.BoolProperty(
+        name="Split Disconnected Parts",
+        default=ArrangeOptions.DEFAULTS["split_components"],
+        description="Lay out each group of connected nodes separately and in parallel, then pack them together"
+    )
+    arrange_frames: bpy.props.BoolProperty(
+        name="Lay Out Frames Separately",
+        default=ArrangeOptions.DEFAULTS["arrange_frames"],
+        description="Lay out the nodes in each frame on their own, then the frames as single nodes. Keeps "
+        "framed nodes together, and only lays out again the frames that changed"
+    )
+    include_node_groups: bpy.props.BoolProperty(
+        name="Include Node Groups",
+        default=ArrangeOptions.DEFAULTS["include_node_groups"],
+        description="Also arrange every node group used by the tree, innermost first. Shared groups are arranged once"
+    )
+    collapse_fanout_reroutes: bpy.props.BoolProperty(
+        name="Remove Branching Reroutes",
+        default=ArrangeOptions.DEFAULTS["collapse_fanout_reroutes"],
+        description="Also replace reroutes that split one link into several with direct links, instead of keeping them"
+    )
+    reuse_reroutes: bpy.props.BoolProperty(
+        name="Reuse Reroutes",
+        default=ArrangeOptions.DEFAULTS["reuse_reroutes"],
+        description="Keep the reroutes of the last arrange and only move or rewire what changed, instead of "
+        "replacing them all. Makes re-arranging quicker and its undo steps smaller"
+    )
+    native_routing: bpy.props.BoolProperty(
+        name="Fast Wire Routing",
+        default=ArrangeOptions.DEFAULTS["native_routing"],
+        description="Have Graphviz only place the nodes, and place the reroutes of long links with a "
+        "quicker built-in router. Wire routing takes most of Graphviz's time on dense trees"
+    )
+    layout_backend: bpy.props.EnumProperty(
+        name="Backend",
+        items=[
+            ('AUTO', "Automatic", "Use the Graphviz library if it can be found, otherwise a persistent dot process. "
+             "Several graphs are laid out at once by dot processes, as the library does one at a time"),
+            ('LIBRARY', "Library", "Call the Graphviz library in-process, one graph at a time"),
+            ('WORKER', "Worker Process", "Keep one dot process running and send it every graph"),
+            ('SUBPROCESS', "Subprocess", "Start a new dot process for every arrange"),
+        ],
+        default=ArrangeOptions.DEFAULTS["layout_backend"],
+        description="How Graphviz is run"
+    )
+    layout_format: bpy.props.EnumProperty(
+        name="Output Format",
+        items=[
+            ('plain-ext', "Plain", "Read layouts back as Graphviz's plain-ext text, the quickest to parse"),
+            ('json0', "JSON", "Read layouts back as Graphviz's json0 output"),
+        ],
+        default=ArrangeOptions.DEFAULTS["layout_format"],
+        description="The format that Graphviz writes layouts in"
+    )
+    timeout: bpy.props.FloatProperty(
+        name="Timeout",
+        default=ArrangeOptions.DEFAULTS["timeout"],
+        min=0.0,
+        subtype='TIME_ABSOLUTE',
+        unit='TIME_ABSOLUTE',
+        description="Give up on Graphviz runs that take longer than this. 0 means no limit. "
+        "The Library backend can't be stopped, so it ignores this"
+    )
+    use_layout_cache: bpy.props.BoolProperty(
+        name="Cache Layouts",
+        default=ArrangeOptions.DEFAULTS["use_layout_cache"],
+        description="Reuse the previous layout when arranging a graph identical to one already arranged"
+    )
+    persist_layout_cache: bpy.props.BoolProperty(
+        name="Save Layout Cache",
+        default=ArrangeOptions.DEFAULTS["persist_layout_cache"],
+        description="Keep cached layouts on disk so that they are reused after restarting Blender"
+    )
+    copy_to_clipboard: bpy.props.BoolProperty(
+        name="Copy DOT to Clipboard",
+        default=ArrangeOptions.DEFAULTS["copy_to_clipboard"],
+        description="Copy the generated Graphviz input to the clipboard on every arrange, for debugging"
+    )
+    preview_mode: bpy.props.EnumProperty(
+        name="Preview",
+        items=[
+            ('VIEWER', "System Viewer", "Open an SVG of the graph in the system's default viewer"),
+            ('IMAGE', "Blender Image", "Load a PNG of the graph as an image, to look at in an Image Editor"),
+        ],
+        default=ArrangeOptions.DEFAULTS["preview_mode"],
+        description="How the graph rendered by Graphviz is shown when arranging with Shift held"
+    )
+    collect_stats: bpy.props.BoolProperty(
+        name="Report Timings",
+        default=ArrangeOptions.DEFAULTS["collect_stats"],
+        description="Time each step of every arrange and count the nodes, links and reroutes handled, "
+        "then report and log them"
+    )
+    measure_layout: bpy.props.BoolProperty(
+        name="Report Layout Quality",
+        default=ArrangeOptions.DEFAULTS["measure_layout"],
+        description="Score every arrange by its crossings, wire length and area, then report and log the scores. "
+        "This reads the whole tree back, which takes a moment on large trees"
+    )
+    profile_path: bpy.props.StringProperty(
+        name="Profile Output",
+        subtype='FILE_PATH',
+        default=ArrangeOptions.DEFAULTS["profile_path"],
+        description="Profile every arrange with cProfile and save the result to this file. Leave empty to not profile"
+    )
 
     def draw(self, context):
         layout = self.layout
@@ -46,11 +246,41 @@ class GraphvizAddonPreferences(bpy.types.AddonPreferences):
         layout.use_property_decorate = False
 
         layout.prop(self, "dot_path")
+        if self.dot_path and self.dot_probe_key.startswith(self.dot_path + "|"):
+            layout.label(text=self.dot_version)
         row = layout.row()
         row.operator('wm.url_open', text='Visit graphviz.org', icon='INTERNET').url = "https://graphviz.org/"
         row.operator(GraphvizAutodetect.bl_idname, icon='VIEWZOOM')
 
         layout.separator()
+        layout.prop(self, "layout_engine")
+        layout.prop(self, "quality_preset")
+        layout.prop(self, "time_budget")
         separator_layout = layout.column()
         separator_layout.prop(self, "node_sep", text='Spacing Node')
-        separator_layout.prop(self, "rank_sep", text='Rank')
\ No newline at end of file
+        separator_layout.prop(self, "rank_sep", text='Rank')
+        layout.prop(self, "incremental")
+        layout.prop(self, "split_components")
+        layout.prop(self, "arrange_frames")
+        layout.prop(self, "include_node_groups")
+        layout.prop(self, "collapse_fanout_reroutes")
+        layout.prop(self, "reuse_reroutes")
+        layout.prop(self, "native_routing")
+
+        layout.separator()
+        layout.prop(self, "layout_backend")
+        layout.prop(self, "layout_format")
+        layout.prop(self, "timeout")
+
+        cache_layout = layout.column(heading="Layout Cache")
+        cache_layout.prop(self, "use_layout_cache", text="Enabled")
+        cache_row = cache_layout.row()
+        cache_row.active = self.use_layout_cache
+        cache_row.prop(self, "persist_layout_cache", text="Save to Disk")
+
+        layout.separator()
+        layout.prop(self, "copy_to_clipboard")
+        layout.prop(self, "preview_mode")
+        layout.prop(self, "collect_stats")
+        layout.prop(self, "measure_layout")
+        layout.prop(self, "profile_path")
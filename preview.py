@@ -0,0 +1,79 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pictures of laid out graphs, for checking what Graphviz made of a tree."""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import bpy
+
+from .util import logger
+
+IMAGE_NAME = "Graphviz Preview"
+
+
+class GraphPreview:
+    """A picture of a graph, rendered by the same dot run that lays it out.
+
+    mode is 'VIEWER', for an SVG opened in the system's viewer, or 'IMAGE', for a PNG loaded as a
+    Blender image. formats are the output formats dot was found to have, if known.
+    """
+
+    def __init__(self, mode, formats=()):
+        if mode == 'IMAGE' and formats and "png" not in formats:
+            logger().info("Graphviz can't render PNG, so the preview is opened as SVG instead")
+            mode = 'VIEWER'
+        self.mode = mode
+        self.format = "png" if mode == 'IMAGE' else "svg"
+        file, self.path = tempfile.mkstemp(prefix="graphviz_preview_", suffix="." + self.format)
+        os.close(file)
+        self.rendered = False
+
+    def outputs(self):
+        """The extra (format, path) outputs to ask dot for."""
+        return [(self.format, self.path)]
+
+    def show(self):
+        if self.mode == 'IMAGE':
+            return self.load_image()
+        open_with_viewer(self.path)
+        return None
+
+    def load_image(self):
+        image = bpy.data.images.get(IMAGE_NAME)
+        if image is None:
+            image = bpy.data.images.load(self.path)
+            image.name = IMAGE_NAME
+        else:
+            image.filepath = self.path
+            image.reload()
+        return image
+
+
+def open_with_viewer(path):
+    """Opens a file in the program the system uses for its type, without waiting for it."""
+    if os.name == "nt":
+        os.startfile(path)
+        return
+    command = ["open", path] if sys.platform == "darwin" else ["xdg-open", path]
+    try:
+        subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError as e:
+        raise RuntimeError("Couldn't open %s with %s: %s" % (path, command[0], e))
@@ -0,0 +1,141 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reuses the reroutes that an earlier arrange left in a tree, instead of deleting them all and
+creating new ones, so that re-arranging changes as little of the tree as possible."""
+
+
+class RerouteChain:
+    """A link that runs from from_socket through a chain of reroutes to to_socket.
+
+    reroutes are the names of the reroutes, from the source on, and links every link along the
+    way, so that the chain can be rewired.
+    """
+
+    __slots__ = ("from_socket", "to_socket", "reroutes", "links")
+
+    def __init__(self, from_socket, to_socket, reroutes, links):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+        self.reroutes = reroutes
+        self.links = links
+
+
+class ReroutePool:
+    """The pass-through reroutes of a tree, kept for the next layout to reuse.
+
+    chains are the unbranched ones that carry a link between two other nodes, which can be kept
+    as they are if the new layout routes that link through as many reroutes. spare are the names
+    of those that carry nothing, such as the rest of a chain whose source was deleted, and
+    spare_links the links between them. They, and whatever the new layout doesn't need, are
+    removed once it is applied.
+    """
+
+    def __init__(self):
+        self.chains = []
+        self.spare = []
+        self.spare_links = []
+        self.names = set()
+
+    @classmethod
+    def collect(cls, removable, in_links, out_links):
+        """Pools the chains of removable reroutes that don't branch. in_links and out_links are
+        the links into and out of every reroute, by name. Reroutes in branching chains, or in
+        chains that run into other removable reroutes, are left out, to be removed as before."""
+        pool = cls()
+
+        def is_link(name):
+            return len(in_links[name]) <= 1 and len(out_links[name]) == 1
+
+        # Walk every chain upstream from its last reroute, the one that feeds a real node.
+        for name in removable:
+            if not is_link(name) or out_links[name][0].to_node.name in removable:
+                continue
+            reroutes, links = [], [out_links[name][0]]
+            while name in removable and is_link(name) and name not in pool.names:
+                reroutes.append(name)
+                pool.names.add(name)
+                if not in_links[name]:
+                    name = None
+                    break
+                links.append(in_links[name][0])
+                name = in_links[name][0].from_node.name
+
+            if name is None:
+                pool.spare += reroutes
+                pool.spare_links += links
+            elif name in removable:
+                # It runs out of a branching reroute, which is going away, so nothing is pooled.
+                pool.names.difference_update(reroutes)
+            else:
+                reroutes.reverse()
+                links.reverse()
+                pool.chains.append(cls.chain(links, reroutes))
+        return pool
+
+    @staticmethod
+    def chain(links, reroutes):
+        return RerouteChain(links[0].from_socket, links[-1].to_socket, reroutes, links)
+
+
+class RemovedReroutes:
+    """What removing pass-through reroutes changed in a tree, so that it can be put back if the
+    arrange doesn't get as far as applying its layout.
+
+    reroutes holds the (name, label, parent name, location) of each removed reroute, links each
+    link that ran into or out of one, with a reroute's name in place of its socket, and new_links
+    the links made to replace them.
+    """
+
+    def __init__(self):
+        self.reroutes = []
+        self.links = []
+        self.new_links = []
+
+    def record(self, reroute_nodes, links):
+        for node in reroute_nodes:
+            self.reroutes.append((node.name, node.label,
+                                  node.parent.name if node.parent is not None else None,
+                                  tuple(node.location)))
+        names = {node.name for node in reroute_nodes}
+        for link in links:
+            self.links.append((
+                link.from_node.name if link.from_node.name in names else link.from_socket,
+                link.to_node.name if link.to_node.name in names else link.to_socket))
+
+    def restore(self, node_tree):
+        """Puts the removed reroutes and their links back, and removes the links that replaced
+        them."""
+        nodes, links = node_tree.nodes, node_tree.links
+        for link in self.new_links:
+            links.remove(link)
+        restored = {}
+        for name, label, parent, location in self.reroutes:
+            node = nodes.new("NodeReroute")
+            node.name = name
+            node.label = label
+            # Locations are relative to the parent, so it is set first.
+            if parent is not None:
+                node.parent = nodes[parent]
+            node.location = location
+            restored[name] = node
+        for from_socket, to_socket in self.links:
+            if isinstance(from_socket, str):
+                from_socket = restored[from_socket].outputs[0]
+            if isinstance(to_socket, str):
+                to_socket = restored[to_socket].inputs[0]
+            links.new(from_socket, to_socket)
+        self.reroutes, self.links, self.new_links = [], [], []
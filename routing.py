@@ -0,0 +1,109 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Places the reroutes of edges that dot laid out without routing them (splines=false).
+
+dot puts the nodes of a rank on one column, with ranks running from left to right as with
+rankdir=LR. An edge that spans several ranks gets a waypoint in the column of every rank that it
+passes, where it would cross the straight line between its ports, moved above or below any node
+box in the way. Waypoints on a straight line with their neighbors are dropped, so unobstructed
+edges are left as plain links, just as dot's 4-point splines are.
+"""
+
+import numpy as np
+
+# Node centers closer than this, in inches, are taken to be on the same rank.
+RANK_DECIMALS = 3
+
+# Waypoints off the line through their neighbors by less than this are dropped; see
+# layered.simplify.
+STRAIGHT_TOLERANCE = 1e-3
+
+
+def route_edges(layout, tail_ports, head_ports, clearance):
+    """Sets the waypoints of every edge of a GraphLayout, in place.
+
+    tail_ports and head_ports give, for each edge, where it leaves its first node and enters its
+    second, measured down from the top of the node. Waypoints keep clearance away from the node
+    boxes that they pass. All lengths are in inches, with y up as in the layout.
+    """
+    for edge in layout.edges:
+        edge.waypoints = []
+    if not layout.edges or not layout.nodes:
+        return
+
+    node_ids = np.fromiter(layout.nodes, dtype=np.int64, count=len(layout.nodes))
+    boxes = np.array(list(layout.nodes.values()), dtype=np.float64).reshape(-1, 4)
+    rows = np.full(int(node_ids.max()) + 1, -1, dtype=np.int64)
+    rows[node_ids] = np.arange(len(node_ids))
+    rank_x, ranks = np.unique(np.round(boxes[:, 0], RANK_DECIMALS), return_inverse=True)
+    ranks = ranks.reshape(-1)
+
+    ends = np.array([(edge.from_node, edge.to_node) for edge in layout.edges],
+                    dtype=np.int64).reshape(-1, 2)
+    tails, heads = rows[ends[:, 0]], rows[ends[:, 1]]
+    # Edges running right to left, or within a rank, are left as plain links.
+    spans = np.where((tails >= 0) & (heads >= 0), ranks[heads] - ranks[tails], 0)
+    routed = np.flatnonzero(spans > 1)
+    if len(routed) == 0:
+        return
+    tails, heads, spans = tails[routed], heads[routed], spans[routed]
+
+    start_x = boxes[tails, 0] + boxes[tails, 2] * 0.5
+    start_y = boxes[tails, 1] + boxes[tails, 3] * 0.5 - np.asarray(tail_ports)[routed]
+    end_x = boxes[heads, 0] - boxes[heads, 2] * 0.5
+    end_y = boxes[heads, 1] + boxes[heads, 3] * 0.5 - np.asarray(head_ports)[routed]
+
+    # One waypoint per rank passed, grouped by edge.
+    counts = spans - 1
+    firsts = np.cumsum(counts) - counts
+    owners = np.repeat(np.arange(len(routed)), counts)
+    steps = np.arange(len(owners)) - firsts[owners] + 1
+    point_ranks = ranks[tails][owners] + steps
+    x = rank_x[point_ranks]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = (x - start_x[owners]) / (end_x[owners] - start_x[owners])
+    y = start_y[owners] + np.nan_to_num(t) * (end_y[owners] - start_y[owners])
+
+    # Every rank gets its own band of y, so one sorted array finds the box around a waypoint in its
+    # own rank. dot keeps boxes apart, so their bottoms and tops sort the same way.
+    bottoms, tops = boxes[:, 1] - boxes[:, 3] * 0.5, boxes[:, 1] + boxes[:, 3] * 0.5
+    low, high = min(bottoms.min(), y.min()), max(tops.max(), y.max())
+    stride = high - low + clearance * 4.0 + 1.0
+    order = np.argsort(bottoms + ranks * stride, kind="stable")
+    band_bottoms = (bottoms + ranks * stride)[order] - clearance
+    band_tops = (tops + ranks * stride)[order] + clearance
+    banded = y + point_ranks * stride
+    boxes_below = np.searchsorted(band_bottoms, banded, side="right") - 1
+    candidates = np.maximum(boxes_below, 0)
+    blocked = (boxes_below >= 0) & (banded < band_tops[candidates])
+    # Out the nearer side of the box.
+    above, below = band_tops[candidates], band_bottoms[candidates]
+    moved = np.where(above - banded < banded - below, above, below) - point_ranks * stride
+    y = np.where(blocked, moved, y)
+
+    first, last = steps == 1, steps == counts[owners]
+    previous_x = np.where(first, start_x[owners], np.roll(x, 1))
+    previous_y = np.where(first, start_y[owners], np.roll(y, 1))
+    next_x = np.where(last, end_x[owners], np.roll(x, -1))
+    next_y = np.where(last, end_y[owners], np.roll(y, -1))
+    bends = np.abs((x - previous_x) * (next_y - previous_y) -
+                   (y - previous_y) * (next_x - previous_x)) > STRAIGHT_TOLERANCE
+
+    edges = layout.edges
+    for owner, point_x, point_y in zip(routed[owners[bends]].tolist(), x[bends].tolist(),
+                                       y[bends].tolist()):
+        edges[owner].waypoints.append((point_x, point_y))
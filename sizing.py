@@ -0,0 +1,121 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Node sizes and socket positions, worked out the way Blender lays out a node.
+
+Blender only fills in node.dimensions when it draws a node, so they are zero for trees that
+haven't been shown since they were created or loaded, as in background mode. estimate_node_size
+stands in for them there.
+"""
+
+import bpy
+
+from .util import LRUCache
+
+# Units copied from node_update_bases() in node_draw.cc.
+WIDGET_UNIT = 20.0
+NODE_DY = WIDGET_UNIT
+NODE_SOCKDY = 0.1 * WIDGET_UNIT
+NODE_DYS = 0.5 * WIDGET_UNIT
+
+# Reroutes are drawn as a dot of this size, whatever their width.
+REROUTE_SIZE = 0.8 * WIDGET_UNIT
+
+# Space that a frame leaves around the nodes in it, as in node_update_frame().
+FRAME_MARGIN = 1.5 * WIDGET_UNIT
+
+# Estimated heights, keyed by node type and visible sockets. Cleared when a file is loaded.
+HEIGHT_CACHE = LRUCache(max_size=1024)
+# How many rows of buttons each node type draws, keyed by bl_idname.
+BUTTON_ROWS = {}
+
+
+def socket_offsets(visible_outputs, visible_inputs, height):
+    """Where write_dot_rows puts each visible socket of a node of the given height, measured down
+    from its top. Returns dicts of output and input offsets, keyed by socket index."""
+    outputs = {}
+    y = NODE_DY + NODE_DYS / 2.0
+    for output_index, _ in visible_outputs:
+        outputs[output_index] = y + NODE_DY * 0.5
+        y += NODE_DY + NODE_SOCKDY
+
+    inputs = {}
+    if visible_inputs:
+        y = height - NODE_DYS / 2.0 - (len(visible_inputs) - 1) * NODE_SOCKDY
+        y -= sum(input_height for _, _, input_height in visible_inputs)
+    for input_index, _, input_height in visible_inputs:
+        inputs[input_index] = y + NODE_DY * 0.5
+        y += input_height + NODE_SOCKDY
+    return outputs, inputs
+
+
+def node_height(visible_outputs, visible_inputs, button_rows):
+    """How tall Blender draws a node with the given sockets: a header, the outputs, the buttons,
+    then the inputs. See write_dot_rows."""
+    height = NODE_DY + NODE_DYS / 2.0
+    height += len(visible_outputs) * NODE_DY + max(len(visible_outputs) - 1, 0) * NODE_SOCKDY
+    height += button_rows * NODE_DY
+    if visible_inputs:
+        height += sum(input_height for _, _, input_height in visible_inputs)
+        height += (len(visible_inputs) - 1) * NODE_SOCKDY + NODE_DYS / 2.0
+    return height
+
+
+def group_node_height(visible_outputs, visible_inputs):
+    """How tall Blender draws a group node, whose only button is the node group selector."""
+    return node_height(visible_outputs, visible_inputs, 1)
+
+
+def button_rows(node):
+    """Roughly how many rows of buttons a node draws: one for each editable property that its type
+    adds to the base Node, such as a Math node's operation and clamp."""
+    rows = BUTTON_ROWS.get(node.bl_idname)
+    if rows is None:
+        base_properties = bpy.types.Node.bl_rna.properties
+        rows = sum(1 for prop in node.bl_rna.properties
+                   if prop.identifier not in base_properties and
+                   not prop.is_readonly and not prop.is_hidden)
+        BUTTON_ROWS[node.bl_idname] = rows
+    return rows
+
+
+def estimate_node_size(node, visible_outputs, visible_inputs):
+    """The (width, height) that Blender would draw a node at, in node units, from its type, width
+    and visible sockets rather than its dimensions."""
+    if node.bl_idname == "NodeReroute":
+        return REROUTE_SIZE, REROUTE_SIZE
+    if node.bl_idname == "NodeFrame":
+        return float(node.width), float(node.height)
+    if node.hide:
+        return float(node.width_hidden), NODE_DY
+
+    key = (node.bl_idname, visible_outputs, visible_inputs)
+    height = HEIGHT_CACHE.get(key)
+    if height is None:
+        height = node_height(visible_outputs, visible_inputs, button_rows(node))
+        HEIGHT_CACHE.put(key, height)
+    return float(node.width), height
+
+
+def frame_margins(frame):
+    """The space that a frame leaves beside and below its nodes, and above them for its label."""
+    top = FRAME_MARGIN + (frame.label_size if frame.label else 0.0)
+    return FRAME_MARGIN, top
+
+
+def clear_caches():
+    HEIGHT_CACHE.clear()
+    BUTTON_ROWS.clear()
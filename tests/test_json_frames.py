@@ -0,0 +1,135 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Arranges a tree with frames laid out separately, with Graphviz's json0 output.
+
+Runs with plain Python on the bpy stand-in in benchmarks/fake_bpy, with a backend that writes json0
+the way dot does, so Graphviz doesn't need to be installed:
+
+    python -m unittest discover tests
+"""
+
+import importlib.util
+import json
+import re
+import sys
+import unittest
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+PACKAGE_NAME = "nodes_graphviz_arrange"
+
+sys.path.insert(0, str(PACKAGE_DIR / "benchmarks" / "fake_bpy"))
+
+import bpy  # noqa: E402
+
+DOT_NODE = re.compile(r'^(node_\d+) \[width="([\d.]+)",height="([\d.]+)"', re.M)
+DOT_EDGE = re.compile(r'^(node_\d+)(?::(o\d+))? -> (node_\d+)(?::(i\d+))?', re.M)
+
+
+def load_package():
+    if PACKAGE_NAME in sys.modules:
+        return sys.modules[PACKAGE_NAME]
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, PACKAGE_DIR / "__init__.py",
+                                                  submodule_search_locations=[str(PACKAGE_DIR)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return package
+
+
+class Json0Backend:
+    """Lays the nodes of a graph out in a row and writes the result as dot's json0 does: positions
+    in points, sizes in inches, and ports only on the edges that have them. Every edge bends
+    once."""
+
+    def render(self, dot_text, output_format, extra_outputs=(), timeout=None):
+        assert output_format == "json0"
+        objects, gvids, x = [], {}, 0.0
+        for name, width, height in DOT_NODE.findall(dot_text):
+            gvids[name] = len(objects)
+            x += float(width) * 36.0
+            objects.append({"_gvid": len(objects), "name": name, "pos": "%g,0" % x,
+                            "width": width, "height": height})
+            x += float(width) * 36.0 + 20.0
+        edges = []
+        for tail, tail_port, head, head_port in DOT_EDGE.findall(dot_text):
+            tail_x, head_x = (float(objects[gvids[name]]["pos"].split(",")[0])
+                              for name in (tail, head))
+            # One bend halfway, so that every edge needs a reroute.
+            middle_x = (tail_x + head_x) * 0.5
+            edge = {"_gvid": len(edges), "tail": gvids[tail], "head": gvids[head],
+                    "pos": "e,%g,0 %g,0 %g,0 %g,-50 %g,-50 %g,-50 %g,0 %g,0" % (
+                        head_x, tail_x, tail_x, middle_x, middle_x, middle_x, head_x, head_x)}
+            if tail_port:
+                edge["tailport"] = tail_port
+            if head_port:
+                edge["headport"] = head_port
+            edges.append(edge)
+        return json.dumps({"name": "%3", "objects": objects, "edges": edges}, indent=2).encode()
+
+
+def make_framed_tree():
+    """Two frames of two nodes each, linked inside each frame and from one frame to the other."""
+    node_tree = bpy.types.NodeTree()
+    nodes = []
+    for frame_index in range(2):
+        frame = node_tree.nodes.new("NodeFrame")
+        for _ in range(2):
+            node = node_tree.nodes.new("ShaderNodeMath")
+            node.inputs.append(bpy.types.NodeSocket(node, "Value", 'VALUE', False))
+            node.outputs.append(bpy.types.NodeSocket(node, "Value", 'VALUE', True))
+            node.parent = frame
+            nodes.append(node)
+    for from_index, to_index in ((0, 1), (2, 3), (1, 2)):
+        node_tree.links.new(nodes[from_index].outputs[0], nodes[to_index].inputs[0])
+    return node_tree
+
+
+class JsonFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.package = load_package()
+
+    def test_edges_without_ports_are_skipped(self):
+        parse = self.package.parse
+        output = Json0Backend().render("node_0 [width=\"1\",height=\"1\"]\n"
+                                       "node_1 [width=\"1\",height=\"1\"]\n"
+                                       "node_0 -> node_1;\n"
+                                       "node_0:o2 -> node_1:i1;\n", "json0")
+        layout = parse.parse_layout(output.decode(), "json0")
+        self.assertEqual([(edge.from_node, edge.from_socket, edge.to_node, edge.to_socket)
+                          for edge in layout.edges], [(0, 2, 1, 1)])
+
+    def test_arrange_frames(self):
+        arrange = self.package.arrange
+        options = self.package.preferences.ArrangeOptions(
+            layout_engine='GRAPHVIZ', layout_format='json0', arrange_frames=True,
+            use_layout_cache=False)
+        node_tree = make_framed_tree()
+        plan = arrange.Arranger(options).arrange(node_tree, Json0Backend())
+
+        self.assertEqual(len(plan.frames.levels), 2)
+        # The links inside each frame run through the reroute of their bend. The one between
+        # frames was only laid out as an edge between the frames, so it stays straight.
+        reroutes = [node for node in node_tree.nodes if node.bl_idname == "NodeReroute"]
+        self.assertEqual(len(reroutes), 2)
+        self.assertEqual(len(node_tree.links), 5)
+        self.assertFalse(any(link.from_node.bl_idname == "NodeFrame" or
+                             link.to_node.bl_idname == "NodeFrame" for link in node_tree.links))
+
+
+if __name__ == "__main__":
+    unittest.main()
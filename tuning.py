@@ -0,0 +1,116 @@
+# Copyright 2024 Tachi
+# THIS FILE HAS BEEN MODIFIED FROM THE ORIGINAL
+# Including refactors and bugfixes to support Blender 4.2+
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Picks how to lay out a graph from its size, the quality preset and the time budget."""
+
+# Graphviz starts a process or a library call for every graph, on top of the layout itself.
+GRAPHVIZ_OVERHEAD = 0.05
+
+
+class LayoutMode:
+    """One way of laying out a graph.
+
+    program is "dot", "sfdp" or "builtin". graph_options are written to the DOT graph attributes.
+    Its running time is estimated as coefficient * (nodes + links) ** exponent seconds. These are
+    rough fits, only meant to tell the modes apart by an order of magnitude.
+    """
+
+    def __init__(self, name, program, graph_options, coefficient, exponent):
+        self.name = name
+        self.program = program
+        self.graph_options = graph_options
+        self.coefficient = coefficient
+        self.exponent = exponent
+
+    def estimate(self, node_count, link_count):
+        seconds = self.coefficient * (node_count + link_count) ** self.exponent
+        if self.program != "builtin":
+            seconds += GRAPHVIZ_OVERHEAD
+        return seconds
+
+
+MODES = {mode.name: mode for mode in [
+    # Spends longer looking for fewer crossings.
+    LayoutMode("thorough", "dot", {"newrank": "true", "mclimit": 2.0}, 6e-6, 1.6),
+    LayoutMode("default", "dot", {}, 3e-6, 1.6),
+    # Caps the network simplex and crossing minimization iterations.
+    LayoutMode("tuned", "dot", {"mclimit": 0.5, "nslimit": 2.0, "nslimit1": 2.0, "searchsize": 30},
+               2e-6, 1.5),
+    # Straight edges skip spline routing, which dominates on large graphs, and so need no reroutes.
+    LayoutMode("straight", "dot", {"splines": "false", "mclimit": 0.2, "nslimit": 1.0,
+                                   "nslimit1": 1.0, "searchsize": 10, "remincross": "false"},
+               4e-6, 1.3),
+    # A force-directed layout, which gives up the left-to-right flow but scales to huge graphs.
+    LayoutMode("sfdp", "sfdp", {"layout": "sfdp", "splines": "false", "overlap": "prism"},
+               2e-5, 1.1),
+    LayoutMode("builtin", "builtin", {}, 3e-5, 1.05),
+]}
+
+# The modes each preset tries, best first.
+PRESET_MODES = {
+    'QUALITY': ["thorough", "default", "tuned", "straight", "builtin", "sfdp"],
+    'BALANCED': ["default", "tuned", "straight", "builtin", "sfdp"],
+    'SPEED': ["builtin", "straight", "sfdp"],
+}
+
+
+class LayoutSettings:
+    """The mode chosen for a graph, and why."""
+
+    def __init__(self, mode, node_count, link_count, estimate, reason):
+        self.mode = mode
+        self.program = mode.program
+        self.graph_options = mode.graph_options
+        self.node_count = node_count
+        self.link_count = link_count
+        self.estimate = estimate
+        self.reason = reason
+
+    def describe(self):
+        options = ", ".join("%s=%s" % item for item in self.graph_options.items())
+        return "%d nodes, %d links: %s%s, about %.1fs (%s)" % (
+            self.node_count, self.link_count, self.program,
+            " (%s)" % options if options else "", self.estimate, self.reason)
+
+
+def choose_layout_settings(node_count, link_count, layout_engine, preset, time_budget,
+                           graphviz_layouts=None):
+    """Picks the best mode of the preset that is expected to finish within time_budget seconds.
+
+    layout_engine limits the choice to Graphviz ('GRAPHVIZ') or to the built-in engine
+    ('BUILTIN'); 'AUTO' allows both. A time_budget of 0 means no limit. If no mode fits, the
+    quickest is used. graphviz_layouts, if known, are the Graphviz layout engines installed;
+    modes needing others are skipped.
+    """
+    names = PRESET_MODES[preset]
+    if layout_engine == 'BUILTIN':
+        names = ["builtin"]
+    elif layout_engine == 'GRAPHVIZ':
+        names = [name for name in names if MODES[name].program != "builtin"]
+    if graphviz_layouts:
+        programs = {"dot", "builtin"}.union(graphviz_layouts)
+        names = [name for name in names if MODES[name].program in programs]
+
+    candidates = [(MODES[name], MODES[name].estimate(node_count, link_count)) for name in names]
+    for mode, estimate in candidates:
+        if not time_budget or estimate <= time_budget:
+            reason = "best of the %s preset" % preset.lower() if mode is candidates[0][0] else \
+                "best of the %s preset within %gs" % (preset.lower(), time_budget)
+            return LayoutSettings(mode, node_count, link_count, estimate, reason)
+
+    mode, estimate = min(candidates, key=lambda candidate: candidate[1])
+    return LayoutSettings(mode, node_count, link_count, estimate,
+                          "quickest, as nothing fits in %gs" % time_budget)
@@ -15,12 +15,36 @@
 # limitations under the License.
 
 import logging
+from collections import OrderedDict
 
 def logger(submodule=None):
     return logging.getLogger("nodes_graphviz_arrange" +
                              ("." + submodule if submodule is not None else ""))
 
 
-def write_line(line, f):
-    logger("gv_input").debug(line)
-    print(line, file=f)
\ No newline at end of file
+def write_line(line, lines):
+    # Runs for every line of DOT, so the whole graph is logged once by its writer instead.
+    lines.append(line)
+
+
+class LRUCache:
+    """A dictionary that holds at most max_size entries, evicting the least recently used."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()